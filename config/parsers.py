@@ -0,0 +1,39 @@
+"""
+Parser JSON de alta performance para o Django REST Framework.
+
+Usa o `orjson` para corpos em UTF-8 e cai de volta para o `JSONParser`
+padrão quando a biblioteca não está instalada ou o charset é outro.
+"""
+from django.utils.http import parse_header_parameters
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+
+from .renderers import ORJSONRenderer
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depende do ambiente
+    orjson = None
+
+
+class ORJSONParser(JSONParser):
+    """
+    Parser que desserializa o corpo da requisição com `orjson`.
+    Assim como no modo estrito do DRF, NaN e Infinity são rejeitados.
+    """
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if orjson is None or not self._is_utf8(media_type, parser_context or {}):
+            return super().parse(stream, media_type, parser_context)
+
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
+
+    def _is_utf8(self, media_type, parser_context):
+        """Só o UTF-8 é aceito pelo orjson; outros charsets seguem o padrão."""
+        _, params = parse_header_parameters(media_type or '')
+        encoding = params.get('charset') or parser_context.get('encoding') or 'utf-8'
+        return encoding.lower().replace('_', '-') in ('utf-8', 'utf8')
@@ -0,0 +1,58 @@
+"""
+Renderers JSON de alta performance para o Django REST Framework.
+
+Usa o `orjson` quando disponível e cai de volta para o `JSONRenderer`
+padrão (baseado no `json` da stdlib) quando a biblioteca não está instalada
+ou quando o cliente pede uma formatação que o `orjson` não suporta.
+"""
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depende do ambiente
+    orjson = None
+
+
+# Válidos em JSON, mas não em JavaScript: o DRF sempre os escapa.
+LINE_SEPARATOR = '\u2028'.encode()
+PARAGRAPH_SEPARATOR = '\u2029'.encode()
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    Renderer que serializa com `orjson`, produzindo os mesmos bytes que o
+    `JSONRenderer` do DRF gera no modo compacto.
+
+    Datas, horários, Decimals e strings preguiçosas (gettext_lazy) são
+    delegados ao `JSONEncoder` do DRF, mantendo o formato de saída.
+    """
+    encoder = JSONEncoder()
+
+    def can_use_orjson(self, accepted_media_type, renderer_context):
+        """Indentação e escape ASCII ficam a cargo do renderer padrão."""
+        if orjson is None or self.ensure_ascii or not self.compact:
+            return False
+        return self.get_indent(accepted_media_type, renderer_context) is None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+
+        renderer_context = renderer_context or {}
+        if not self.can_use_orjson(accepted_media_type, renderer_context):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(
+                data,
+                default=self.encoder.default,
+                option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS,
+            )
+        except orjson.JSONEncodeError:
+            # Ex.: inteiros maiores que 64 bits; o encoder padrão resolve.
+            return super().render(data, accepted_media_type, renderer_context)
+
+        if LINE_SEPARATOR in ret or PARAGRAPH_SEPARATOR in ret:
+            ret = ret.replace(LINE_SEPARATOR, b'\\u2028').replace(PARAGRAPH_SEPARATOR, b'\\u2029')
+        return ret
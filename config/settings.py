@@ -49,6 +49,15 @@ REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
         "rest_framework_simplejwt.authentication.JWTAuthentication",
     ),
+    "DEFAULT_RENDERER_CLASSES": [
+        "config.renderers.ORJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+    "DEFAULT_PARSER_CLASSES": [
+        "config.parsers.ORJSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ],
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
     "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.PageNumberPagination",
     "PAGE_SIZE": 10,
@@ -93,6 +102,28 @@ DATABASES = {
 }
 
 
+# Cache
+# Os contadores de versão de scheduling/cache.py ficam aqui. Com mais de um
+# processo, use um backend compartilhado (ex.: FileBasedCache ou Redis) para
+# que todos enxerguem as mesmas versões; o check scheduling.W001 avisa quando
+# o LocMemCache é usado com DEBUG desligado.
+
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv("CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.getenv("CACHE_LOCATION", ""),
+    }
+}
+
+
+# Aulas vencidas
+# Aulas ainda "Agendada" depois da tolerância recebem este status no comando
+# `encerrar_aulas_vencidas`, pensado para rodar periodicamente.
+
+AULA_VENCIDA_STATUS = os.getenv("AULA_VENCIDA_STATUS", "Cancelada")
+AULA_VENCIDA_TOLERANCIA_HORAS = int(os.getenv("AULA_VENCIDA_TOLERANCIA_HORAS", "48"))
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
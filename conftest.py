@@ -0,0 +1,13 @@
+import pytest
+from django.core.cache import cache
+
+
+@pytest.fixture(autouse=True)
+def limpar_cache():
+    """
+    O rollback do banco entre testes não dispara sinais, então os
+    contadores de versão do cache não percebem a limpeza dos dados.
+    """
+    cache.clear()
+    yield
+    cache.clear()
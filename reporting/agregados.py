@@ -0,0 +1,345 @@
+"""
+Agregações sobre os itens dos relatórios de aula usadas pelos endpoints de
+estatísticas, incluindo as tabelas pré-calculadas.
+"""
+from datetime import date, timedelta
+
+from django.db import transaction
+from django.db.models import CharField, Count, DateField, F, Max, Q, Sum, Value
+from django.db.models.functions import Coalesce, TruncMonth, TruncWeek
+
+from scheduling.filters import inicio_do_dia
+from scheduling.models import Aluno, ItemRitmo, ItemRudimento, ItemVirada, PresencaAluno
+from users.models import CustomUser
+from users.serializers import calcular_kpis_professores
+from .models import RiscoEvasao, UsoExercicioMensal
+
+TIPOS_ITEM = (('rudimentos', ItemRudimento), ('ritmos', ItemRitmo), ('viradas', ItemVirada))
+
+# Caminho, a partir do item, até o dono de cada agrupamento do tempo de prática.
+AGRUPAMENTOS_PRATICA = {
+    'aluno': 'relatorio__aula__alunos',
+    'professor': 'relatorio__professor_que_validou',
+    'modalidade': 'relatorio__aula__modalidade',
+}
+
+
+def atualizar_uso_exercicios(desde=None):
+    """
+    Recalcula `UsoExercicioMensal` a partir do mês da data `desde` (ou de
+    todo o histórico). Cada tipo de item é agrupado por exercício, modalidade e
+    mês em uma query; as linhas do período são trocadas em uma transação.
+    Retorna o número de linhas gravadas.
+    """
+    if desde is not None:
+        desde = desde.replace(day=1)
+
+    totais = {}
+    for _, model in TIPOS_ITEM:
+        itens = model.objects.filter(exercicio__isnull=False)
+        if desde is not None:
+            itens = itens.filter(relatorio__aula__data_hora__gte=inicio_do_dia(desde))
+        linhas = itens.values(
+            'exercicio_id',
+            modalidade_id=F('relatorio__aula__modalidade_id'),
+            mes=TruncMonth('relatorio__aula__data_hora', output_field=DateField()),
+        ).annotate(
+            total_itens=Count('id'),
+            duracao_total_min=Coalesce(Sum('duracao_min'), 0),
+        ).order_by()
+
+        for linha in linhas:
+            chave = (linha['exercicio_id'], linha['modalidade_id'], linha['mes'])
+            total = totais.setdefault(chave, [0, 0])
+            total[0] += linha['total_itens']
+            total[1] += linha['duracao_total_min']
+
+    usos = [
+        UsoExercicioMensal(
+            exercicio_id=exercicio_id, modalidade_id=modalidade_id, mes=mes,
+            total_itens=total_itens, duracao_total_min=duracao_total_min,
+        )
+        for (exercicio_id, modalidade_id, mes), (total_itens, duracao_total_min) in totais.items()
+    ]
+    with transaction.atomic():
+        antigos = UsoExercicioMensal.objects.all()
+        if desde is not None:
+            antigos = antigos.filter(mes__gte=desde)
+        antigos.delete()
+        UsoExercicioMensal.objects.bulk_create(usos, batch_size=1000)
+    return len(usos)
+
+
+def tempo_de_pratica(agrupar, data_inicial=None, data_final=None):
+    """
+    Soma os minutos de prática (`duracao_min`) por aluno, professor (o que
+    validou o relatório) ou modalidade, separados por tipo de item, para as
+    aulas entre `data_inicial` e `data_final`.
+
+    Os três tipos de item são agrupados e unidos com UNION ALL em uma única
+    query; o filtro de datas usa o índice de `Aula.data_hora`. Retorna
+    {id do agrupamento: {'rudimentos': min, 'ritmos': min, 'viradas': min}}.
+    """
+    caminho = AGRUPAMENTOS_PRATICA[agrupar]
+    filtros = {f'{caminho}__isnull': False, 'duracao_min__isnull': False}
+    if data_inicial is not None:
+        filtros['relatorio__aula__data_hora__gte'] = inicio_do_dia(data_inicial)
+    if data_final is not None:
+        filtros['relatorio__aula__data_hora__lt'] = inicio_do_dia(data_final + timedelta(days=1))
+
+    consultas = [
+        model.objects.filter(**filtros).annotate(
+            tipo=Value(tipo, output_field=CharField()), chave=F(caminho)
+        ).values('chave', 'tipo').annotate(minutos=Sum('duracao_min')).order_by()
+        for tipo, model in TIPOS_ITEM
+    ]
+
+    totais = {}
+    for linha in consultas[0].union(*consultas[1:], all=True):
+        minutos = totais.setdefault(linha['chave'], dict.fromkeys([tipo for tipo, _ in TIPOS_ITEM], 0))
+        minutos[linha['tipo']] = linha['minutos']
+    return totais
+
+
+# Códigos de cada célula da matriz de presença, um caractere por semana.
+STATUS_MATRIZ = {
+    'sem_registro': '0',
+    'presente': '1',
+    'ausente': '2',
+    'parcial': '3',
+}
+
+
+def matriz_presenca(data_inicial, data_final, modalidade_id=None):
+    """
+    Monta a grade aluno × semana de presença entre as duas datas com uma
+    única query agrupada por aluno e semana.
+
+    O resultado é colunar: `alunos` e `semanas` (segunda-feira de cada
+    semana) rotulam linhas e colunas, e `status` traz uma string por aluno
+    com um código de `STATUS_MATRIZ` por semana. As linhas são preenchidas
+    sobre um `bytearray` por aluno, sem objetos intermediários por célula.
+    """
+    primeira_semana = data_inicial - timedelta(days=data_inicial.weekday())
+    total_semanas = (data_final - primeira_semana).days // 7 + 1
+    semanas = [primeira_semana + timedelta(weeks=i) for i in range(total_semanas)]
+
+    presencas = PresencaAluno.objects.filter(
+        aula__data_hora__gte=inicio_do_dia(data_inicial),
+        aula__data_hora__lt=inicio_do_dia(data_final + timedelta(days=1)),
+        status__isnull=False,
+    )
+    if modalidade_id is not None:
+        presencas = presencas.filter(aula__modalidade_id=modalidade_id)
+    linhas = presencas.values(
+        'aluno_id', nome=F('aluno__nome_completo'),
+        semana=TruncWeek('aula__data_hora', output_field=DateField()),
+    ).annotate(
+        total=Count('id'), presentes=Count('id', filter=Q(status='presente')),
+    ).order_by('nome', 'aluno_id')
+
+    codigos = {campo: ord(codigo) for campo, codigo in STATUS_MATRIZ.items()}
+    vazia = bytes([codigos['sem_registro']]) * total_semanas
+    alunos, grades = [], {}
+    for linha in linhas:
+        grade = grades.get(linha['aluno_id'])
+        if grade is None:
+            grade = grades[linha['aluno_id']] = bytearray(vazia)
+            alunos.append({'id': linha['aluno_id'], 'nome': linha['nome']})
+        if linha['presentes'] == linha['total']:
+            codigo = codigos['presente']
+        elif linha['presentes'] == 0:
+            codigo = codigos['ausente']
+        else:
+            codigo = codigos['parcial']
+        grade[(linha['semana'] - primeira_semana).days // 7] = codigo
+
+    return {
+        'alunos': alunos,
+        'semanas': semanas,
+        'legenda': STATUS_MATRIZ,
+        'status': [grades[aluno['id']].decode('ascii') for aluno in alunos],
+    }
+
+
+def _indice_mes(data):
+    return data.year * 12 + data.month - 1
+
+
+def _mes_do_indice(indice):
+    return date(indice // 12, indice % 12 + 1, 1)
+
+
+def retencao_por_coorte(hoje, meses=12):
+    """
+    Agrupa os alunos pelo mês de matrícula (`data_criacao`) e calcula,
+    para cada mês seguinte até o atual, quantos ainda tiveram ao menos uma
+    presença. Considera as coortes dos últimos `meses` meses.
+
+    São duas queries: os alunos das coortes e os pares distintos (aluno,
+    mês) com presença. Cada aluno vira um bitmap de meses ativos (um
+    inteiro, bit 0 = mês da matrícula) e as coortes são contadas em uma
+    passada sobre eles.
+    """
+    mes_atual = _indice_mes(hoje)
+    primeira_coorte = mes_atual - meses + 1
+    inicio = _mes_do_indice(primeira_coorte)
+
+    alunos = Aluno.objects.filter(data_criacao__gte=inicio, data_criacao__lte=hoje)
+    coorte_por_aluno = {
+        aluno_id: _indice_mes(data_criacao)
+        for aluno_id, data_criacao in alunos.values_list('id', 'data_criacao')
+    }
+    atividade = PresencaAluno.objects.filter(
+        aluno__in=alunos.values('id'),
+        status='presente',
+        aula__data_hora__gte=inicio_do_dia(inicio),
+    ).values_list(
+        'aluno_id', TruncMonth('aula__data_hora', output_field=DateField())
+    ).distinct()
+
+    bitmaps = dict.fromkeys(coorte_por_aluno, 0)
+    for aluno_id, mes in atividade:
+        coorte = coorte_por_aluno[aluno_id]
+        deslocamento = _indice_mes(mes) - coorte
+        if 0 <= deslocamento <= mes_atual - coorte:
+            bitmaps[aluno_id] |= 1 << deslocamento
+
+    tamanhos = dict.fromkeys(range(primeira_coorte, mes_atual + 1), 0)
+    ativos = {coorte: [0] * (mes_atual - coorte + 1) for coorte in tamanhos}
+    for aluno_id, bitmap in bitmaps.items():
+        coorte = coorte_por_aluno[aluno_id]
+        tamanhos[coorte] += 1
+        contagens = ativos[coorte]
+        while bitmap:
+            menor_bit = bitmap & -bitmap
+            contagens[menor_bit.bit_length() - 1] += 1
+            bitmap ^= menor_bit
+
+    return [
+        {
+            'coorte': _mes_do_indice(coorte),
+            'alunos': tamanhos[coorte],
+            'ativos': ativos[coorte],
+            'retencao_percentual': [
+                round(total / tamanhos[coorte] * 100, 2) if tamanhos[coorte] else 0.0
+                for total in ativos[coorte]
+            ],
+        }
+        for coorte in tamanhos
+    ]
+
+
+# Janela dos indicadores de risco de evasão e o peso de cada um no score.
+JANELA_RISCO_DIAS = 180
+PESOS_RISCO = {
+    'ausencia': 0.4,
+    'sequencia_ausencias': 0.25,
+    'aulas_canceladas': 0.15,
+    'dias_sem_aula': 0.2,
+}
+# Valores a partir dos quais cada indicador conta como risco máximo.
+LIMITES_RISCO = {'sequencia_ausencias': 3, 'aulas_canceladas': 4, 'dias_sem_aula': 60}
+
+
+def pontuar_risco(taxa_presenca, sequencia_ausencias, aulas_canceladas, dias_desde_ultima_realizada):
+    """Combina os indicadores de um aluno em um score de 0 a 100."""
+    componentes = {
+        'ausencia': 0.5 if taxa_presenca is None else 1 - taxa_presenca / 100,
+        'sequencia_ausencias': sequencia_ausencias / LIMITES_RISCO['sequencia_ausencias'],
+        'aulas_canceladas': aulas_canceladas / LIMITES_RISCO['aulas_canceladas'],
+        'dias_sem_aula': (
+            1 if dias_desde_ultima_realizada is None
+            else dias_desde_ultima_realizada / LIMITES_RISCO['dias_sem_aula']
+        ),
+    }
+    score = sum(PESOS_RISCO[nome] * min(valor, 1) for nome, valor in componentes.items())
+    return round(score * 100, 1)
+
+
+def calcular_risco_evasao(agora):
+    """
+    Recalcula `RiscoEvasao` para os alunos com aulas nos últimos
+    `JANELA_RISCO_DIAS` dias e retorna quantos foram pontuados.
+
+    Os indicadores vêm de duas queries: uma agregação sobre as matrículas
+    (`PresencaAluno`) com presença, ausências, cancelamentos e a última aula
+    realizada com o aluno presente, e as presenças da janela em ordem
+    decrescente, de onde sai a sequência atual de ausências.
+    """
+    inicio_janela = agora - timedelta(days=JANELA_RISCO_DIAS)
+    na_janela = Q(aula__data_hora__gte=inicio_janela, aula__data_hora__lt=agora)
+    concluidas = na_janela & Q(aula__status__in=['Realizada', 'Aluno Ausente'])
+
+    indicadores = PresencaAluno.objects.values('aluno_id').annotate(
+        aulas_na_janela=Count('id', filter=na_janela),
+        presentes=Count('id', filter=concluidas & Q(status='presente')),
+        ausentes=Count('id', filter=concluidas & Q(status='ausente')),
+        aulas_canceladas=Count('id', filter=na_janela & Q(aula__status='Cancelada')),
+        ultima_realizada=Max('aula__data_hora', filter=Q(
+            aula__status='Realizada', aula__data_hora__lt=agora, status='presente'
+        )),
+    ).filter(aulas_na_janela__gt=0).order_by()
+
+    sequencias = {}
+    encerradas = set()
+    presencas = PresencaAluno.objects.filter(
+        aula__data_hora__gte=inicio_janela, aula__data_hora__lt=agora, status__isnull=False
+    ).order_by('aluno_id', '-aula__data_hora').values_list('aluno_id', 'status')
+    for aluno_id, status in presencas.iterator(chunk_size=5000):
+        if aluno_id in encerradas:
+            continue
+        if status == 'ausente':
+            sequencias[aluno_id] = sequencias.get(aluno_id, 0) + 1
+        else:
+            encerradas.add(aluno_id)
+
+    riscos = []
+    for linha in indicadores:
+        contabilizadas = linha['presentes'] + linha['ausentes']
+        taxa = round(linha['presentes'] / contabilizadas * 100, 2) if contabilizadas else None
+        dias = (agora - linha['ultima_realizada']).days if linha['ultima_realizada'] else None
+        sequencia = sequencias.get(linha['aluno_id'], 0)
+        riscos.append(RiscoEvasao(
+            aluno_id=linha['aluno_id'],
+            score=pontuar_risco(taxa, sequencia, linha['aulas_canceladas'], dias),
+            taxa_presenca=taxa,
+            sequencia_ausencias=sequencia,
+            aulas_canceladas=linha['aulas_canceladas'],
+            dias_desde_ultima_realizada=dias,
+            calculado_em=agora,
+        ))
+
+    with transaction.atomic():
+        RiscoEvasao.objects.all().delete()
+        RiscoEvasao.objects.bulk_create(riscos, batch_size=1000)
+    return len(riscos)
+
+
+def folha_professores(data_inicial, data_final):
+    """
+    Linhas da folha de pagamento dos professores: uma por professor e mês
+    com aulas no período, com as mesmas regras dos KPIs do detalhe do
+    professor (aulas realizadas, substituições feitas e sofridas). Todos os
+    professores são calculados juntos, com um número fixo de queries.
+    """
+    professores = {
+        professor.pk: professor
+        for professor in CustomUser.objects.filter(tipo__in=['professor', 'admin']).only(
+            'id', 'username', 'first_name', 'last_name'
+        )
+    }
+    kpis = calcular_kpis_professores(list(professores), data_inicial, data_final, por_mes=True)
+
+    linhas = []
+    for (professor_id, mes), valores in kpis.items():
+        professor = professores[professor_id]
+        linhas.append({
+            'mes': mes,
+            'professor_id': professor_id,
+            'username': professor.username,
+            'nome': professor.get_full_name(),
+            **valores,
+        })
+    linhas.sort(key=lambda linha: (linha['mes'], linha['username']))
+    return linhas
@@ -0,0 +1,25 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from reporting.agregados import atualizar_uso_exercicios
+
+
+class Command(BaseCommand):
+    help = "Recalcula as estatísticas mensais de uso dos exercícios."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--desde', help="Recalcula apenas a partir deste mês (AAAA-MM). Sem ele, todo o histórico."
+        )
+
+    def handle(self, *args, **options):
+        desde = None
+        if options['desde']:
+            try:
+                desde = date.fromisoformat(f"{options['desde']}-01")
+            except ValueError:
+                raise CommandError("Use o formato AAAA-MM em --desde.")
+
+        total = atualizar_uso_exercicios(desde)
+        self.stdout.write(self.style.SUCCESS(f"{total} linhas de uso de exercícios gravadas."))
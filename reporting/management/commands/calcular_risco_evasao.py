@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from reporting.agregados import calcular_risco_evasao
+
+
+class Command(BaseCommand):
+    help = "Recalcula o risco de evasão dos alunos ativos. Pensado para rodar todas as noites."
+
+    def handle(self, *args, **options):
+        total = calcular_risco_evasao(timezone.now())
+        self.stdout.write(self.style.SUCCESS(f"Risco de evasão calculado para {total} alunos."))
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('scheduling', '0005_exercicio'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UsoExercicioMensal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mes', models.DateField(help_text='Primeiro dia do mês.')),
+                ('total_itens', models.PositiveIntegerField(default=0)),
+                ('duracao_total_min', models.PositiveIntegerField(default=0)),
+                ('exercicio', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='usos_mensais', to='scheduling.exercicio')),
+                ('modalidade', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='scheduling.modalidade')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['mes', 'modalidade'], name='reporting_u_mes_ba33a4_idx')],
+                'constraints': [models.UniqueConstraint(fields=('exercicio', 'modalidade', 'mes'), name='uso_exercicio_mensal_unico')],
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reporting', '0001_initial'),
+        ('scheduling', '0005_exercicio'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RiscoEvasao',
+            fields=[
+                ('aluno', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='risco_evasao', serialize=False, to='scheduling.aluno')),
+                ('score', models.FloatField(help_text='De 0 (sem risco) a 100.')),
+                ('taxa_presenca', models.FloatField(blank=True, help_text='Percentual; vazio sem aulas concluídas.', null=True)),
+                ('sequencia_ausencias', models.PositiveIntegerField(help_text='Ausências seguidas mais recentes.')),
+                ('aulas_canceladas', models.PositiveIntegerField()),
+                ('dias_desde_ultima_realizada', models.PositiveIntegerField(blank=True, null=True)),
+                ('calculado_em', models.DateTimeField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-score'], name='risco_evasao_score_idx')],
+            },
+        ),
+    ]
@@ -1,3 +1,46 @@
 from django.db import models
 
-# Create your models here.
+from scheduling.models import Aluno, Exercicio, Modalidade
+
+
+class UsoExercicioMensal(models.Model):
+    """
+    Uso pré-calculado de cada exercício por modalidade e mês, recalculado
+    por `atualizar_uso_exercicios`. Evita agrupar os itens de relatório a
+    cada consulta de estatísticas.
+    """
+    exercicio = models.ForeignKey(Exercicio, on_delete=models.CASCADE, related_name='usos_mensais')
+    modalidade = models.ForeignKey(Modalidade, on_delete=models.CASCADE, related_name='+')
+    mes = models.DateField(help_text="Primeiro dia do mês.")
+    total_itens = models.PositiveIntegerField(default=0)
+    duracao_total_min = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['exercicio', 'modalidade', 'mes'], name='uso_exercicio_mensal_unico'),
+        ]
+        indexes = [models.Index(fields=['mes', 'modalidade'])]
+
+    def __str__(self):
+        return f"{self.exercicio} - {self.modalidade} em {self.mes:%m/%Y}"
+
+
+class RiscoEvasao(models.Model):
+    """
+    Risco de evasão de cada aluno ativo, recalculado em lote pelo comando
+    `calcular_risco_evasao`. Guarda os indicadores usados no cálculo para
+    que a lista ordenada por risco seja apenas uma leitura.
+    """
+    aluno = models.OneToOneField(Aluno, on_delete=models.CASCADE, primary_key=True, related_name='risco_evasao')
+    score = models.FloatField(help_text="De 0 (sem risco) a 100.")
+    taxa_presenca = models.FloatField(null=True, blank=True, help_text="Percentual; vazio sem aulas concluídas.")
+    sequencia_ausencias = models.PositiveIntegerField(help_text="Ausências seguidas mais recentes.")
+    aulas_canceladas = models.PositiveIntegerField()
+    dias_desde_ultima_realizada = models.PositiveIntegerField(null=True, blank=True)
+    calculado_em = models.DateTimeField()
+
+    class Meta:
+        indexes = [models.Index(fields=['-score'], name='risco_evasao_score_idx')]
+
+    def __str__(self):
+        return f"{self.aluno} - risco {self.score}"
@@ -1,5 +1,7 @@
 from rest_framework import serializers
 
+from .models import RiscoEvasao
+
 
 class DashboardKpiSerializer(serializers.Serializer):
     total_aulas = serializers.IntegerField()
@@ -21,9 +23,42 @@ class ProfessorPerformanceSerializer(serializers.Serializer):
     taxa_realizacao_percentual = serializers.FloatField()
 
 
-class AdminDashboardSerializer(serializers.Serializer):
-    """Define a estrutura completa da resposta do dashboard."""
+class DashboardPeriodoSerializer(serializers.Serializer):
+    """Indicadores do dashboard para um período."""
     kpis = DashboardKpiSerializer()
     aulas_por_categoria_chart = ChartDataSerializer()
     aulas_realizadas_por_mes_chart = ChartDataSerializer()
     professor_performance = ProfessorPerformanceSerializer(many=True)
+
+
+class DashboardVariacaoSerializer(serializers.Serializer):
+    """Diferença de cada KPI entre o período atual e o anterior."""
+    total_aulas = serializers.IntegerField()
+    total_realizadas = serializers.IntegerField()
+    total_canceladas = serializers.IntegerField()
+    total_aluno_ausente = serializers.IntegerField()
+    taxa_sucesso_percentual = serializers.FloatField()
+
+
+class DashboardComparacaoSerializer(DashboardPeriodoSerializer):
+    """Indicadores do período anterior equivalente e a variação dos KPIs."""
+    data_inicial = serializers.DateField()
+    data_final = serializers.DateField()
+    variacao_kpis = DashboardVariacaoSerializer()
+
+
+class AdminDashboardSerializer(DashboardPeriodoSerializer):
+    """Define a estrutura completa da resposta do dashboard."""
+    comparacao = DashboardComparacaoSerializer(required=False)
+
+
+class RiscoEvasaoSerializer(serializers.ModelSerializer):
+    aluno_id = serializers.IntegerField(read_only=True)
+    aluno_nome = serializers.CharField(source='aluno.nome_completo', read_only=True)
+
+    class Meta:
+        model = RiscoEvasao
+        fields = [
+            'aluno_id', 'aluno_nome', 'score', 'taxa_presenca', 'sequencia_ausencias',
+            'aulas_canceladas', 'dias_desde_ultima_realizada', 'calculado_em'
+        ]
@@ -44,12 +44,11 @@ def gerar_relatorio_ia_para_aluno(aluno):
     Coleta dados, chama a API do Gemini e retorna um relatório em HTML.
     """
     aulas_com_relatorio = Aula.objects.filter(
-        alunos=aluno,
         status__in=['Realizada', 'Aluno Ausente'],
         relatorio__isnull=False,
         presencas_alunos__aluno=aluno,
         presencas_alunos__status='presente'
-    ).order_by('data_hora').distinct().prefetch_related(
+    ).order_by('data_hora').prefetch_related(
         'relatorio__itens_rudimentos',
         'relatorio__itens_ritmo',
         'relatorio__itens_viradas',
@@ -1,8 +1,21 @@
+from datetime import date, datetime, timedelta
+from io import StringIO
+from unittest.mock import patch
+
 import pytest
-from rest_framework import status
+from django.core.management import call_command
 from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+
 from users.models import CustomUser
-from scheduling.models import Aluno, Modalidade, Aula, RelatorioAula
+from scheduling.cache import obter_ou_calcular
+from scheduling.models import (
+    Aluno, Aula, Exercicio, ItemRitmo, ItemRudimento, ItemVirada, Modalidade, PresencaAluno, PresencaProfessor,
+    RelatorioAula,
+)
+from .agregados import pontuar_risco
+from .views import AdminDashboardAPIView
 
 @pytest.mark.django_db
 def test_admin_dashboard_endpoint(client):
@@ -74,3 +87,353 @@ def test_export_aulas_endpoint(client):
     assert response['Content-Type'] == 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
     # Verifica se o header sugere o download de um arquivo
     assert 'attachment' in response['Content-Disposition']
+
+
+@pytest.mark.django_db
+def test_catalogo_e_uso_de_exercicios(client):
+    """
+    Garante que descrições equivalentes apontam para o mesmo exercício e que
+    o endpoint de uso lê as contagens pré-calculadas por modalidade e mês.
+    """
+    CustomUser.objects.create_user(username='admin', password='password123', tipo='admin', is_staff=True)
+    token = client.post(reverse('users:token_obtain_pair'), {'username': 'admin', 'password': 'password123'}).data['access']
+    bateria = Modalidade.objects.create(nome="Bateria")
+    percussao = Modalidade.objects.create(nome="Percussão")
+
+    for data_hora, modalidade in (("2025-01-10T10:00:00Z", bateria), ("2025-02-10T10:00:00Z", bateria),
+                                  ("2025-02-11T10:00:00Z", percussao)):
+        relatorio = RelatorioAula.objects.create(aula=Aula.objects.create(modalidade=modalidade, data_hora=data_hora))
+        ItemRudimento.objects.create(relatorio=relatorio, descricao="Paradiddle", duracao_min=10)
+        ItemRitmo.objects.create(relatorio=relatorio, descricao=" paradíddle ", duracao_min=5)
+    ItemRitmo.objects.create(relatorio=relatorio, descricao="Baião")
+
+    assert Exercicio.objects.count() == 2
+    paradiddle = Exercicio.objects.get(nome_canonico="paradiddle")
+    assert paradiddle.nome == "Paradiddle"
+
+    call_command('atualizar_uso_exercicios', stdout=StringIO())
+    url = reverse('reporting:uso-exercicios')
+    response = client.get(url, HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data['ranking'][0] == {
+        'exercicio_id': paradiddle.id, 'nome': "Paradiddle", 'total_itens': 6, 'duracao_total_min': 45
+    }
+    assert [(linha['mes'].month, linha['modalidade_id'], linha['total_itens'])
+            for linha in response.data['por_mes'] if linha['exercicio_id'] == paradiddle.id] == [
+        (1, bateria.id, 2), (2, bateria.id, 2), (2, percussao.id, 2)
+    ]
+
+    response = client.get(f"{url}?modalidade={bateria.id}&mes_inicial=2025-02", HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert response.data['ranking'] == [
+        {'exercicio_id': paradiddle.id, 'nome': "Paradiddle", 'total_itens': 2, 'duracao_total_min': 15}
+    ]
+    response = client.get(f"{url}?mes_inicial=fevereiro", HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+def test_tempo_de_pratica(client, django_assert_max_num_queries):
+    """
+    Garante que os minutos de prática são somados por tipo de item e
+    agrupados por aluno, professor ou modalidade dentro do período.
+    """
+    CustomUser.objects.create_user(username='admin', password='password123', tipo='admin', is_staff=True)
+    prof = CustomUser.objects.create_user(username='prof1', password='password123', tipo='professor')
+    token = client.post(reverse('users:token_obtain_pair'), {'username': 'admin', 'password': 'password123'}).data['access']
+    modalidade = Modalidade.objects.create(nome="Bateria")
+    ana = Aluno.objects.create(nome_completo="Ana")
+    bruno = Aluno.objects.create(nome_completo="Bruno")
+
+    janeiro = Aula.objects.create(modalidade=modalidade, data_hora="2025-01-10T10:00:00Z")
+    janeiro.alunos.set([ana, bruno])
+    relatorio = RelatorioAula.objects.create(aula=janeiro, professor_que_validou=prof)
+    ItemRudimento.objects.create(relatorio=relatorio, descricao="Toque Simples", duracao_min=10)
+    ItemRudimento.objects.create(relatorio=relatorio, descricao="Toque Duplo", duracao_min=5)
+    ItemRitmo.objects.create(relatorio=relatorio, descricao="Baião", duracao_min=20)
+
+    fevereiro = Aula.objects.create(modalidade=modalidade, data_hora="2025-02-10T10:00:00Z")
+    fevereiro.alunos.set([ana])
+    relatorio = RelatorioAula.objects.create(aula=fevereiro)
+    ItemVirada.objects.create(relatorio=relatorio, descricao="Virada em tons", duracao_min=7)
+
+    url = reverse('reporting:tempo-pratica')
+    # autenticação + agregação + nomes
+    with django_assert_max_num_queries(3):
+        response = client.get(url, HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data['resultados'] == [
+        {'id': ana.id, 'nome': "Ana", 'rudimentos': 15, 'ritmos': 20, 'viradas': 7, 'total_min': 42},
+        {'id': bruno.id, 'nome': "Bruno", 'rudimentos': 15, 'ritmos': 20, 'viradas': 0, 'total_min': 35},
+    ]
+
+    response = client.get(f"{url}?agrupar=professor", HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert [(linha['nome'], linha['total_min']) for linha in response.data['resultados']] == [("prof1", 35)]
+
+    response = client.get(f"{url}?agrupar=modalidade&data_inicial=2025-02-01", HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert [(linha['nome'], linha['total_min']) for linha in response.data['resultados']] == [("Bateria", 7)]
+
+    response = client.get(f"{url}?agrupar=sala", HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+def test_matriz_de_presenca(client, django_assert_max_num_queries):
+    """
+    Garante que a matriz aluno × semana é montada em uma query e devolvida
+    em formato colunar, com um código de status por semana.
+    """
+    CustomUser.objects.create_user(username='admin', password='password123', tipo='admin', is_staff=True)
+    token = client.post(reverse('users:token_obtain_pair'), {'username': 'admin', 'password': 'password123'}).data['access']
+    modalidade = Modalidade.objects.create(nome="Bateria")
+    ana = Aluno.objects.create(nome_completo="Ana")
+    bruno = Aluno.objects.create(nome_completo="Bruno")
+
+    # Semana de 06/01: Ana presente. Semana de 13/01: Ana ausente e presente, Bruno ausente.
+    for data_hora, presencas in (
+        ("2025-01-07T10:00:00Z", [(ana, 'presente')]),
+        ("2025-01-14T10:00:00Z", [(ana, 'ausente'), (bruno, 'ausente')]),
+        ("2025-01-16T10:00:00Z", [(ana, 'presente')]),
+    ):
+        aula = Aula.objects.create(modalidade=modalidade, data_hora=data_hora)
+        for aluno, status_presenca in presencas:
+            PresencaAluno.objects.create(aula=aula, aluno=aluno, status=status_presenca)
+
+    url = reverse('reporting:attendance-matrix')
+    # autenticação + matriz
+    with django_assert_max_num_queries(2):
+        response = client.get(f"{url}?data_inicial=2025-01-08&data_final=2025-01-26", HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert response.status_code == status.HTTP_200_OK
+    assert [aluno['nome'] for aluno in response.data['alunos']] == ["Ana", "Bruno"]
+    assert [str(semana) for semana in response.data['semanas']] == ["2025-01-06", "2025-01-13", "2025-01-20"]
+    # O filtro começa em 08/01, então a presença de 07/01 fica de fora.
+    assert response.data['status'] == ["030", "020"]
+
+    response = client.get(f"{url}?data_inicial=2025-01-26&data_final=2025-01-08", HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+def test_retencao_por_coorte(client, django_assert_max_num_queries):
+    """
+    Garante que os alunos são agrupados pelo mês de matrícula e que a
+    retenção de cada mês seguinte vem de um cache diário.
+    """
+    CustomUser.objects.create_user(username='admin', password='password123', tipo='admin', is_staff=True)
+    token = client.post(reverse('users:token_obtain_pair'), {'username': 'admin', 'password': 'password123'}).data['access']
+    modalidade = Modalidade.objects.create(nome="Bateria")
+
+    hoje = timezone.localdate()
+    meses = []
+    for recuo in (2, 1, 0):
+        ano, mes = divmod(hoje.year * 12 + hoje.month - 1 - recuo, 12)
+        meses.append(date(ano, mes + 1, 1))
+
+    ana = Aluno.objects.create(nome_completo="Ana", data_criacao=meses[0])
+    bruno = Aluno.objects.create(nome_completo="Bruno", data_criacao=meses[0])
+    Aluno.objects.create(nome_completo="Carla", data_criacao=meses[2])
+    for aluno, indices in ((ana, (0, 2)), (bruno, (0,))):
+        for indice in indices:
+            aula = Aula.objects.create(
+                modalidade=modalidade,
+                data_hora=timezone.make_aware(datetime.combine(meses[indice], datetime.min.time().replace(hour=12)))
+            )
+            PresencaAluno.objects.create(aula=aula, aluno=aluno, status='presente')
+
+    url = reverse('reporting:retencao-coortes')
+    response = client.get(f"{url}?meses=3", HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert response.status_code == status.HTTP_200_OK
+    assert [(c['coorte'], c['alunos'], c['ativos']) for c in response.data['coortes']] == [
+        (meses[0], 2, [2, 0, 1]),
+        (meses[1], 0, [0, 0]),
+        (meses[2], 1, [0]),
+    ]
+    assert response.data['coortes'][0]['retencao_percentual'] == [100.0, 0.0, 50.0]
+
+    # Segunda chamada no mesmo dia: só a autenticação vai ao banco.
+    with django_assert_max_num_queries(1):
+        client.get(f"{url}?meses=3", HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    response = client.get(f"{url}?meses=0", HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+def test_risco_de_evasao(client):
+    """
+    Garante que o cálculo em lote pontua os alunos ativos pelos indicadores
+    de presença e que a lista sai ordenada do maior para o menor risco.
+    """
+    CustomUser.objects.create_user(username='admin', password='password123', tipo='admin', is_staff=True)
+    token = client.post(reverse('users:token_obtain_pair'), {'username': 'admin', 'password': 'password123'}).data['access']
+    modalidade = Modalidade.objects.create(nome="Bateria")
+    assiduo = Aluno.objects.create(nome_completo="Assíduo")
+    faltoso = Aluno.objects.create(nome_completo="Faltoso")
+    Aluno.objects.create(nome_completo="Sem aulas")
+
+    agora = timezone.now()
+    for dias_atras, presencas in ((20, {assiduo: 'presente', faltoso: 'presente'}),
+                                  (10, {assiduo: 'presente', faltoso: 'ausente'}),
+                                  (3, {assiduo: 'presente', faltoso: 'ausente'})):
+        aula = Aula.objects.create(modalidade=modalidade, data_hora=agora - timedelta(days=dias_atras), status="Realizada")
+        for aluno, status_presenca in presencas.items():
+            PresencaAluno.objects.create(aula=aula, aluno=aluno, status=status_presenca)
+    cancelada = Aula.objects.create(modalidade=modalidade, data_hora=agora - timedelta(days=5), status="Cancelada")
+    cancelada.alunos.set([faltoso])
+
+    call_command('calcular_risco_evasao', stdout=StringIO())
+
+    url = reverse('reporting:risco-evasao')
+    response = client.get(url, HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data['count'] == 2
+    primeiro, segundo = response.data['results']
+    assert primeiro['aluno_nome'] == "Faltoso"
+    assert primeiro['sequencia_ausencias'] == 2
+    assert primeiro['aulas_canceladas'] == 1
+    assert primeiro['dias_desde_ultima_realizada'] == 20
+    assert primeiro['score'] == pontuar_risco(33.33, 2, 1, 20)
+    assert segundo['aluno_nome'] == "Assíduo"
+    assert segundo['score'] == pontuar_risco(100.0, 0, 0, 3)
+
+    response = client.get(f"{url}?score_minimo={segundo['score'] + 1}", HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert [linha['aluno_nome'] for linha in response.data['results']] == ["Faltoso"]
+
+
+@pytest.mark.django_db
+def test_folha_de_professores(client, django_assert_max_num_queries):
+    """
+    Garante que a folha conta, por professor e mês, as aulas realizadas e as
+    substituições com as regras do detalhe do professor, e que a exportação
+    em CSV traz as mesmas linhas.
+    """
+    CustomUser.objects.create_user(username='admin', password='password123', tipo='admin', is_staff=True)
+    titular = CustomUser.objects.create_user(username='titular', password='password123', tipo='professor')
+    substituto = CustomUser.objects.create_user(username='substituto', password='password123', tipo='professor')
+    token = client.post(reverse('users:token_obtain_pair'), {'username': 'admin', 'password': 'password123'}).data['access']
+    bateria = Modalidade.objects.create(nome="Bateria")
+    ac = Modalidade.objects.create(nome="Atividade Complementar")
+
+    janeiro = Aula.objects.create(modalidade=bateria, data_hora="2025-01-10T10:00:00Z", status="Realizada")
+    janeiro.professores.set([titular])
+    RelatorioAula.objects.create(aula=janeiro, professor_que_validou=titular)
+    # Em fevereiro o substituto assume uma aula do titular.
+    fevereiro = Aula.objects.create(modalidade=bateria, data_hora="2025-02-10T10:00:00Z", status="Realizada")
+    fevereiro.professores.set([titular])
+    RelatorioAula.objects.create(aula=fevereiro, professor_que_validou=substituto)
+    atividade = Aula.objects.create(modalidade=ac, data_hora="2025-02-12T10:00:00Z", status="Realizada")
+    atividade.professores.set([titular])
+    RelatorioAula.objects.create(aula=atividade, professor_que_validou=titular)
+    PresencaProfessor.objects.create(aula=atividade, professor=titular, status='presente')
+
+    url = reverse('reporting:folha-professores')
+    # autenticação + professores + 3 queries dos KPIs
+    with django_assert_max_num_queries(5):
+        response = client.get(f"{url}?data_inicial=2025-01-01&data_final=2025-02-28", HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert response.status_code == status.HTTP_200_OK
+    resumo = [
+        (str(linha['mes']), linha['username'], linha['total_realizadas'],
+         linha['total_substituicoes_feitas'], linha['total_substituicoes_sofridas'])
+        for linha in response.data['linhas']
+    ]
+    assert resumo == [
+        ("2025-01-01", "titular", 1, 0, 0),
+        ("2025-02-01", "substituto", 1, 1, 0),
+        ("2025-02-01", "titular", 1, 0, 1),
+    ]
+
+    url = reverse('reporting:export-folha-professores')
+    response = client.get(f"{url}?data_inicial=2025-01-01&data_final=2025-02-28&formato=csv", HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert response.status_code == status.HTTP_200_OK
+    linhas = response.content.decode().splitlines()
+    assert linhas[0].startswith("Mês,Usuário,Nome,Aulas Realizadas")
+    assert linhas[2].startswith("2025-02-01,substituto,,1,1,0")
+
+    response = client.get(f"{url}?formato=xlsx", HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert response.status_code == status.HTTP_200_OK
+    assert response["Content-Type"].startswith("application/vnd.openxmlformats")
+
+
+@pytest.mark.django_db
+def test_dashboard_em_cache_por_periodo(client, django_assert_max_num_queries):
+    """
+    Garante que o dashboard de um período fechado só é invalidado por
+    alterações em aulas dos meses que ele cobre.
+    """
+    CustomUser.objects.create_user(username='admin', password='password123', tipo='admin', is_staff=True)
+    token = client.post(reverse('users:token_obtain_pair'), {'username': 'admin', 'password': 'password123'}).data['access']
+    modalidade = Modalidade.objects.create(nome="Bateria")
+    aula = Aula.objects.create(modalidade=modalidade, data_hora="2025-01-10T10:00:00Z", status="Realizada")
+
+    url = reverse('reporting:admin-dashboard')
+    periodo = f"{url}?data_inicial=2025-01-01&data_final=2025-01-31"
+    assert client.get(periodo, HTTP_AUTHORIZATION=f'Bearer {token}').data['kpis']['total_aulas'] == 1
+    assert client.get(url, HTTP_AUTHORIZATION=f'Bearer {token}').data['kpis']['total_aulas'] == 1
+
+    # Uma aula em outro mês não invalida o período fechado, só o aberto.
+    Aula.objects.create(modalidade=modalidade, data_hora="2025-03-10T10:00:00Z")
+    with django_assert_max_num_queries(1):
+        response = client.get(periodo, HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert response.data['kpis']['total_aulas'] == 1
+    assert client.get(url, HTTP_AUTHORIZATION=f'Bearer {token}').data['kpis']['total_aulas'] == 2
+
+    # Mover a aula para fora do período invalida o mês de origem.
+    aula.data_hora = "2025-02-10T10:00:00Z"
+    aula.save()
+    assert client.get(periodo, HTTP_AUTHORIZATION=f'Bearer {token}').data['kpis']['total_aulas'] == 0
+
+    # A entrada expira mesmo sem mudança de versão, para processos que não
+    # compartilham o cache.
+    with patch('reporting.views.obter_ou_calcular', wraps=obter_ou_calcular) as obter:
+        client.get(periodo, HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert obter.call_args.kwargs['timeout'] == AdminDashboardAPIView.timeout_cache
+    assert AdminDashboardAPIView.timeout_cache is not None
+
+    response = client.get(f"{url}?data_inicial=2025-13-01", HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+def test_dashboard_comparado_ao_periodo_anterior(client, django_assert_max_num_queries):
+    """
+    Garante que a comparação traz o período anterior de mesma duração e a
+    variação dos KPIs, com o mesmo número de queries do dashboard simples.
+    """
+    CustomUser.objects.create_user(username='admin', password='password123', tipo='admin', is_staff=True)
+    prof = CustomUser.objects.create_user(username='prof1', password='password123', tipo='professor')
+    token = client.post(reverse('users:token_obtain_pair'), {'username': 'admin', 'password': 'password123'}).data['access']
+    modalidade = Modalidade.objects.create(nome="Bateria")
+
+    for data_hora, status_aula in (
+        ("2025-02-03T10:00:00Z", "Realizada"),
+        ("2025-02-20T10:00:00Z", "Realizada"),
+        ("2025-01-10T10:00:00Z", "Cancelada"),
+        ("2024-12-20T10:00:00Z", "Realizada"),
+    ):
+        aula = Aula.objects.create(modalidade=modalidade, data_hora=data_hora, status=status_aula)
+        aula.professores.set([prof])
+        if status_aula == "Realizada":
+            RelatorioAula.objects.create(aula=aula, professor_que_validou=prof)
+
+    url = reverse('reporting:admin-dashboard')
+    with django_assert_max_num_queries(5):
+        response = client.get(
+            f"{url}?data_inicial=2025-02-01&data_final=2025-02-28&comparar=true",
+            HTTP_AUTHORIZATION=f'Bearer {token}'
+        )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data['kpis']['total_aulas'] == 2
+    assert response.data['professor_performance'][0]['total_realizadas'] == 2
+
+    comparacao = response.data['comparacao']
+    assert (str(comparacao['data_inicial']), str(comparacao['data_final'])) == ('2025-01-04', '2025-01-31')
+    assert comparacao['kpis']['total_aulas'] == 1
+    assert comparacao['kpis']['total_canceladas'] == 1
+    assert comparacao['aulas_realizadas_por_mes_chart']['data'] == []
+    assert comparacao['professor_performance'][0]['total_atribuidas'] == 1
+    assert comparacao['variacao_kpis']['total_aulas'] == 1
+    assert comparacao['variacao_kpis']['total_canceladas'] == -1
+    assert comparacao['variacao_kpis']['taxa_sucesso_percentual'] == 100.0
+
+    response = client.get(f"{url}?data_inicial=2025-02-01&comparar=true", HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert 'comparacao' not in client.get(url, HTTP_AUTHORIZATION=f'Bearer {token}').data
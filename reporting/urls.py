@@ -1,10 +1,21 @@
 from django.urls import path
-from .views import AdminDashboardAPIView, ExportAulasAPIView
+from .views import (
+    AdminDashboardAPIView, ExportAulasAPIView, ExportFolhaProfessoresAPIView, FolhaProfessoresAPIView,
+    MatrizPresencaAPIView, RetencaoCoortesAPIView, RiscoEvasaoListAPIView, TempoPraticaAPIView,
+    UsoExerciciosAPIView,
+)
 
 
 app_name = "reporting"
 
 urlpatterns = [
     path("reports/admin-dashboard/", AdminDashboardAPIView.as_view(), name="admin-dashboard"),
+    path("reports/attendance-matrix/", MatrizPresencaAPIView.as_view(), name="attendance-matrix"),
+    path("reports/risco-evasao/", RiscoEvasaoListAPIView.as_view(), name="risco-evasao"),
+    path("reports/retencao-coortes/", RetencaoCoortesAPIView.as_view(), name="retencao-coortes"),
+    path("reports/tempo-pratica/", TempoPraticaAPIView.as_view(), name="tempo-pratica"),
+    path("reports/exercicios/", UsoExerciciosAPIView.as_view(), name="uso-exercicios"),
+    path("reports/folha-professores/", FolhaProfessoresAPIView.as_view(), name="folha-professores"),
     path("reports/export/aulas/", ExportAulasAPIView.as_view(), name="export-aulas"),
+    path("reports/export/folha-professores/", ExportFolhaProfessoresAPIView.as_view(), name="export-folha-professores"),
 ]
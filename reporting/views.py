@@ -1,83 +1,211 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework import permissions
-from django.db.models import Count, Q
+from rest_framework import generics, permissions, status
+from rest_framework.exceptions import ValidationError
+from django.db.models import Count, F, Q, Sum
 from django.db.models.functions import TruncMonth
-from datetime import datetime
+import csv
+from datetime import date, datetime, timedelta
 from django.http import HttpResponse
+from django.utils import timezone
 from openpyxl import Workbook
 from openpyxl.styles import Font, PatternFill, Alignment
 from openpyxl.utils import get_column_letter
 
-from scheduling.models import Aula
-from scheduling.filters import AulaFilter
+from scheduling.models import Aluno, Aula, Modalidade
+from scheduling.filters import AulaFilter, inicio_do_dia
 from users.models import CustomUser
-from .serializers import AdminDashboardSerializer
+from scheduling.cache import obter_ou_calcular, tabelas_do_periodo
+from .agregados import AGRUPAMENTOS_PRATICA, folha_professores, matriz_presenca, retencao_por_coorte, tempo_de_pratica
+from .models import RiscoEvasao, UsoExercicioMensal
+from .serializers import AdminDashboardSerializer, RiscoEvasaoSerializer
+
+
+def nova_planilha(titulo, cabecalhos):
+    """Cria uma planilha com a linha de cabeçalho já formatada."""
+    workbook = Workbook()
+    ws = workbook.active
+    ws.title = titulo
+    ws.append(cabecalhos)
+    header_font = Font(bold=True, color="FFFFFF")
+    header_fill = PatternFill(start_color="4F81BD", end_color="4F81BD", fill_type="solid")
+
+    for col_num in range(1, len(cabecalhos) + 1):
+        cell = ws.cell(row=1, column=col_num)
+        cell.font = header_font
+        cell.fill = header_fill
+    return workbook, ws
+
+
+def resposta_xlsx(workbook, nome_arquivo):
+    response = HttpResponse(
+        content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    )
+    response["Content-Disposition"] = f'attachment; filename="{nome_arquivo}"'
+    workbook.save(response)
+    return response
+
+
+def ler_datas(params, *nomes):
+    """Lê datas AAAA-MM-DD opcionais dos parâmetros; ValueError se inválidas."""
+    return [date.fromisoformat(params[nome]) if params.get(nome) else None for nome in nomes]
+
+
+def filtro_periodo(data_inicial, data_final, prefixo=''):
+    """Q das aulas (ou de `prefixo`__data_hora) entre as datas, inclusive."""
+    filtro = Q()
+    if data_inicial:
+        filtro &= Q(**{f'{prefixo}data_hora__gte': inicio_do_dia(data_inicial)})
+    if data_final:
+        filtro &= Q(**{f'{prefixo}data_hora__lt': inicio_do_dia(data_final + timedelta(days=1))})
+    return filtro
+
+
+def contar(campo, filtro, distinct=False):
+    """Count condicional; um filtro vazio conta todas as linhas."""
+    return Count(campo, filter=filtro or None, distinct=distinct)
 
 
 class AdminDashboardAPIView(APIView):
     """
     Endpoint de leitura que agrega dados de todo o sistema para
     um dashboard de administrador.
+
+    Com `?comparar=true` (exige data_inicial e data_final) a resposta ganha
+    `comparacao`, com os mesmos indicadores para o período anterior de mesma
+    duração e a variação de cada KPI. Os dois períodos saem das mesmas
+    queries agrupadas, com contagens condicionais sobre o intervalo que
+    cobre ambos, então comparar não dobra o custo do dashboard.
     """
     permission_classes = [permissions.IsAdminUser]
+    tabelas_referencia = ['scheduling.modalidade', 'users.customuser']
+    timeout_cache = 10 * 60
 
     def get(self, request, *args, **kwargs):
-        params = request.query_params
-        aulas_queryset = Aula.objects.all()
-
-        if params.get('data_inicial'):
-            aulas_queryset = aulas_queryset.filter(data_hora__date__gte=params.get('data_inicial'))
-        if params.get('data_final'):
-            aulas_queryset = aulas_queryset.filter(data_hora__date__lte=params.get('data_final'))
-
-        total_aulas = aulas_queryset.count()
-        total_realizadas = aulas_queryset.filter(status="Realizada").count()
-        total_canceladas = aulas_queryset.filter(status="Cancelada").count()
-        total_aluno_ausente = aulas_queryset.filter(status="Aluno Ausente").count()
-        aulas_concluidas = total_realizadas + total_aluno_ausente
-        taxa_sucesso = (total_realizadas / aulas_concluidas * 100) if aulas_concluidas > 0 else 0
-
-        cat_chart_data = aulas_queryset.values('modalidade__nome').annotate(contagem=Count('id')).order_by('-contagem')
-        mes_chart_data = aulas_queryset.filter(status='Realizada').annotate(mes=TruncMonth('data_hora')).values('mes').annotate(contagem=Count('id')).order_by('mes')
-
-        professores_qs = CustomUser.objects.filter(tipo__in=['professor', 'admin']).annotate(
-            total_atribuidas=Count('aulas', filter=Q(aulas__in=aulas_queryset), distinct=True),
-            total_realizadas=Count('relatorios_validados', filter=Q(relatorios_validados__aula__in=aulas_queryset), distinct=True)
-        ).filter(total_atribuidas__gt=0).order_by('-total_realizadas')
-
-        prof_performance_data = []
-        for p in professores_qs:
-            taxa = (p.total_realizadas / p.total_atribuidas * 100) if p.total_atribuidas > 0 else 0
-            prof_performance_data.append({
-                'username': p.username,
-                'total_realizadas': p.total_realizadas,
-                'total_atribuidas': p.total_atribuidas,
-                'taxa_realizacao_percentual': round(taxa, 2)
-            })
-
-        data = {
-            'kpis': {
-                'total_aulas': total_aulas,
-                'total_realizadas': total_realizadas,
-                'total_canceladas': total_canceladas,
-                'total_aluno_ausente': total_aluno_ausente,
-                'taxa_sucesso_percentual': round(taxa_sucesso, 2)
-            },
-            'aulas_por_categoria_chart': {
-                'labels': [item['modalidade__nome'] for item in cat_chart_data],
-                'data': [item['contagem'] for item in cat_chart_data]
-            },
-            'aulas_realizadas_por_mes_chart': {
-                'labels': [item['mes'].strftime('%b/%Y') for item in mes_chart_data],
-                'data': [item['contagem'] for item in mes_chart_data]
-            },
-            'professor_performance': prof_performance_data
+        """
+        O resultado fica em cache por período. A chave depende das versões
+        mensais das aulas (ver `scheduling/signals.py`) dos meses cobertos,
+        então alterações em aulas de outros meses não invalidam o cache.
+        Ainda assim a entrada expira em `timeout_cache` segundos: com um
+        cache que não é compartilhado entre processos (ver o check
+        `scheduling.W001`), um processo não vê as versões incrementadas por
+        outro e serviria o dashboard antigo para sempre.
+        """
+        try:
+            data_inicial, data_final = ler_datas(request.query_params, 'data_inicial', 'data_final')
+        except ValueError:
+            return Response(
+                {'error': 'Use o formato AAAA-MM-DD em data_inicial e data_final.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        anterior = None
+        if request.query_params.get('comparar') in ('1', 'true'):
+            if not (data_inicial and data_final) or data_inicial > data_final:
+                return Response(
+                    {'error': 'Para comparar, informe um período com data_inicial e data_final.'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            anterior_final = data_inicial - timedelta(days=1)
+            anterior = (anterior_final - (data_final - data_inicial), anterior_final)
+
+        inicio_cache = anterior[0] if anterior else data_inicial
+        tabelas = tabelas_do_periodo('scheduling.aula', inicio_cache, data_final) + self.tabelas_referencia
+        return Response(obter_ou_calcular(
+            'reports:dashboard', tabelas, lambda: self.calcular(data_inicial, data_final, anterior),
+            data_inicial, data_final, anterior is not None, timeout=self.timeout_cache,
+        ))
+
+    def calcular(self, data_inicial, data_final, anterior=None):
+        periodos = {'atual': (data_inicial, data_final)}
+        if anterior:
+            periodos['anterior'] = anterior
+        filtros = {nome: filtro_periodo(*datas) for nome, datas in periodos.items()}
+
+        cobertura = Q()
+        if anterior:
+            cobertura = filtros['atual'] | filtros['anterior']
+        elif filtros['atual']:
+            cobertura = filtros['atual']
+        aulas_queryset = Aula.objects.filter(cobertura)
+
+        contagens_status = {
+            'total_aulas': Q(),
+            'total_realizadas': Q(status='Realizada'),
+            'total_canceladas': Q(status='Cancelada'),
+            'total_aluno_ausente': Q(status='Aluno Ausente'),
         }
+        totais = aulas_queryset.aggregate(**{
+            f'{nome}_{chave}': contar('id', filtro & condicao)
+            for nome, filtro in filtros.items()
+            for chave, condicao in contagens_status.items()
+        })
+
+        por_categoria = list(aulas_queryset.values('modalidade__nome').annotate(**{
+            nome: contar('id', filtro) for nome, filtro in filtros.items()
+        }))
+        por_mes = list(aulas_queryset.filter(status='Realizada').annotate(mes=TruncMonth('data_hora')).values('mes').annotate(**{
+            nome: contar('id', filtro) for nome, filtro in filtros.items()
+        }).order_by('mes'))
+
+        professores = list(CustomUser.objects.filter(tipo__in=['professor', 'admin']).annotate(**{
+            f'{campo}_{nome}': contar(relacao, filtro_periodo(*datas, prefixo=prefixo), distinct=True)
+            for nome, datas in periodos.items()
+            for campo, relacao, prefixo in (
+                ('atribuidas', 'aulas', 'aulas__'),
+                ('realizadas', 'relatorios_validados', 'relatorios_validados__aula__'),
+            )
+        }).filter(
+            pk__in=CustomUser.objects.filter(aulas__in=aulas_queryset)
+        ).order_by('-realizadas_atual'))
+
+        def montar(nome):
+            kpis = {chave: totais[f'{nome}_{chave}'] for chave in contagens_status}
+            aulas_concluidas = kpis['total_realizadas'] + kpis['total_aluno_ausente']
+            taxa_sucesso = (kpis['total_realizadas'] / aulas_concluidas * 100) if aulas_concluidas > 0 else 0
+            kpis['taxa_sucesso_percentual'] = round(taxa_sucesso, 2)
+
+            categorias = sorted((item for item in por_categoria if item[nome]), key=lambda item: -item[nome])
+            meses = [item for item in por_mes if item[nome]]
+
+            prof_performance_data = []
+            for p in sorted(professores, key=lambda p: -getattr(p, f'realizadas_{nome}')):
+                atribuidas = getattr(p, f'atribuidas_{nome}')
+                realizadas = getattr(p, f'realizadas_{nome}')
+                if not atribuidas:
+                    continue
+                prof_performance_data.append({
+                    'username': p.username,
+                    'total_realizadas': realizadas,
+                    'total_atribuidas': atribuidas,
+                    'taxa_realizacao_percentual': round(realizadas / atribuidas * 100, 2)
+                })
+
+            return {
+                'kpis': kpis,
+                'aulas_por_categoria_chart': {
+                    'labels': [item['modalidade__nome'] for item in categorias],
+                    'data': [item[nome] for item in categorias]
+                },
+                'aulas_realizadas_por_mes_chart': {
+                    'labels': [item['mes'].strftime('%b/%Y') for item in meses],
+                    'data': [item[nome] for item in meses]
+                },
+                'professor_performance': prof_performance_data
+            }
+
+        data = montar('atual')
+        if anterior:
+            comparacao = montar('anterior')
+            comparacao['data_inicial'], comparacao['data_final'] = anterior
+            comparacao['variacao_kpis'] = {
+                chave: round(valor - comparacao['kpis'][chave], 2) for chave, valor in data['kpis'].items()
+            }
+            data['comparacao'] = comparacao
 
         serializer = AdminDashboardSerializer(data=data)
         serializer.is_valid(raise_exception=True)
-        return Response(serializer.validated_data)
+        return serializer.validated_data
 
 
 class ExportAulasAPIView(APIView):
@@ -92,22 +220,10 @@ class ExportAulasAPIView(APIView):
             'modalidade', 'relatorio__professor_que_validou'
         ).prefetch_related('alunos', 'professores')
 
-        workbook = Workbook()
-        ws = workbook.active
-        ws.title = "Relatorio de Aulas"
-
-        headers = [
+        workbook, ws = nova_planilha("Relatorio de Aulas", [
             "ID Aula", "Data e Hora", "Status", "Modalidade", "Alunos",
             "Prof. Atribuído(s)", "Prof. que Realizou"
-        ]
-        ws.append(headers)
-        header_font = Font(bold=True, color="FFFFFF")
-        header_fill = PatternFill(start_color="4F81BD", end_color="4F81BD", fill_type="solid")
-
-        for col_num, header_title in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col_num)
-            cell.font = header_font
-            cell.fill = header_fill
+        ])
 
         for aula in aulas_list:
             alunos_str = ", ".join([al.nome_completo for al in aula.alunos.all()])
@@ -125,10 +241,244 @@ class ExportAulasAPIView(APIView):
                 professor_realizou_str,
             ])
 
-        response = HttpResponse(
-            content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        return resposta_xlsx(workbook, "relatorio_de_aulas.xlsx")
+
+
+class UsoExerciciosAPIView(APIView):
+    """
+    Endpoint de estatísticas de uso dos exercícios, lido da tabela
+    pré-calculada `UsoExercicioMensal`.
+
+    Aceita `modalidade`, `mes_inicial` e `mes_final` (AAAA-MM) e `limite`
+    (padrão 20). Retorna o ranking dos exercícios mais praticados e, para
+    eles, a contagem por modalidade e mês.
+    """
+    permission_classes = [permissions.IsAdminUser]
+    limite_padrao = 20
+
+    def get(self, request, *args, **kwargs):
+        params = request.query_params
+        usos = UsoExercicioMensal.objects.all()
+
+        try:
+            if params.get('mes_inicial'):
+                usos = usos.filter(mes__gte=date.fromisoformat(f"{params['mes_inicial']}-01"))
+            if params.get('mes_final'):
+                usos = usos.filter(mes__lte=date.fromisoformat(f"{params['mes_final']}-01"))
+            limite = int(params.get('limite', self.limite_padrao))
+        except ValueError:
+            return Response(
+                {'error': 'Use AAAA-MM em mes_inicial/mes_final e um número em limite.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if params.get('modalidade'):
+            usos = usos.filter(modalidade_id=params['modalidade'])
+
+        ranking = list(usos.values(
+            'exercicio_id', nome=F('exercicio__nome')
+        ).annotate(
+            total_itens=Sum('total_itens'), duracao_total_min=Sum('duracao_total_min')
+        ).order_by('-total_itens', 'nome')[:limite])
+
+        por_mes = usos.filter(
+            exercicio_id__in=[linha['exercicio_id'] for linha in ranking]
+        ).values(
+            'exercicio_id', 'modalidade_id', 'mes', 'total_itens', 'duracao_total_min'
+        ).order_by('exercicio_id', 'mes', 'modalidade_id')
+
+        return Response({'ranking': ranking, 'por_mes': list(por_mes)})
+
+
+class TempoPraticaAPIView(APIView):
+    """
+    Endpoint com o total de minutos de prática (rudimentos, ritmos e
+    viradas) por aluno, professor ou modalidade.
+
+    `agrupar` escolhe o agrupamento (padrão `aluno`); `data_inicial` e
+    `data_final` (AAAA-MM-DD) limitam o período pela data da aula.
+    """
+    permission_classes = [permissions.IsAdminUser]
+    nomes = {
+        'aluno': (Aluno.objects, 'nome_completo'),
+        'professor': (CustomUser.objects, 'username'),
+        'modalidade': (Modalidade.objects, 'nome'),
+    }
+
+    def get(self, request, *args, **kwargs):
+        params = request.query_params
+        agrupar = params.get('agrupar', 'aluno')
+        if agrupar not in AGRUPAMENTOS_PRATICA:
+            return Response(
+                {'error': f"O parâmetro agrupar deve ser um de: {', '.join(AGRUPAMENTOS_PRATICA)}."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            datas = ler_datas(params, 'data_inicial', 'data_final')
+        except ValueError:
+            return Response(
+                {'error': 'Use o formato AAAA-MM-DD em data_inicial e data_final.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        totais = tempo_de_pratica(agrupar, *datas)
+        manager, campo_nome = self.nomes[agrupar]
+        nomes = dict(manager.filter(pk__in=totais).values_list('pk', campo_nome))
+
+        resultados = [
+            {'id': pk, 'nome': nomes.get(pk), **minutos, 'total_min': sum(minutos.values())}
+            for pk, minutos in totais.items()
+        ]
+        resultados.sort(key=lambda linha: (-linha['total_min'], linha['nome'] or ''))
+        return Response({'agrupar': agrupar, 'resultados': resultados})
+
+
+class MatrizPresencaAPIView(APIView):
+    """
+    Endpoint com a grade aluno × semana de presença de um período, em
+    formato colunar (ver `reporting.agregados.matriz_presenca`).
+
+    `data_inicial` e `data_final` (AAAA-MM-DD) definem o período, por
+    padrão as últimas 12 semanas, limitado a `max_semanas`; `modalidade`
+    filtra as aulas.
+    """
+    permission_classes = [permissions.IsAdminUser]
+    semanas_padrao = 12
+    max_semanas = 106
+
+    def get(self, request, *args, **kwargs):
+        params = request.query_params
+        try:
+            data_inicial, data_final = ler_datas(params, 'data_inicial', 'data_final')
+        except ValueError:
+            return Response(
+                {'error': 'Use o formato AAAA-MM-DD em data_inicial e data_final.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        data_final = data_final or timezone.localdate()
+        data_inicial = data_inicial or data_final - timedelta(weeks=self.semanas_padrao) + timedelta(days=1)
+
+        if data_inicial > data_final or (data_final - data_inicial).days > self.max_semanas * 7:
+            return Response(
+                {'error': f'O período deve ter início antes do fim e no máximo {self.max_semanas} semanas.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        return Response(matriz_presenca(data_inicial, data_final, params.get('modalidade') or None))
+
+
+class RetencaoCoortesAPIView(APIView):
+    """
+    Endpoint de retenção por coorte de matrícula: para cada mês de
+    matrícula, quantos alunos tiveram presença em cada mês seguinte.
+
+    `meses` escolhe quantas coortes recentes entram (padrão 12, no máximo
+    `max_meses`). O resultado fica em cache até o fim do dia.
+    """
+    permission_classes = [permissions.IsAdminUser]
+    meses_padrao = 12
+    max_meses = 60
+
+    def get(self, request, *args, **kwargs):
+        try:
+            meses = int(request.query_params.get('meses', self.meses_padrao))
+        except ValueError:
+            meses = 0
+        if not 1 <= meses <= self.max_meses:
+            return Response(
+                {'error': f'O parâmetro meses deve ser um número entre 1 e {self.max_meses}.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        hoje = timezone.localdate()
+        coortes = obter_ou_calcular(
+            'reports:retencao', [], lambda: retencao_por_coorte(hoje, meses),
+            hoje, meses, timeout=24 * 60 * 60,
         )
-        response["Content-Disposition"] = 'attachment; filename="relatorio_de_aulas.xlsx"'
-        workbook.save(response)
+        return Response({'data_referencia': hoje, 'coortes': coortes})
+
+
+class RiscoEvasaoListAPIView(generics.ListAPIView):
+    """
+    Lista paginada dos alunos por risco de evasão, do maior para o menor,
+    lida da tabela preenchida pelo comando `calcular_risco_evasao`.
+    `score_minimo` filtra os alunos a partir de um score.
+    """
+    serializer_class = RiscoEvasaoSerializer
+    permission_classes = [permissions.IsAdminUser]
+
+    def get_queryset(self):
+        queryset = RiscoEvasao.objects.select_related('aluno').order_by('-score', 'aluno_id')
+        score_minimo = self.request.query_params.get('score_minimo')
+        if score_minimo:
+            try:
+                queryset = queryset.filter(score__gte=float(score_minimo))
+            except ValueError:
+                raise ValidationError({'score_minimo': 'Informe um número.'})
+        return queryset
+
+
+class FolhaProfessoresMixin:
+    """
+    Lê o período da folha (`data_inicial` e `data_final`, por padrão o mês
+    atual) e calcula as linhas de `folha_professores`.
+    """
+    permission_classes = [permissions.IsAdminUser]
+    colunas = [
+        ('mes', "Mês"), ('username', "Usuário"), ('nome', "Nome"),
+        ('total_realizadas', "Aulas Realizadas"),
+        ('total_substituicoes_feitas', "Substituições Feitas"),
+        ('total_substituicoes_sofridas', "Substituições Sofridas"),
+        ('total_canceladas', "Canceladas"), ('total_agendadas', "Agendadas"),
+    ]
+
+    def calcular_folha(self, request):
+        try:
+            data_inicial, data_final = ler_datas(request.query_params, 'data_inicial', 'data_final')
+        except ValueError:
+            raise ValidationError({'error': 'Use o formato AAAA-MM-DD em data_inicial e data_final.'})
+        hoje = timezone.localdate()
+        data_inicial = data_inicial or hoje.replace(day=1)
+        data_final = data_final or hoje
+        return data_inicial, data_final, folha_professores(data_inicial, data_final)
+
+
+class FolhaProfessoresAPIView(FolhaProfessoresMixin, APIView):
+    """
+    Endpoint da folha de pagamento dos professores: por professor e mês,
+    aulas realizadas (pelo relatório validado ou, nas atividades
+    complementares, pela presença) e substituições feitas e sofridas.
+    """
+
+    def get(self, request, *args, **kwargs):
+        data_inicial, data_final, linhas = self.calcular_folha(request)
+        return Response({'data_inicial': data_inicial, 'data_final': data_final, 'linhas': linhas})
+
+
+class ExportFolhaProfessoresAPIView(FolhaProfessoresMixin, APIView):
+    """
+    Exporta a folha de pagamento dos professores em Excel (.xlsx) ou,
+    com `formato=csv`, em CSV.
+    """
+
+    def get(self, request, *args, **kwargs):
+        formato = request.query_params.get('formato', 'xlsx')
+        if formato not in ('xlsx', 'csv'):
+            return Response({'error': 'O formato deve ser xlsx ou csv.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        data_inicial, data_final, linhas = self.calcular_folha(request)
+        cabecalhos = [titulo for _, titulo in self.colunas]
+        valores = [[linha[campo] for campo, _ in self.colunas] for linha in linhas]
+        nome_arquivo = f"folha_professores_{data_inicial}_{data_final}.{formato}"
+
+        if formato == 'csv':
+            response = HttpResponse(content_type="text/csv; charset=utf-8")
+            response["Content-Disposition"] = f'attachment; filename="{nome_arquivo}"'
+            writer = csv.writer(response)
+            writer.writerow(cabecalhos)
+            writer.writerows(valores)
+            return response
 
-        return response
+        workbook, ws = nova_planilha("Folha de Professores", cabecalhos)
+        for linha in valores:
+            ws.append(linha)
+        return resposta_xlsx(workbook, nome_arquivo)
@@ -1,8 +1,15 @@
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connection
+from django.db.models import Prefetch
+from django.utils.functional import cached_property
+
+from users.models import CustomUser
 from .models import (
     Modalidade,
     Aluno,
     Aula,
+    Exercicio,
     RelatorioAula,
     ItemRudimento,
     ItemRitmo,
@@ -11,6 +18,91 @@ from .models import (
     PresencaProfessor,
 )
 
+def estimar_linhas(model):
+    """
+    Número de linhas da tabela de `model` segundo as estatísticas do banco
+    (`pg_class` no PostgreSQL, `sqlite_stat1` no SQLite após um ANALYZE),
+    sem varrer a tabela. Retorna None quando não há estatística.
+    """
+    tabela = model._meta.db_table
+    try:
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE relname = %s", [tabela])
+            elif connection.vendor == 'sqlite':
+                cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+                if cursor.fetchone() is None:
+                    return None
+                cursor.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1", [tabela])
+            else:
+                return None
+            linha = cursor.fetchone()
+    except DatabaseError:
+        return None
+    if linha is None or linha[0] is None:
+        return None
+    estimativa = int(str(linha[0]).split()[0])
+    return estimativa if estimativa >= 0 else None
+
+
+class PaginadorContagemEstimada(Paginator):
+    """
+    Paginador das listagens do admin sobre tabelas grandes. Sem filtros, o
+    total vem de `estimar_linhas` quando passa de `limite_estimativa`,
+    evitando um COUNT(*) sobre a tabela inteira a cada página. Listagens
+    filtradas e tabelas pequenas continuam com a contagem exata, assim como
+    uma página que volta vazia por a estimativa estar acima do real.
+    """
+    limite_estimativa = 10000
+    contagem_estimada = False
+    contagem_exata = False
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is not None and not query.where and not self.contagem_exata:
+            estimativa = estimar_linhas(self.object_list.model)
+            if estimativa is not None and estimativa >= self.limite_estimativa:
+                self.contagem_estimada = True
+                return estimativa
+        return super().count
+
+    def page(self, number):
+        pagina = super().page(number)
+        if self.contagem_estimada and not pagina.object_list:
+            # Refaz a paginação com a contagem exata: a página ou é válida
+            # de fato, ou gera o EmptyPage tratado pelo admin.
+            self.contagem_exata = True
+            self.contagem_estimada = False
+            for atributo in ('count', 'num_pages'):
+                self.__dict__.pop(atributo, None)
+            pagina = super().page(number)
+        return pagina
+
+
+class ListagemGrandeAdmin(admin.ModelAdmin):
+    """
+    Base dos admins de tabelas que crescem com o uso: contagem estimada e
+    sem o segundo COUNT(*) do total geral quando há filtros.
+    """
+    paginator = PaginadorContagemEstimada
+    show_full_result_count = False
+
+
+class ProfessorListFilter(admin.SimpleListFilter):
+    """Filtro por professor que lê só id e username dos professores."""
+    title = 'professores'
+    parameter_name = 'professores__id__exact'
+
+    def lookups(self, request, model_admin):
+        return CustomUser.objects.filter(tipo__in=['admin', 'professor']).order_by('username').values_list('id', 'username')
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(professores__id=self.value())
+        return queryset
+
+
 @admin.register(Modalidade)
 class ModalidadeAdmin(admin.ModelAdmin):
     """Configuração do Admin para o modelo Modalidade."""
@@ -26,6 +118,14 @@ class AlunoAdmin(admin.ModelAdmin):
     ordering = ('nome_completo',)
 
 
+@admin.register(Exercicio)
+class ExercicioAdmin(admin.ModelAdmin):
+    """Configuração do Admin para o catálogo de exercícios."""
+    list_display = ('nome', 'nome_canonico')
+    search_fields = ('nome', 'nome_canonico')
+    ordering = ('nome_canonico',)
+
+
 # Inlines para os Itens do Relatório de Aula
 # Permitem editar os exercícios diretamente na página do relatório.
 class ItemRudimentoInline(admin.TabularInline):
@@ -42,9 +142,10 @@ class ItemViradaInline(admin.TabularInline):
 
 
 @admin.register(RelatorioAula)
-class RelatorioAulaAdmin(admin.ModelAdmin):
+class RelatorioAulaAdmin(ListagemGrandeAdmin):
     """Configuração do Admin para o Relatório de Aula, com exercícios aninhados."""
     list_display = ('aula', 'professor_que_validou', 'data_atualizacao')
+    list_select_related = ('aula__modalidade', 'professor_que_validou')
     # Autocomplete para facilitar a busca de aulas e professores
     autocomplete_fields = ('aula', 'professor_que_validou')
     inlines = [
@@ -54,19 +155,34 @@ class RelatorioAulaAdmin(admin.ModelAdmin):
     ]
 
 
+class PresencaAlunoInline(admin.TabularInline):
+    """Alunos matriculados na aula, com o status da presença."""
+    model = PresencaAluno
+    extra = 0
+    autocomplete_fields = ('aluno',)
+
+
 @admin.register(Aula)
-class AulaAdmin(admin.ModelAdmin):
+class AulaAdmin(ListagemGrandeAdmin):
     """
     Configuração avançada do Admin para o modelo Aula,
     com bom suporte para os campos ManyToMany.
+    Alunos e professores de uma página inteira vêm em duas queries.
     """
     list_display = ('data_hora', 'get_alunos_display', 'modalidade', 'get_professores_display', 'status')
-    list_filter = ('status', 'modalidade', 'professores', 'data_hora')
+    list_filter = ('status', 'modalidade', ProfessorListFilter, 'data_hora')
     search_fields = ('alunos__nome_completo', 'professores__username', 'modalidade__nome')
     # Autocomplete melhora muito a usabilidade com muitos alunos/professores
-    autocomplete_fields = ('alunos', 'professores')
+    autocomplete_fields = ('professores',)
+    inlines = [PresencaAlunoInline]
     ordering = ('-data_hora',)
-    
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('modalidade').prefetch_related(
+            Prefetch('alunos', queryset=Aluno.objects.only('id', 'nome_completo')),
+            Prefetch('professores', queryset=CustomUser.objects.only('id', 'username')),
+        )
+
     # Métodos para exibir campos ManyToMany de forma legível na lista
     def get_alunos_display(self, obj):
         """Retorna os nomes dos alunos separados por vírgula."""
@@ -80,16 +196,18 @@ class AulaAdmin(admin.ModelAdmin):
 
 
 @admin.register(PresencaAluno)
-class PresencaAlunoAdmin(admin.ModelAdmin):
+class PresencaAlunoAdmin(ListagemGrandeAdmin):
     """Configuração do Admin para o registro de presença de alunos."""
     list_display = ('aula', 'aluno', 'status')
+    list_select_related = ('aula__modalidade', 'aluno')
     list_filter = ('status',)
     autocomplete_fields = ('aula', 'aluno')
 
 
 @admin.register(PresencaProfessor)
-class PresencaProfessorAdmin(admin.ModelAdmin):
+class PresencaProfessorAdmin(ListagemGrandeAdmin):
     """Configuração do Admin para o registro de presença de professores."""
     list_display = ('aula', 'professor', 'status')
+    list_select_related = ('aula__modalidade', 'professor')
     list_filter = ('status',)
     autocomplete_fields = ('aula', 'professor')
@@ -0,0 +1,146 @@
+"""
+Cache versionado por tabela.
+
+Cada tabela tem um contador de versão guardado no cache padrão do Django,
+incrementado pelos sinais de `signals.py` sempre que uma linha muda. As
+chaves dos dados em cache incluem as versões das tabelas de que dependem,
+então uma alteração torna as entradas antigas inalcançáveis sem precisar
+apagá-las; elas simplesmente expiram.
+
+`em_memoria` guarda o valor no próprio processo e só consulta o cache
+compartilhado para conferir as versões. Vários processos só ficam coerentes
+entre si se o cache padrão for de fato compartilhado (Redis, Memcached,
+FileBasedCache); com o `LocMemCache` cada processo tem as suas versões e só
+enxerga as próprias alterações. Por isso os valores em memória também
+expiram depois de `TIMEOUT_MEMORIA` segundos, e o check `scheduling.W001`
+avisa quando o `LocMemCache` é usado fora do modo DEBUG.
+"""
+import time
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+
+PREFIXO_VERSAO = 'versao'
+# Sufixo da versão que muda com qualquer mês de uma tabela versionada por mês.
+QUALQUER_MES = '*'
+PREFIXO_METRICA = 'metrica'
+# Limite, em segundos, para um valor de `em_memoria` ser reaproveitado.
+TIMEOUT_MEMORIA = 60
+
+# {nome: (versões das tabelas, validade, valor)} dos valores guardados em memória.
+_memoria = {}
+
+
+def _chave_versao(tabela):
+    return f'{PREFIXO_VERSAO}:{tabela}'
+
+
+def _versao_inicial():
+    # Baseada no relógio para que um contador descartado pelo backend não
+    # volte a um número já usado e reative entradas antigas.
+    return time.time_ns()
+
+
+def versao(tabela):
+    """Retorna a versão atual de `tabela` (ex.: 'scheduling.aula')."""
+    return cache.get_or_set(_chave_versao(tabela), _versao_inicial, timeout=None)
+
+
+def versoes(tabelas):
+    """Retorna as versões de várias tabelas com uma única ida ao cache."""
+    chaves = {tabela: _chave_versao(tabela) for tabela in tabelas}
+    encontradas = cache.get_many(chaves.values())
+    resultado = {}
+    for tabela, chave in chaves.items():
+        resultado[tabela] = encontradas[chave] if chave in encontradas else versao(tabela)
+    return resultado
+
+
+def incrementar_versao(tabela):
+    """Invalida tudo o que depende de `tabela`."""
+    chave = _chave_versao(tabela)
+    try:
+        cache.incr(chave)
+    except ValueError:
+        # A chave ainda não existe (ou foi descartada pelo backend).
+        cache.add(chave, _versao_inicial(), timeout=None)
+        cache.incr(chave)
+
+
+def tabela_do_mes(tabela, data):
+    """Nome da versão de `tabela` restrita ao mês de `data`."""
+    return f'{tabela}@{data:%Y-%m}'
+
+
+def tabelas_do_periodo(tabela, data_inicial, data_final):
+    """
+    Versões de que depende um dado calculado sobre `tabela` entre as duas
+    datas: uma por mês do período ou, se ele for aberto, a de qualquer mês.
+    """
+    if data_inicial is None or data_final is None:
+        return [f'{tabela}@{QUALQUER_MES}']
+    meses = []
+    mes = data_inicial.replace(day=1)
+    while mes <= data_final:
+        meses.append(tabela_do_mes(tabela, mes))
+        mes = (mes + timedelta(days=32)).replace(day=1)
+    return meses
+
+
+def chave_versionada(nome, tabelas, *partes):
+    """Monta a chave de cache de `nome` a partir das versões de `tabelas`."""
+    atuais = versoes(tabelas)
+    sufixo = ':'.join(f'{tabela}={atuais[tabela]}' for tabela in tabelas)
+    return ':'.join([nome, sufixo, *map(str, partes)])
+
+
+def obter_ou_calcular(nome, tabelas, calcular, *partes, timeout=DEFAULT_TIMEOUT):
+    """
+    Lê `nome` do cache para as versões atuais de `tabelas` ou o recalcula
+    com `calcular()` e guarda o resultado.
+    """
+    chave = chave_versionada(nome, tabelas, *partes)
+    valor = cache.get(chave)
+    if valor is None:
+        valor = calcular()
+        cache.set(chave, valor, timeout=timeout)
+    return valor
+
+
+def em_memoria(nome, tabelas, calcular):
+    """
+    Como `obter_ou_calcular`, mas o valor fica na memória do processo: a
+    única ida ao cache compartilhado é a leitura das versões de `tabelas`.
+    Pensado para dados de referência pequenos e muito lidos. O valor é
+    compartilhado entre requisições e não deve ser alterado; ele é
+    recalculado no máximo a cada `TIMEOUT_MEMORIA` segundos, mesmo sem
+    mudança de versão.
+    """
+    atuais = versoes(tabelas)
+    assinatura = tuple(atuais[tabela] for tabela in tabelas)
+    agora = time.monotonic()
+    guardado = _memoria.get(nome)
+    if guardado is not None and guardado[0] == assinatura and guardado[1] > agora:
+        return guardado[2]
+
+    valor = calcular()
+    _memoria[nome] = (assinatura, agora + TIMEOUT_MEMORIA, valor)
+    return valor
+
+
+def registrar_metrica(nome, evento):
+    """Conta um evento (ex.: 'hit' ou 'miss') de `nome` no cache compartilhado."""
+    chave = f'{PREFIXO_METRICA}:{nome}:{evento}'
+    if not cache.add(chave, 1, timeout=None):
+        try:
+            cache.incr(chave)
+        except ValueError:
+            cache.add(chave, 1, timeout=None)
+
+
+def metricas(nome, eventos=('hit', 'miss')):
+    """Retorna {evento: contagem} de `nome`."""
+    chaves = {evento: f'{PREFIXO_METRICA}:{nome}:{evento}' for evento in eventos}
+    encontradas = cache.get_many(chaves.values())
+    return {evento: encontradas.get(chave, 0) for evento, chave in chaves.items()}
@@ -0,0 +1,29 @@
+"""
+Checks do Django para a configuração de que o cache versionado depende.
+"""
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+LOCMEM = 'django.core.cache.backends.locmem.LocMemCache'
+
+
+@register(Tags.caches)
+def cache_compartilhado(app_configs, **kwargs):
+    """
+    Fora do modo DEBUG o cache padrão deve ser compartilhado entre os
+    processos: com o `LocMemCache` cada processo tem seus próprios
+    contadores de versão e não vê as alterações feitas pelos outros.
+    """
+    if settings.DEBUG or settings.CACHES.get('default', {}).get('BACKEND') != LOCMEM:
+        return []
+    return [
+        Warning(
+            'O cache padrão é o LocMemCache, que não é compartilhado entre processos.',
+            hint=(
+                'Com mais de um worker, configure CACHE_BACKEND/CACHE_LOCATION com um backend '
+                'compartilhado (Redis, Memcached ou FileBasedCache) para que as versões do '
+                'cache versionado sejam vistas por todos.'
+            ),
+            id='scheduling.W001',
+        )
+    ]
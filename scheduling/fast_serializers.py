@@ -0,0 +1,172 @@
+"""
+Serializers somente leitura para as listagens mais acessadas.
+
+Em vez de instanciar modelos e passar cada objeto aninhado pela maquinaria
+de campos do DRF, estes serializers trabalham sobre linhas de `values()` e
+mapas de ids das tabelas ManyToMany. A conversão de cada valor continua
+sendo feita pelos próprios campos do serializer de referência, então o JSON
+gerado é idêntico ao do serializer original.
+"""
+from collections import defaultdict
+
+from rest_framework.response import Response
+
+from users.models import CustomUser
+from .cache import em_memoria
+from .models import Aluno, Aula, Modalidade
+from .serializers import AlunoSerializer, AulaSerializer, ModalidadeSerializer, ProfessorSimpleSerializer
+
+
+def agrupar_ids_m2m(descritor, ids):
+    """
+    Lê a tabela intermediária de um ManyToMany e retorna
+    {id de origem: [ids relacionados]} em uma única query.
+    """
+    campo = descritor.field
+    origem, destino = campo.m2m_column_name(), campo.m2m_reverse_name()
+    linhas = campo.remote_field.through.objects.filter(
+        **{f'{origem}__in': ids}
+    ).order_by(origem, destino).values_list(origem, destino)
+
+    grupos = defaultdict(list)
+    for id_origem, id_destino in linhas:
+        grupos[id_origem].append(id_destino)
+    return grupos
+
+
+class ValuesSerializer:
+    """
+    Base dos serializers rápidos. `serializer_class` é o serializer de
+    referência que define os campos, a ordem e o formato de cada valor.
+    Campos listados em `aninhados` são preenchidos por `serializar()`.
+    `nomes` restringe a saída a um subconjunto dos campos.
+    """
+    serializer_class = None
+    aninhados = ()
+    colunas_extras = ()
+
+    def __init__(self, nomes=None):
+        campos = {
+            nome: campo for nome, campo in self.serializer_class().fields.items()
+            if not campo.write_only and (nomes is None or nome in nomes)
+        }
+        self.nomes = list(campos)
+        self.campos = [
+            (nome, campo.source, campo.to_representation)
+            for nome, campo in campos.items()
+            if nome not in self.aninhados
+        ]
+
+    def preparar(self, queryset):
+        """Reduz a queryset às colunas necessárias para a serialização."""
+        colunas = ['id', *[source for _, source, _ in self.campos], *self.colunas_extras]
+        return queryset.values(*dict.fromkeys(colunas))
+
+    def serializar_linha(self, linha):
+        return {
+            nome: None if linha[source] is None else to_representation(linha[source])
+            for nome, source, to_representation in self.campos
+        }
+
+    def serializar(self, linhas):
+        return [self.serializar_linha(linha) for linha in linhas]
+
+    def por_id(self, queryset, ids):
+        """Serializa os objetos de `ids` e retorna {id: dicionário}."""
+        if not ids:
+            return {}
+        linhas = self.preparar(queryset.filter(pk__in=ids))
+        return {linha['id']: self.serializar_linha(linha) for linha in linhas}
+
+
+class ModalidadeValuesSerializer(ValuesSerializer):
+    serializer_class = ModalidadeSerializer
+
+
+class AlunoValuesSerializer(ValuesSerializer):
+    serializer_class = AlunoSerializer
+
+
+class ProfessorSimpleValuesSerializer(ValuesSerializer):
+    serializer_class = ProfessorSimpleSerializer
+
+
+class AulaValuesSerializer(ValuesSerializer):
+    """
+    Equivalente somente leitura do `AulaSerializer`. Uma página inteira
+    custa um número constante de queries: as aulas, as modalidades e, para
+    alunos e professores, a tabela intermediária e os objetos relacionados.
+    Relações fora de `nomes` não geram query alguma.
+    """
+    serializer_class = AulaSerializer
+    aninhados = ('modalidade', 'alunos', 'professores')
+    colunas_extras = ('modalidade_id',)
+
+    def serializar(self, linhas):
+        linhas = list(linhas)
+        aula_ids = [linha['id'] for linha in linhas]
+        relacionados = {}
+
+        if 'modalidade' in self.nomes:
+            modalidades = ModalidadeValuesSerializer().por_id(
+                Modalidade.objects.all(), {linha['modalidade_id'] for linha in linhas}
+            )
+            relacionados['modalidade'] = lambda linha: modalidades[linha['modalidade_id']]
+
+        if 'alunos' in self.nomes:
+            alunos_por_aula = agrupar_ids_m2m(Aula.alunos, aula_ids)
+            alunos = AlunoValuesSerializer().por_id(
+                Aluno.objects.all(), {pk for ids in alunos_por_aula.values() for pk in ids}
+            )
+            relacionados['alunos'] = lambda linha: [alunos[pk] for pk in alunos_por_aula[linha['id']]]
+
+        if 'professores' in self.nomes:
+            professores_por_aula = agrupar_ids_m2m(Aula.professores, aula_ids)
+            professores = ProfessorSimpleValuesSerializer().por_id(
+                CustomUser.objects.all(), {pk for ids in professores_por_aula.values() for pk in ids}
+            )
+            relacionados['professores'] = lambda linha: [professores[pk] for pk in professores_por_aula[linha['id']]]
+
+        resultado = []
+        for linha in linhas:
+            simples = self.serializar_linha(linha)
+            resultado.append({
+                nome: relacionados[nome](linha) if nome in relacionados else simples[nome]
+                for nome in self.nomes
+            })
+        return resultado
+
+
+class FastListMixin:
+    """
+    Mixin para views de listagem que atende o `list` com um
+    `ValuesSerializer`, mantendo filtros, ordenação e paginação da view.
+
+    Em listagens de dados de referência sem filtros, `tabelas_em_memoria`
+    mantém as linhas na memória do processo enquanto essas tabelas não
+    mudam (ver `cache.em_memoria`).
+    """
+    fast_serializer_class = None
+    tabelas_em_memoria = None
+
+    def get_fast_serializer(self):
+        return self.fast_serializer_class()
+
+    def linhas_em_memoria(self):
+        return em_memoria(
+            f'lista:{type(self).__name__}', self.tabelas_em_memoria,
+            lambda: list(self.fast_serializer_class().preparar(self.filter_queryset(self.get_queryset())))
+        )
+
+    def list(self, request, *args, **kwargs):
+        fast_serializer = self.get_fast_serializer()
+        if self.tabelas_em_memoria:
+            queryset = self.linhas_em_memoria()
+        else:
+            queryset = fast_serializer.preparar(self.filter_queryset(self.get_queryset()))
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(fast_serializer.serializar(page))
+
+        return Response(fast_serializer.serializar(queryset))
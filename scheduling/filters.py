@@ -1,14 +1,78 @@
+from datetime import datetime, time, timedelta
+
 import django_filters
-from .models import Aula
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Aluno, Aula, RelatorioAula
+
+
+def inicio_do_dia(data):
+    """Converte uma data no primeiro instante do dia no fuso atual."""
+    return timezone.make_aware(datetime.combine(data, time.min))
 
 
-class AulaFilter(django_filters.FilterSet):
+class DataHoraFilterMixin:
+    """
+    Filtros de intervalo de datas sobre um campo DateTimeField.
+
+    Comparar `campo__date` obriga o banco a converter cada linha e impede o
+    uso do índice; aqui a data vira um intervalo de datetimes no fuso atual.
+    """
+    campo_data_hora = 'data_hora'
+
+    def filtrar_data_inicial(self, queryset, name, value):
+        return queryset.filter(**{f'{self.campo_data_hora}__gte': inicio_do_dia(value)})
+
+    def filtrar_data_final(self, queryset, name, value):
+        return queryset.filter(**{f'{self.campo_data_hora}__lt': inicio_do_dia(value + timedelta(days=1))})
+
+
+class AulaFilter(DataHoraFilterMixin, django_filters.FilterSet):
     """
     Define os filtros que podem ser aplicados ao endpoint de listagem de Aulas.
+    `min_alunos` e `ordering` usam os contadores de matrículas e presenças.
     """
-    data_inicial = django_filters.DateFilter(field_name="data_hora__date", lookup_expr='gte')
-    data_final = django_filters.DateFilter(field_name="data_hora__date", lookup_expr='lte')
+    data_inicial = django_filters.DateFilter(method='filtrar_data_inicial')
+    data_final = django_filters.DateFilter(method='filtrar_data_final')
+    min_alunos = django_filters.NumberFilter(field_name='num_alunos', lookup_expr='gte')
+    ordering = django_filters.OrderingFilter(fields=('data_hora', 'num_alunos', 'num_presentes'))
 
     class Meta:
         model = Aula
         fields = ['status', 'modalidade', 'professores', 'alunos']
+
+
+class AlunoFilter(django_filters.FilterSet):
+    """
+    Filtros da listagem de alunos sobre os contadores de presença.
+    `inativos_desde` traz quem não tem aula concluída com presença desde a data.
+    """
+    inativos_desde = django_filters.DateFilter(method='filtrar_inativos_desde')
+    ordering = django_filters.OrderingFilter(
+        fields=('nome_completo', 'total_realizadas', 'total_ausencias', 'ultima_aula_em')
+    )
+
+    class Meta:
+        model = Aluno
+        fields = {'total_realizadas': ['gte'], 'total_ausencias': ['gte']}
+
+    def filtrar_inativos_desde(self, queryset, name, value):
+        return queryset.filter(Q(ultima_aula_em__lt=inicio_do_dia(value)) | Q(ultima_aula_em__isnull=True))
+
+
+class RelatorioAulaFilter(DataHoraFilterMixin, django_filters.FilterSet):
+    """
+    Define os filtros do endpoint de listagem de Relatórios de Aula.
+    O professor é quem validou o relatório; as datas são as da aula.
+    """
+    campo_data_hora = 'aula__data_hora'
+
+    aluno = django_filters.NumberFilter(field_name='aula__alunos')
+    professor = django_filters.NumberFilter(field_name='professor_que_validou')
+    data_inicial = django_filters.DateFilter(method='filtrar_data_inicial')
+    data_final = django_filters.DateFilter(method='filtrar_data_final')
+
+    class Meta:
+        model = RelatorioAula
+        fields = ['aula']
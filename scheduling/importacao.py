@@ -0,0 +1,303 @@
+"""
+Importação em lote de alunos e aulas a partir de planilhas CSV ou XLSX.
+
+A planilha é lida em fluxo (XLSX em modo somente leitura do openpyxl) e
+processada em lotes: cada lote é validado com uma consulta por tabela
+referenciada (modalidades, professores, alunos) e as linhas válidas são
+gravadas com `bulk_create`, inclusive as ligações ManyToMany, numa
+transação por lote. Linhas inválidas não interrompem a importação; seus
+erros são devolvidos com o número da linha na planilha.
+
+Como `bulk_create` não dispara sinais, as versões de cache, o índice de
+busca e os contadores de matrículas são atualizados aqui em cada lote.
+"""
+import codecs
+import csv
+from datetime import date, datetime
+from itertools import chain, islice
+from zipfile import BadZipFile
+
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+from django.utils import timezone
+from openpyxl import load_workbook
+from openpyxl.utils.exceptions import InvalidFileException
+
+from users.models import CustomUser
+from . import search
+from .models import Aluno, Aula, Modalidade
+from .signals import atualizar_contadores_das_matriculas, invalidar, invalidar_meses_das_aulas
+
+TAMANHO_LOTE = 500
+# Separador dos valores das colunas com vários itens (alunos, professores).
+SEPARADOR_LISTA = ';'
+FORMATOS_DATA = ('%Y-%m-%d', '%d/%m/%Y')
+FORMATOS_DATA_HORA = ('%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%d/%m/%Y %H:%M')
+
+
+def ler_planilha(arquivo, nome):
+    """
+    Retorna um iterador de (número da linha, {coluna: valor}) para um
+    arquivo binário `.csv` (UTF-8) ou `.xlsx`. Os nomes das colunas do
+    cabeçalho são normalizados para minúsculas; linhas vazias são ignoradas.
+
+    Arquivos ilegíveis geram `ValueError`: um XLSX corrompido já nesta
+    chamada, um CSV com codificação inválida quando a linha for lida.
+    """
+    extensao = nome.lower().rsplit('.', 1)[-1]
+    if extensao == 'csv':
+        return _linhas_csv(arquivo)
+    if extensao == 'xlsx':
+        return _linhas_xlsx(arquivo)
+    raise ValueError('Formato não suportado; envie um arquivo .csv ou .xlsx.')
+
+
+def _linhas_csv(arquivo):
+    try:
+        yield from _como_dicionarios(csv.reader(codecs.iterdecode(arquivo, 'utf-8-sig')))
+    except UnicodeDecodeError as exc:
+        raise ValueError('O arquivo CSV deve estar codificado em UTF-8.') from exc
+    except csv.Error as exc:
+        raise ValueError(f'Arquivo CSV inválido: {exc}.') from exc
+
+
+def _linhas_xlsx(arquivo):
+    try:
+        workbook = load_workbook(arquivo, read_only=True, data_only=True)
+    except (BadZipFile, InvalidFileException) as exc:
+        raise ValueError('O arquivo não é uma planilha .xlsx válida.') from exc
+    return _linhas_do_workbook(workbook)
+
+
+def _linhas_do_workbook(workbook):
+    try:
+        yield from _como_dicionarios(workbook.active.iter_rows(values_only=True))
+    finally:
+        workbook.close()
+
+
+def _como_dicionarios(linhas):
+    linhas = iter(linhas)
+    cabecalho = [str(coluna or '').strip().lower() for coluna in next(linhas, [])]
+    for numero, valores in enumerate(linhas, start=2):
+        if any(_texto(valor) for valor in valores):
+            yield numero, dict(zip(cabecalho, valores))
+
+
+def _texto(valor):
+    return '' if valor is None else str(valor).strip()
+
+
+def _lista(valor):
+    return [item.strip() for item in _texto(valor).split(SEPARADOR_LISTA) if item.strip()]
+
+
+def _converter(valor, tipo, formatos):
+    """Converte texto com o primeiro formato aceito; valores do XLSX já vêm tipados."""
+    if isinstance(valor, tipo):
+        return valor
+    for formato in formatos:
+        try:
+            return datetime.strptime(_texto(valor), formato)
+        except ValueError:
+            continue
+    raise ValueError
+
+
+def _ligar(descritor, pares):
+    """Grava as linhas (origem, destino) da tabela intermediária de um ManyToMany."""
+    campo = descritor.field
+    through = campo.remote_field.through
+    through.objects.bulk_create([
+        through(**{campo.m2m_column_name(): origem, campo.m2m_reverse_name(): destino})
+        for origem, destino in pares
+    ])
+
+
+class Importacao:
+    """
+    Fluxo comum das importações. As subclasses definem as colunas, a
+    validação de um lote (`preparar_lote`) e a gravação (`gravar`).
+    Com `dry_run` as linhas são apenas validadas.
+    """
+    colunas_obrigatorias = ()
+
+    def __init__(self, dry_run=False, tamanho_lote=TAMANHO_LOTE):
+        self.dry_run = dry_run
+        self.tamanho_lote = tamanho_lote
+        self.linhas_validas = 0
+        self.criados = 0
+        self.erros = []
+
+    def erro(self, numero, mensagem):
+        self.erros.append({'linha': numero, 'erro': mensagem})
+
+    def executar(self, linhas):
+        """
+        Importa as linhas de `ler_planilha` e retorna o resumo. Um
+        `ValueError` da leitura interrompe a importação, mas os lotes
+        anteriores já foram gravados: `resumo()` continua refletindo o que
+        foi criado até ali.
+        """
+        linhas = iter(linhas)
+        primeira = next(linhas, None)
+        if primeira is None:
+            return self.resumo()
+        faltando = [coluna for coluna in self.colunas_obrigatorias if coluna not in primeira[1]]
+        if faltando:
+            raise ValueError(f"Colunas obrigatórias ausentes: {', '.join(faltando)}.")
+
+        linhas = chain([primeira], linhas)
+        while lote := list(islice(linhas, self.tamanho_lote)):
+            preparados = self.preparar_lote(lote)
+            self.linhas_validas += len(preparados)
+            if preparados and not self.dry_run:
+                with transaction.atomic():
+                    self.gravar(preparados)
+                self.criados += len(preparados)
+        return self.resumo()
+
+    def resumo(self):
+        return {
+            'dry_run': self.dry_run,
+            'linhas_validas': self.linhas_validas,
+            'criados': self.criados,
+            'erros': self.erros,
+        }
+
+    def preparar_lote(self, lote):
+        raise NotImplementedError
+
+    def gravar(self, preparados):
+        raise NotImplementedError
+
+
+class ImportacaoAlunos(Importacao):
+    """
+    Colunas: nome_completo (obrigatória), email, telefone e data_criacao
+    (AAAA-MM-DD ou DD/MM/AAAA; hoje, se vazia). Emails já cadastrados ou
+    repetidos na planilha são rejeitados.
+    """
+    colunas_obrigatorias = ('nome_completo',)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.emails_vistos = set()
+
+    def preparar_lote(self, lote):
+        emails = {_texto(dados.get('email')) for _, dados in lote} - {''}
+        existentes = set(Aluno.objects.filter(email__in=emails).values_list('email', flat=True))
+
+        alunos = []
+        for numero, dados in lote:
+            nome, email, telefone = (_texto(dados.get(coluna)) for coluna in ('nome_completo', 'email', 'telefone'))
+            if not nome:
+                self.erro(numero, 'nome_completo é obrigatório.')
+                continue
+            if len(nome) > Aluno._meta.get_field('nome_completo').max_length:
+                self.erro(numero, 'nome_completo é longo demais.')
+                continue
+            if len(telefone) > Aluno._meta.get_field('telefone').max_length:
+                self.erro(numero, 'telefone é longo demais.')
+                continue
+            if email:
+                try:
+                    validate_email(email)
+                except ValidationError:
+                    self.erro(numero, f'Email inválido: {email}.')
+                    continue
+                if email in existentes or email in self.emails_vistos:
+                    self.erro(numero, f'Já existe um aluno com o email {email}.')
+                    continue
+
+            aluno = Aluno(nome_completo=nome, email=email or None, telefone=telefone or None)
+            if _texto(dados.get('data_criacao')):
+                try:
+                    data_criacao = _converter(dados['data_criacao'], date, FORMATOS_DATA)
+                except ValueError:
+                    self.erro(numero, 'data_criacao deve estar no formato AAAA-MM-DD ou DD/MM/AAAA.')
+                    continue
+                aluno.data_criacao = data_criacao.date() if isinstance(data_criacao, datetime) else data_criacao
+
+            if email:
+                self.emails_vistos.add(email)
+            alunos.append(aluno)
+        return alunos
+
+    def gravar(self, alunos):
+        Aluno.objects.bulk_create(alunos)
+        invalidar(Aluno._meta.label_lower)
+        search.indexar('aluno', [aluno.pk for aluno in alunos])
+
+
+class ImportacaoAulas(Importacao):
+    """
+    Colunas: modalidade (nome, obrigatória), data_hora (obrigatória, no
+    fuso do projeto), status (Agendada, se vazio), alunos (emails) e
+    professores (usernames), os dois últimos separados por ";".
+    """
+    colunas_obrigatorias = ('modalidade', 'data_hora')
+
+    def preparar_lote(self, lote):
+        nomes_modalidades, emails, usernames = set(), set(), set()
+        for _, dados in lote:
+            nomes_modalidades.add(_texto(dados.get('modalidade')))
+            emails.update(_lista(dados.get('alunos')))
+            usernames.update(_lista(dados.get('professores')))
+
+        modalidades = dict(Modalidade.objects.filter(nome__in=nomes_modalidades).values_list('nome', 'id'))
+        alunos = dict(Aluno.objects.filter(email__in=emails).values_list('email', 'id'))
+        professores = dict(CustomUser.objects.filter(
+            username__in=usernames, tipo__in=['admin', 'professor']
+        ).values_list('username', 'id'))
+        status_validos = dict(Aula.STATUS_AULA_CHOICES)
+
+        aulas = []
+        for numero, dados in lote:
+            nome_modalidade = _texto(dados.get('modalidade'))
+            if nome_modalidade not in modalidades:
+                self.erro(numero, f'Modalidade não encontrada: {nome_modalidade or "(vazia)"}.')
+                continue
+            try:
+                data_hora = _converter(dados.get('data_hora'), datetime, FORMATOS_DATA_HORA)
+            except ValueError:
+                self.erro(numero, 'data_hora deve estar no formato AAAA-MM-DD HH:MM ou DD/MM/AAAA HH:MM.')
+                continue
+            status_aula = _texto(dados.get('status')) or 'Agendada'
+            if status_aula not in status_validos:
+                self.erro(numero, f"Status inválido: {status_aula}. Use um de: {', '.join(status_validos)}.")
+                continue
+
+            emails_aula, usernames_aula = _lista(dados.get('alunos')), _lista(dados.get('professores'))
+            desconhecidos = [email for email in emails_aula if email not in alunos]
+            desconhecidos += [username for username in usernames_aula if username not in professores]
+            if desconhecidos:
+                self.erro(numero, f"Alunos ou professores não encontrados: {', '.join(desconhecidos)}.")
+                continue
+
+            if timezone.is_naive(data_hora):
+                data_hora = timezone.make_aware(data_hora)
+            aula = Aula(modalidade_id=modalidades[nome_modalidade], data_hora=data_hora, status=status_aula)
+            aulas.append((
+                aula,
+                list(dict.fromkeys(alunos[email] for email in emails_aula)),
+                list(dict.fromkeys(professores[username] for username in usernames_aula)),
+            ))
+        return aulas
+
+    def gravar(self, preparados):
+        Aula.objects.bulk_create([aula for aula, _, _ in preparados])
+        _ligar(Aula.alunos, [(aula.pk, pk) for aula, aluno_ids, _ in preparados for pk in aluno_ids])
+        _ligar(Aula.professores, [(aula.pk, pk) for aula, _, professor_ids in preparados for pk in professor_ids])
+        atualizar_contadores_das_matriculas(
+            [aula.pk for aula, _, _ in preparados],
+            {pk for _, aluno_ids, _ in preparados for pk in aluno_ids},
+        )
+        invalidar_meses_das_aulas([aula.data_hora for aula, _, _ in preparados])
+
+
+IMPORTACOES = {
+    'alunos': ImportacaoAlunos,
+    'aulas': ImportacaoAulas,
+}
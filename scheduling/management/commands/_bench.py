@@ -0,0 +1,72 @@
+"""
+Utilitários compartilhados pelos comandos de benchmark (`bench_*`).
+
+Os dados são criados dentro de uma transação que é desfeita ao final,
+então os benchmarks podem rodar contra o banco de desenvolvimento sem
+deixar rastros.
+"""
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from scheduling.models import Aluno, Aula, Modalidade
+from users.models import CustomUser
+
+
+class Rollback(Exception):
+    """Sinaliza o fim do benchmark para desfazer os dados criados."""
+
+
+@contextmanager
+def dados_descartaveis():
+    """Abre uma transação que é sempre desfeita ao sair do bloco."""
+    try:
+        with transaction.atomic():
+            yield
+            raise Rollback
+    except Rollback:
+        pass
+
+
+def criar_aulas(quantidade, alunos_por_aula=2, professores_por_aula=1):
+    """Cria `quantidade` aulas com alunos, professores e modalidade."""
+    modalidade = Modalidade.objects.create(nome=f"Benchmark {time.time_ns()}")
+    alunos = Aluno.objects.bulk_create(
+        Aluno(nome_completo=f"Aluno Benchmark {i}", email=f"bench{i}.{time.time_ns()}@example.com")
+        for i in range(max(alunos_por_aula * 10, 1))
+    )
+    professores = [
+        CustomUser.objects.create(username=f"bench_prof_{i}_{time.time_ns()}", tipo='professor')
+        for i in range(max(professores_por_aula * 5, 1))
+    ]
+
+    inicio = timezone.now()
+    aulas = Aula.objects.bulk_create(
+        Aula(modalidade=modalidade, data_hora=inicio + timedelta(hours=i))
+        for i in range(quantidade)
+    )
+
+    AulaAlunos = Aula.alunos.through
+    AulaProfessores = Aula.professores.through
+    AulaAlunos.objects.bulk_create(
+        AulaAlunos(aula_id=aula.id, aluno_id=alunos[(i + j) % len(alunos)].id)
+        for i, aula in enumerate(aulas) for j in range(alunos_por_aula)
+    )
+    AulaProfessores.objects.bulk_create(
+        AulaProfessores(aula_id=aula.id, customuser_id=professores[(i + j) % len(professores)].id)
+        for i, aula in enumerate(aulas) for j in range(professores_por_aula)
+    )
+    return aulas
+
+
+def medir(funcao, repeticoes):
+    """Executa `funcao` `repeticoes` vezes e retorna o melhor tempo em ms."""
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    return min(tempos)
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from scheduling.fast_serializers import AulaValuesSerializer
+from scheduling.models import Aula
+from scheduling.serializers import AulaSerializer
+
+from ._bench import criar_aulas, dados_descartaveis, medir
+
+
+class Command(BaseCommand):
+    help = "Compara o AulaSerializer com o AulaValuesSerializer em uma página de aulas."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--aulas', type=int, default=1000)
+        parser.add_argument('--repeticoes', type=int, default=5)
+
+    def handle(self, *args, **options):
+        quantidade, repeticoes = options['aulas'], options['repeticoes']
+
+        with dados_descartaveis():
+            criar_aulas(quantidade)
+            aulas = Aula.objects.order_by('-data_hora')[:quantidade]
+
+            def serializer_padrao():
+                queryset = aulas.select_related('modalidade').prefetch_related('alunos', 'professores')
+                return AulaSerializer(queryset, many=True).data
+
+            def serializer_rapido():
+                fast_serializer = AulaValuesSerializer()
+                return fast_serializer.serializar(fast_serializer.preparar(aulas))
+
+            if JSONRenderer().render(serializer_padrao()) != JSONRenderer().render(serializer_rapido()):
+                self.stderr.write(self.style.ERROR("As saídas dos serializers são diferentes."))
+
+            tempo_padrao = medir(serializer_padrao, repeticoes)
+            tempo_rapido = medir(serializer_rapido, repeticoes)
+
+        self.stdout.write(f"{quantidade} aulas")
+        self.stdout.write(f"AulaSerializer (com prefetch): {tempo_padrao:.2f} ms")
+        self.stdout.write(f"AulaValuesSerializer:          {tempo_rapido:.2f} ms")
+        self.stdout.write(self.style.SUCCESS(f"Ganho: {tempo_padrao / tempo_rapido:.1f}x"))
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from config.renderers import ORJSONRenderer
+from scheduling.models import Aula
+from scheduling.serializers import AulaSerializer
+
+from ._bench import criar_aulas, dados_descartaveis, medir
+
+
+class Command(BaseCommand):
+    help = "Compara o tempo de renderização JSON (stdlib x orjson) de uma página de aulas."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--aulas', type=int, default=1000)
+        parser.add_argument('--repeticoes', type=int, default=20)
+
+    def handle(self, *args, **options):
+        with dados_descartaveis():
+            criar_aulas(options['aulas'])
+            aulas = Aula.objects.select_related('modalidade').prefetch_related('alunos', 'professores')
+            data = AulaSerializer(aulas[:options['aulas']], many=True).data
+
+        stdlib = JSONRenderer().render(data)
+        rapido = ORJSONRenderer().render(data)
+        if stdlib != rapido:
+            self.stderr.write(self.style.ERROR("As saídas dos renderers são diferentes."))
+
+        repeticoes = options['repeticoes']
+        tempo_stdlib = medir(lambda: JSONRenderer().render(data), repeticoes)
+        tempo_rapido = medir(lambda: ORJSONRenderer().render(data), repeticoes)
+
+        self.stdout.write(f"{options['aulas']} aulas, {len(stdlib)} bytes")
+        self.stdout.write(f"JSONRenderer (stdlib): {tempo_stdlib:.2f} ms")
+        self.stdout.write(f"ORJSONRenderer:        {tempo_rapido:.2f} ms")
+        self.stdout.write(self.style.SUCCESS(f"Ganho: {tempo_stdlib / tempo_rapido:.1f}x"))
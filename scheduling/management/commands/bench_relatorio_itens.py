@@ -0,0 +1,69 @@
+from django.db import connection
+from django.core.management.base import BaseCommand
+from django.test.utils import CaptureQueriesContext
+
+from scheduling.models import RelatorioAula
+from scheduling.serializers import RelatorioAulaSerializer
+
+from ._bench import criar_aulas, dados_descartaveis, medir
+
+
+class Command(BaseCommand):
+    help = "Mede a gravação aninhada de um relatório de aula com muitos itens."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--itens', type=int, default=50)
+        parser.add_argument('--repeticoes', type=int, default=5)
+
+    def handle(self, *args, **options):
+        quantidade, repeticoes = options['itens'], options['repeticoes']
+        por_tipo = max(quantidade // 3, 1)
+
+        def itens(prefixo, ids=()):
+            dados = [{"descricao": f"{prefixo} {i}", "bpm": "100", "duracao_min": 5} for i in range(por_tipo)]
+            for item, pk in zip(dados, ids):
+                item['id'] = pk
+            return dados
+
+        with dados_descartaveis():
+            aulas = criar_aulas(repeticoes * 2)
+            livres = iter(aulas)
+
+            def criar():
+                payload = {
+                    "aula": next(livres).pk,
+                    "itens_rudimentos": itens("Rudimento"),
+                    "itens_ritmo": itens("Ritmo"),
+                    "itens_viradas": itens("Virada"),
+                }
+                serializer = RelatorioAulaSerializer(data=payload)
+                serializer.is_valid(raise_exception=True)
+                return serializer.save()
+
+            with CaptureQueriesContext(connection) as queries_criacao:
+                relatorio = criar()
+            tempo_criacao = medir(criar, repeticoes)
+
+            def atualizar():
+                # Metade dos itens é atualizada, a outra metade substituída.
+                ids = {
+                    nome: list(getattr(relatorio, nome).values_list('id', flat=True))[:por_tipo // 2]
+                    for nome in RelatorioAulaSerializer.campos_itens
+                }
+                payload = {
+                    "aula": relatorio.aula_id,
+                    "itens_rudimentos": itens("Rudimento revisado", ids['itens_rudimentos']),
+                    "itens_ritmo": itens("Ritmo revisado", ids['itens_ritmo']),
+                    "itens_viradas": itens("Virada revisada", ids['itens_viradas']),
+                }
+                serializer = RelatorioAulaSerializer(RelatorioAula.objects.get(pk=relatorio.pk), data=payload)
+                serializer.is_valid(raise_exception=True)
+                serializer.save()
+
+            with CaptureQueriesContext(connection) as queries_atualizacao:
+                atualizar()
+            tempo_atualizacao = medir(atualizar, repeticoes)
+
+        self.stdout.write(f"Relatório com {por_tipo * 3} itens")
+        self.stdout.write(f"Criação:     {tempo_criacao:.2f} ms, {len(queries_criacao)} queries")
+        self.stdout.write(f"Atualização: {tempo_atualizacao:.2f} ms, {len(queries_atualizacao)} queries")
@@ -0,0 +1,66 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from scheduling.models import Aluno, Aula, PresencaAluno, atualizar_contadores
+from scheduling.signals import invalidar, invalidar_meses_das_aulas
+
+
+STATUS_FINAIS = [valor for valor, _ in Aula.STATUS_AULA_CHOICES if valor != 'Agendada']
+
+
+class Command(BaseCommand):
+    help = (
+        "Muda o status das aulas que continuam agendadas depois da tolerância. "
+        "Pensado para rodar periodicamente."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--status', choices=STATUS_FINAIS, default=settings.AULA_VENCIDA_STATUS)
+        parser.add_argument('--tolerancia-horas', type=int, default=settings.AULA_VENCIDA_TOLERANCIA_HORAS)
+        parser.add_argument('--lote', type=int, default=1000, help="Número de aulas atualizadas por vez.")
+        parser.add_argument('--dry-run', action='store_true', help="Apenas conta as aulas vencidas.")
+
+    def handle(self, *args, **options):
+        # O padrão vem de settings e não passa pela validação do argparse.
+        if options['status'] not in STATUS_FINAIS:
+            raise CommandError(f"Status inválido: {options['status']}. Use um de: {', '.join(STATUS_FINAIS)}.")
+        limite = timezone.now() - timedelta(hours=options['tolerancia_horas'])
+        vencidas = Aula.objects.filter(status='Agendada', data_hora__lt=limite)
+        if options['dry_run']:
+            self.stdout.write(f"{vencidas.count()} aulas vencidas seriam marcadas como {options['status']}.")
+            return
+
+        # Os lotes seguem a ordem dos ids (paginação por chave) e só visitam
+        # aulas vencidas. O filtro de status se repete no próprio UPDATE: uma
+        # aula finalizada pela API enquanto o comando roda deixa de casar com
+        # o filtro e não é sobrescrita.
+        ultimo = 0
+        total = 0
+        while True:
+            linhas = list(
+                vencidas.filter(pk__gt=ultimo).order_by('pk').values_list('pk', 'data_hora')[:options['lote']]
+            )
+            if not linhas:
+                break
+            ultimo = linhas[-1][0]
+            lote = vencidas.filter(pk__in=[pk for pk, _ in linhas])
+            # Só alunos com presença marcada têm totais afetados pelo status.
+            alunos = list(PresencaAluno.objects.filter(
+                aula__in=lote, status__isnull=False
+            ).values_list('aluno_id', flat=True).distinct())
+            with transaction.atomic():
+                atualizadas = lote.update(status=options['status'])
+                atualizar_contadores(aluno_ids=alunos)
+            if atualizadas:
+                # update() não dispara sinais.
+                invalidar(Aula._meta.label_lower)
+                invalidar_meses_das_aulas([data_hora for _, data_hora in linhas])
+            if alunos:
+                invalidar(Aluno._meta.label_lower)
+            total += atualizadas
+
+        self.stdout.write(self.style.SUCCESS(f"{total} aulas vencidas marcadas como {options['status']}."))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from scheduling.importacao import IMPORTACOES, TAMANHO_LOTE, ler_planilha
+
+
+class Command(BaseCommand):
+    help = "Importa alunos ou aulas de uma planilha CSV ou XLSX."
+
+    def add_arguments(self, parser):
+        parser.add_argument('tipo', choices=list(IMPORTACOES))
+        parser.add_argument('arquivo')
+        parser.add_argument('--dry-run', action='store_true', help="Apenas valida a planilha, sem gravar.")
+        parser.add_argument('--lote', type=int, default=TAMANHO_LOTE)
+
+    def handle(self, *args, **options):
+        importacao = IMPORTACOES[options['tipo']](dry_run=options['dry_run'], tamanho_lote=options['lote'])
+        try:
+            with open(options['arquivo'], 'rb') as arquivo:
+                resumo = importacao.executar(ler_planilha(arquivo, options['arquivo']))
+        except OSError as exc:
+            raise CommandError(str(exc))
+        except ValueError as exc:
+            # Os lotes lidos antes do erro já foram gravados.
+            self.relatar(importacao.resumo())
+            raise CommandError(str(exc))
+        self.relatar(resumo)
+
+    def relatar(self, resumo):
+        for erro in resumo['erros']:
+            self.stderr.write(f"Linha {erro['linha']}: {erro['erro']}")
+        acao = "validadas" if resumo['dry_run'] else f"válidas, {resumo['criados']} registros criados"
+        self.stdout.write(f"{resumo['linhas_validas']} linhas {acao}; {len(resumo['erros'])} com erro.")
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from scheduling.models import ItemRitmo, ItemRudimento, ItemVirada, normalizar_bpm
+
+
+class Command(BaseCommand):
+    help = "Preenche o BPM numérico (bpm_valor) dos itens de relatório a partir do texto de bpm."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        lote = options['lote']
+        for model in (ItemRudimento, ItemRitmo, ItemVirada):
+            alterados, total = [], 0
+            for item in model.objects.only('id', 'bpm', 'bpm_valor').order_by('pk').iterator(chunk_size=lote):
+                valor = normalizar_bpm(item.bpm)
+                if valor != item.bpm_valor:
+                    item.bpm_valor = valor
+                    alterados.append(item)
+                if len(alterados) >= lote:
+                    model.objects.bulk_update(alterados, ['bpm_valor'])
+                    total += len(alterados)
+                    alterados = []
+            model.objects.bulk_update(alterados, ['bpm_valor'])
+            total += len(alterados)
+            self.stdout.write(f"{model._meta.verbose_name}: {total} itens atualizados.")
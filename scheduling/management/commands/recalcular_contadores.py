@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+
+from scheduling.models import Aluno, Aula, atualizar_contadores
+from scheduling.signals import invalidar
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcula os contadores de matrículas e presenças de aulas e alunos. "
+        "Use para corrigir divergências, como após gravações feitas fora do ORM."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=1000, help="Tamanho de cada faixa de ids recalculada.")
+
+    def handle(self, *args, **options):
+        lote = options['lote']
+        for model, parametro in ((Aula, 'aula_ids'), (Aluno, 'aluno_ids')):
+            ultimo = model.objects.aggregate(ultimo=Max('id'))['ultimo'] or 0
+            for inicio in range(1, ultimo + 1, lote):
+                ids = model.objects.filter(pk__gte=inicio, pk__lt=inicio + lote).values('pk')
+                with transaction.atomic():
+                    atualizar_contadores(**{parametro: ids})
+            invalidar(model._meta.label_lower)
+            self.stdout.write(f"{model._meta.verbose_name_plural}: contadores recalculados.")
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from scheduling import search
+
+
+class Command(BaseCommand):
+    help = "Reconstrói o índice da busca textual a partir dos alunos e relatórios."
+
+    def handle(self, *args, **options):
+        if not search.disponivel():
+            self.stderr.write("A busca textual só está disponível no SQLite.")
+            return
+        search.reindexar_tudo()
+        self.stdout.write(self.style.SUCCESS("Índice de busca reconstruído."))
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scheduling', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='aula',
+            name='data_hora',
+            field=models.DateTimeField(db_index=True, verbose_name='Data e Horário'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+from django.db import migrations
+
+# Índice FTS5 da busca textual (ver scheduling/search.py). Os documentos
+# usam rowid = id * 10 + tipo (0 = aluno, 1 = relatório).
+
+CRIAR_INDICE = """
+CREATE VIRTUAL TABLE IF NOT EXISTS scheduling_busca
+USING fts5(titulo, conteudo, tokenize = 'unicode61 remove_diacritics 2')
+"""
+
+POPULAR_ALUNOS = """
+INSERT INTO scheduling_busca (rowid, titulo, conteudo)
+SELECT a.id * 10, a.nome_completo, COALESCE(a.email, '')
+FROM scheduling_aluno a
+"""
+
+POPULAR_RELATORIOS = """
+INSERT INTO scheduling_busca (rowid, titulo, conteudo)
+SELECT r.id * 10 + 1, '',
+    COALESCE(r.conteudo_teorico, '') || ' ' || COALESCE(r.observacoes_teoria, '') || ' ' ||
+    COALESCE(r.repertorio_musicas, '') || ' ' || COALESCE(r.observacoes_repertorio, '') || ' ' ||
+    COALESCE(r.observacoes_gerais, '') || ' ' ||
+    COALESCE((SELECT group_concat(i.descricao, ' ') FROM scheduling_itemrudimento i WHERE i.relatorio_id = r.id), '') || ' ' ||
+    COALESCE((SELECT group_concat(i.descricao, ' ') FROM scheduling_itemritmo i WHERE i.relatorio_id = r.id), '') || ' ' ||
+    COALESCE((SELECT group_concat(i.descricao, ' ') FROM scheduling_itemvirada i WHERE i.relatorio_id = r.id), '')
+FROM scheduling_relatorioaula r
+"""
+
+
+def criar_indice(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in (CRIAR_INDICE, POPULAR_ALUNOS, POPULAR_RELATORIOS):
+        schema_editor.execute(sql)
+
+
+def remover_indice(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute("DROP TABLE IF EXISTS scheduling_busca")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scheduling', '0002_alter_aula_data_hora'),
+    ]
+
+    operations = [
+        migrations.RunPython(criar_indice, remover_indice),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scheduling', '0003_busca_fts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='itemritmo',
+            name='bpm_valor',
+            field=models.PositiveSmallIntegerField(blank=True, editable=False, null=True, verbose_name='BPM (numérico)'),
+        ),
+        migrations.AddField(
+            model_name='itemrudimento',
+            name='bpm_valor',
+            field=models.PositiveSmallIntegerField(blank=True, editable=False, null=True, verbose_name='BPM (numérico)'),
+        ),
+        migrations.AddField(
+            model_name='itemvirada',
+            name='bpm_valor',
+            field=models.PositiveSmallIntegerField(blank=True, editable=False, null=True, verbose_name='BPM (numérico)'),
+        ),
+        migrations.AddIndex(
+            model_name='itemritmo',
+            index=models.Index(condition=models.Q(('bpm_valor__isnull', False)), fields=['relatorio', 'bpm_valor'], name='scheduling_ritmo_bpm_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='itemrudimento',
+            index=models.Index(condition=models.Q(('bpm_valor__isnull', False)), fields=['relatorio', 'bpm_valor'], name='scheduling_rudimento_bpm_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='itemvirada',
+            index=models.Index(condition=models.Q(('bpm_valor__isnull', False)), fields=['relatorio', 'bpm_valor'], name='scheduling_virada_bpm_idx'),
+        ),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:08
+
+import unicodedata
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def canonicalizar_exercicio(texto):
+    """
+    Cópia de `scheduling.models.canonicalizar_exercicio` como era nesta
+    migração, para que ela não mude se a função do modelo mudar.
+    """
+    decomposto = unicodedata.normalize('NFKD', texto or '')
+    sem_acentos = ''.join(c for c in decomposto if not unicodedata.combining(c))
+    return ' '.join(sem_acentos.casefold().split())[:255].rstrip()
+
+
+def catalogar_exercicios(apps, schema_editor):
+    """Cria o catálogo a partir das descrições existentes e liga os itens."""
+    Exercicio = apps.get_model('scheduling', 'Exercicio')
+    modelos = [apps.get_model('scheduling', nome) for nome in ('ItemRudimento', 'ItemRitmo', 'ItemVirada')]
+
+    descricoes = {}
+    for model in modelos:
+        descricoes[model] = set(model.objects.values_list('descricao', flat=True).distinct())
+
+    nomes = {}
+    for descricao in sorted(set().union(*descricoes.values())):
+        canonico = canonicalizar_exercicio(descricao)
+        if canonico:
+            nomes.setdefault(canonico, ' '.join(descricao.split()))
+    Exercicio.objects.bulk_create(Exercicio(nome=nome, nome_canonico=canonico) for canonico, nome in nomes.items())
+    exercicios = dict(Exercicio.objects.values_list('nome_canonico', 'id'))
+
+    for model, descricoes_do_modelo in descricoes.items():
+        for descricao in descricoes_do_modelo:
+            canonico = canonicalizar_exercicio(descricao)
+            if canonico:
+                model.objects.filter(descricao=descricao).update(exercicio_id=exercicios[canonico])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scheduling', '0004_item_bpm_valor'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Exercicio',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nome', models.CharField(max_length=255)),
+                ('nome_canonico', models.CharField(max_length=255, unique=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='itemritmo',
+            name='exercicio',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='scheduling.exercicio'),
+        ),
+        migrations.AddField(
+            model_name='itemrudimento',
+            name='exercicio',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='scheduling.exercicio'),
+        ),
+        migrations.AddField(
+            model_name='itemvirada',
+            name='exercicio',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='scheduling.exercicio'),
+        ),
+        migrations.RunPython(catalogar_exercicios, migrations.RunPython.noop),
+    ]
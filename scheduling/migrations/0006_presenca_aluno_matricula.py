@@ -0,0 +1,85 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:32
+
+from django.db import migrations, models
+from django.db.models import Exists, OuterRef
+
+
+def _tabela_automatica(apps):
+    """Tabela intermediária criada pelo Django para `Aula.alunos` até aqui."""
+    return apps.get_model('scheduling', 'Aula')._meta.get_field('alunos').remote_field.through
+
+
+def unificar_matriculas(apps, schema_editor):
+    """
+    Cria uma presença sem status para cada matrícula que ainda não tinha
+    presença registrada e remove a tabela automática. Presenças de alunos
+    que não estão mais matriculados (removidos da aula depois da chamada)
+    nunca entraram nas contagens e são apagadas, em vez de virarem matrícula.
+    """
+    PresencaAluno = apps.get_model('scheduling', 'PresencaAluno')
+    AulaAlunos = _tabela_automatica(apps)
+
+    PresencaAluno.objects.exclude(Exists(
+        AulaAlunos.objects.filter(aula_id=OuterRef('aula_id'), aluno_id=OuterRef('aluno_id'))
+    )).delete()
+    existentes = set(PresencaAluno.objects.values_list('aula_id', 'aluno_id'))
+    PresencaAluno.objects.bulk_create(
+        (
+            PresencaAluno(aula_id=aula_id, aluno_id=aluno_id, status=None)
+            for aula_id, aluno_id in AulaAlunos.objects.values_list('aula_id', 'aluno_id').iterator()
+            if (aula_id, aluno_id) not in existentes
+        ),
+        batch_size=1000,
+    )
+    schema_editor.delete_model(AulaAlunos)
+
+
+def separar_matriculas(apps, schema_editor):
+    """
+    Recria a tabela automática com todas as matrículas, inclusive as sem
+    presença registrada, que continuam como linhas de `aula_alunos`. Só
+    então as presenças sem status saem de PresencaAluno, cujo status volta
+    a ser obrigatório. As presenças órfãs apagadas na ida não voltam.
+    """
+    PresencaAluno = apps.get_model('scheduling', 'PresencaAluno')
+    AulaAlunos = _tabela_automatica(apps)
+
+    schema_editor.create_model(AulaAlunos)
+    AulaAlunos.objects.bulk_create(
+        (
+            AulaAlunos(aula_id=aula_id, aluno_id=aluno_id)
+            for aula_id, aluno_id in PresencaAluno.objects.values_list('aula_id', 'aluno_id').iterator()
+        ),
+        batch_size=1000,
+    )
+    PresencaAluno.objects.filter(status__isnull=True).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scheduling', '0005_exercicio'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='presencaaluno',
+            name='status',
+            field=models.CharField(blank=True, choices=[('presente', 'Presente'), ('ausente', 'Ausente')], max_length=10, null=True),
+        ),
+        migrations.RunPython(unificar_matriculas, separar_matriculas),
+        # O banco já foi ajustado acima; aqui só o estado dos modelos muda.
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='aula',
+                    name='alunos',
+                    field=models.ManyToManyField(blank=True, related_name='aulas', through='scheduling.PresencaAluno', to='scheduling.aluno'),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='presencaaluno',
+            index=models.Index(fields=['aluno', 'status'], name='presenca_aluno_status_idx'),
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:37
+
+from django.db import migrations, models
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+# Cópia de `models.STATUS_AULA_CONCLUIDA` como era nesta migração.
+STATUS_AULA_CONCLUIDA = ('Realizada', 'Aluno Ausente')
+
+
+def _contagem(matriculas, grupo):
+    return Coalesce(Subquery(matriculas.values(grupo).annotate(total=Count('id')).values('total')[:1]), 0)
+
+
+def preencher_contadores(apps, schema_editor):
+    """
+    Preenche os contadores das linhas existentes com os mesmos UPDATEs de
+    `models.atualizar_contadores`, uma vez por tabela.
+    """
+    Aula = apps.get_model('scheduling', 'Aula')
+    Aluno = apps.get_model('scheduling', 'Aluno')
+    PresencaAluno = apps.get_model('scheduling', 'PresencaAluno')
+
+    matriculas = PresencaAluno.objects.filter(aula=OuterRef('pk')).order_by()
+    Aula.objects.update(
+        num_alunos=_contagem(matriculas, 'aula'),
+        num_presentes=_contagem(matriculas.filter(status='presente'), 'aula'),
+    )
+    concluidas = PresencaAluno.objects.filter(aluno=OuterRef('pk'), aula__status__in=STATUS_AULA_CONCLUIDA).order_by()
+    presentes = concluidas.filter(status='presente')
+    Aluno.objects.update(
+        total_realizadas=_contagem(presentes, 'aluno'),
+        total_ausencias=_contagem(concluidas.filter(status='ausente'), 'aluno'),
+        ultima_aula_em=Subquery(
+            presentes.values('aluno').annotate(ultima=Max('aula__data_hora')).values('ultima')[:1]
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scheduling', '0006_presenca_aluno_matricula'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='aluno',
+            name='total_ausencias',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='aluno',
+            name='total_realizadas',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='aluno',
+            name='ultima_aula_em',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='aula',
+            name='num_alunos',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='aula',
+            name='num_presentes',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(preencher_contadores, migrations.RunPython.noop),
+    ]
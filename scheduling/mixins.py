@@ -0,0 +1,163 @@
+from urllib.parse import urlencode
+
+from django.core.cache import cache
+from rest_framework import permissions, status
+from rest_framework.response import Response
+from rest_framework.serializers import ListSerializer
+
+from .cache import chave_versionada, registrar_metrica
+
+
+class SparseFieldsetMixin:
+    """
+    Mixin de viewset que permite ao cliente escolher os campos da resposta.
+
+    - `?fields=id,data_hora,status` mantém apenas os campos listados.
+    - `?expand=alunos` escolhe quais campos de `expandable_fields` (relações
+      aninhadas ou KPIs calculados) entram na resposta. Sem `expand`, esses
+      campos seguem `fields`; sem nenhum dos dois parâmetros, nada muda.
+
+    `expandable_fields` mapeia cada campo expansível para os lookups que ele
+    exige na queryset. Lookups de ForeignKey/OneToOne viram `select_related`
+    e os demais `prefetch_related`, aplicados só quando o campo é incluído.
+    Tudo isso vale apenas para leituras; escritas seguem o comportamento padrão.
+    """
+    expandable_fields = {}
+
+    def _get_param_set(self, nome):
+        valor = self.request.query_params.get(nome) if self.request else None
+        if valor is None:
+            return None
+        return {item.strip() for item in valor.split(',') if item.strip()}
+
+    def _sparse_params(self):
+        if self.request is None or self.request.method not in permissions.SAFE_METHODS:
+            return None, None
+        return self._get_param_set('fields'), self._get_param_set('expand')
+
+    def is_field_included(self, nome):
+        """Diz se o campo `nome` deve aparecer na resposta desta requisição."""
+        fields, expand = self._sparse_params()
+        if nome in self.expandable_fields and expand is not None:
+            return nome in expand or (fields is not None and nome in fields)
+        return fields is None or nome in fields
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request is None or self.request.method not in permissions.SAFE_METHODS:
+            return queryset
+        opts = queryset.model._meta
+
+        for nome, lookups in self.expandable_fields.items():
+            if not self.is_field_included(nome):
+                continue
+            for lookup in lookups:
+                campo = opts.get_field(lookup.split('__')[0])
+                if campo.concrete and (campo.many_to_one or campo.one_to_one):
+                    queryset = queryset.select_related(lookup)
+                else:
+                    queryset = queryset.prefetch_related(lookup)
+        return queryset
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        alvo = serializer.child if isinstance(serializer, ListSerializer) else serializer
+
+        for nome in list(alvo.fields):
+            if not alvo.fields[nome].write_only and not self.is_field_included(nome):
+                alvo.fields.pop(nome)
+        return serializer
+
+    def get_fast_serializer(self):
+        nomes = self.fast_serializer_class.serializer_class().fields
+        return self.fast_serializer_class(
+            nomes=[nome for nome in nomes if self.is_field_included(nome)]
+        )
+
+
+class BatchRetrieveMixin:
+    """
+    Mixin de viewset que aceita `?ids=1,2,3` na listagem e devolve, sem
+    paginação, os objetos pedidos com a mesma representação do `retrieve`.
+
+    A lista é serializada de uma vez (`many=True`), então serializers de
+    detalhe com `list_serializer_class` calculam seus KPIs em lote.
+    """
+    batch_max_ids = 100
+
+    @property
+    def is_batch_request(self):
+        return self.action == 'list' and 'ids' in self.request.query_params
+
+    def list(self, request, *args, **kwargs):
+        if not self.is_batch_request:
+            return super().list(request, *args, **kwargs)
+
+        try:
+            ids = list(dict.fromkeys(
+                int(item) for item in request.query_params['ids'].split(',') if item.strip()
+            ))
+        except ValueError:
+            return Response(
+                {'error': 'O parâmetro ids deve ser uma lista de números separados por vírgula.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        if len(ids) > self.batch_max_ids:
+            return Response(
+                {'error': f'No máximo {self.batch_max_ids} ids podem ser buscados por requisição.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        objetos = {obj.pk: obj for obj in self.filter_queryset(self.get_queryset()).filter(pk__in=ids)}
+        serializer = self.get_serializer([objetos[pk] for pk in ids if pk in objetos], many=True)
+        return Response(serializer.data)
+
+
+class RespostaEmCacheMixin:
+    """
+    Mixin de view de listagem que guarda a resposta do `list` no cache
+    versionado (ver `cache.py`).
+
+    A chave reúne as versões de `tabelas_cache_resposta`, o host, os
+    parâmetros da URL normalizados (ordenados e sem valores vazios, então
+    `?b=2&a=1` e `?a=1&b=2&c=` são a mesma consulta) e, quando
+    `cache_por_usuario` é verdadeiro, o usuário. Qualquer alteração nessas
+    tabelas muda a versão e invalida todas as respostas de uma vez.
+    Acertos e falhas são contados com `registrar_metrica` e informados no
+    cabeçalho `X-Cache`.
+    """
+    tabelas_cache_resposta = ()
+    cache_por_usuario = False
+    timeout_cache_resposta = 5 * 60
+
+    @classmethod
+    def nome_cache_resposta(cls):
+        return f'resposta:{cls.__name__}'
+
+    def chave_cache_resposta(self, request):
+        parametros = urlencode(sorted(
+            (nome, valor)
+            for nome in request.query_params
+            for valor in request.query_params.getlist(nome)
+            if valor != ''
+        ))
+        escopo = request.user.pk if self.cache_por_usuario else '*'
+        return chave_versionada(
+            self.nome_cache_resposta(), self.tabelas_cache_resposta,
+            escopo, request.get_host(), parametros,
+        )
+
+    def list(self, request, *args, **kwargs):
+        chave = self.chave_cache_resposta(request)
+        dados = cache.get(chave)
+        if dados is not None:
+            registrar_metrica(self.nome_cache_resposta(), 'hit')
+            return Response(dados, headers={'X-Cache': 'HIT'})
+
+        response = super().list(request, *args, **kwargs)
+        registrar_metrica(self.nome_cache_resposta(), 'miss')
+        if response.status_code == status.HTTP_200_OK:
+            cache.set(chave, response.data, timeout=self.timeout_cache_resposta)
+        response['X-Cache'] = 'MISS'
+        return response
@@ -1,7 +1,45 @@
+import re
+import unicodedata
+
 from django.conf import settings
 from django.db import models
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 
+# Faixa de valores aceitos como andamento ao normalizar o campo `bpm`.
+BPM_MINIMO, BPM_MAXIMO = 20, 400
+
+
+def normalizar_bpm(texto):
+    """
+    Extrai o andamento numérico de um `bpm` em texto livre ("80", "80 bpm",
+    "♩=90", "80-100"). Em faixas vale o maior valor, que é o andamento
+    alcançado no exercício. Números fora de uma faixa plausível de BPM
+    (como o "2" de "2x 80") são ignorados. Retorna None se não houver valor.
+    """
+    valores = [
+        int(numero) for numero in re.findall(r'\d+', texto or '')
+        if BPM_MINIMO <= int(numero) <= BPM_MAXIMO
+    ]
+    return max(valores) if valores else None
+
+
+class ContadoresMixin:
+    """
+    Impede que o `save()` de uma instância carregada antes sobrescreva os
+    contadores de `campos_contadores`, que só `atualizar_contadores` grava.
+    """
+    campos_contadores = ()
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                campo.name for campo in self._meta.concrete_fields
+                if not campo.primary_key and campo.name not in self.campos_contadores
+            ]
+        super().save(*args, **kwargs)
+
 
 class Modalidade(models.Model):
     """
@@ -13,7 +51,7 @@ class Modalidade(models.Model):
         return self.nome
 
 
-class Aluno(models.Model):
+class Aluno(ContadoresMixin, models.Model):
     """
     Armazena o perfil de um aluno com seus dados de matrícula.
     Este modelo é separado da conta de usuário (CustomUser) para maior flexibilidade.
@@ -25,12 +63,17 @@ class Aluno(models.Model):
         default=timezone.now,
         verbose_name="Data de Criação/Matrícula"
     )
+    # Contadores mantidos por `atualizar_contadores`.
+    campos_contadores = ('total_realizadas', 'total_ausencias', 'ultima_aula_em')
+    total_realizadas = models.PositiveIntegerField(default=0, editable=False)
+    total_ausencias = models.PositiveIntegerField(default=0, editable=False)
+    ultima_aula_em = models.DateTimeField(null=True, editable=False)
 
     def __str__(self):
         return self.nome_completo
 
 
-class Aula(models.Model):
+class Aula(ContadoresMixin, models.Model):
     STATUS_AULA_CHOICES = (
         ("Agendada", "Agendada"),
         ("Realizada", "Realizada"),
@@ -40,6 +83,7 @@ class Aula(models.Model):
 
     alunos = models.ManyToManyField(
         "Aluno",
+        through="PresencaAluno",
         blank=True,
         related_name="aulas"
     )
@@ -56,30 +100,98 @@ class Aula(models.Model):
         on_delete=models.PROTECT,
         related_name="aulas"
     )
-    data_hora = models.DateTimeField(verbose_name="Data e Horário")
+    data_hora = models.DateTimeField(verbose_name="Data e Horário", db_index=True)
     status = models.CharField(
         max_length=20, choices=STATUS_AULA_CHOICES, default="Agendada"
     )
+    # Contadores mantidos por `atualizar_contadores`.
+    campos_contadores = ('num_alunos', 'num_presentes')
+    num_alunos = models.PositiveIntegerField(default=0, editable=False)
+    num_presentes = models.PositiveIntegerField(default=0, editable=False)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Data e status carregados do banco, para que os sinais invalidem
+        # também o mês de origem quando a aula é remarcada e só recalculem
+        # os contadores dos alunos quando algo que os afeta muda (ver signals.py).
+        instance._data_hora_original = instance.__dict__.get('data_hora')
+        instance._status_original = instance.__dict__.get('status')
+        return instance
 
     def __str__(self):
-        nomes_alunos = ", ".join([aluno.nome_completo for aluno in self.alunos.all()])
-        return f"{self.modalidade.nome} com {nomes_alunos or 'ninguém'} em {self.data_hora.strftime('%d/%m/%Y %H:%M')}"
+        # Os nomes dos alunos só entram quando já foram carregados com
+        # prefetch_related; do contrário vale o contador, sem query por aula.
+        if 'alunos' in getattr(self, '_prefetched_objects_cache', {}):
+            participantes = ", ".join([aluno.nome_completo for aluno in self.alunos.all()])
+        else:
+            participantes = f"{self.num_alunos} aluno(s)" if self.num_alunos else ''
+        return f"{self.modalidade.nome} com {participantes or 'ninguém'} em {self.data_hora.strftime('%d/%m/%Y %H:%M')}"
 
 
 class PresencaAluno(models.Model):
+    """
+    Matrícula de um aluno em uma aula (tabela intermediária de `Aula.alunos`)
+    com o status da sua presença, vazio enquanto a presença não é marcada.
+    Matrícula e presença vêm da mesma linha, sem junção entre tabelas.
+    """
     STATUS_CHOICES = (
         ('presente', 'Presente'),
         ('ausente', 'Ausente'),
     )
     aula = models.ForeignKey(Aula, on_delete=models.CASCADE, related_name="presencas_alunos")
     aluno = models.ForeignKey(Aluno, on_delete=models.CASCADE, related_name="presencas")
-    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='presente')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, null=True, blank=True)
 
     class Meta:
         unique_together = ('aula', 'aluno')
+        indexes = [
+            models.Index(fields=['aluno', 'status'], name='presenca_aluno_status_idx'),
+        ]
 
     def __str__(self):
-        return f"{self.aluno.nome_completo} - {self.get_status_display()} em {self.aula}"
+        return f"{self.aluno.nome_completo} - {self.get_status_display() or 'Sem presença'} em {self.aula}"
+
+
+# Status de aula em que a presença do aluno conta nos seus totais.
+STATUS_AULA_CONCLUIDA = ('Realizada', 'Aluno Ausente')
+
+
+def _contagem(matriculas, grupo):
+    return Coalesce(Subquery(matriculas.values(grupo).annotate(total=Count('id')).values('total')[:1]), 0)
+
+
+def atualizar_contadores(aula_ids=None, aluno_ids=None):
+    """
+    Recalcula a partir das matrículas os contadores das aulas e dos alunos
+    informados (ids ou uma queryset de ids), com um UPDATE por tabela.
+    Recalcular em vez de incrementar torna a operação idempotente e segura
+    contra gravações concorrentes. `update()` não dispara sinais: quem chama
+    invalida o cache.
+
+    - Aula: `num_alunos` (matriculados) e `num_presentes`.
+    - Aluno: `total_realizadas` e `total_ausencias` (presenças e ausências
+      em aulas concluídas, como nos KPIs) e `ultima_aula_em`, a data da
+      última aula concluída em que esteve presente.
+    """
+    if aula_ids is not None:
+        matriculas = PresencaAluno.objects.filter(aula=OuterRef('pk')).order_by()
+        Aula.objects.filter(pk__in=aula_ids).update(
+            num_alunos=_contagem(matriculas, 'aula'),
+            num_presentes=_contagem(matriculas.filter(status='presente'), 'aula'),
+        )
+    if aluno_ids is not None:
+        concluidas = PresencaAluno.objects.filter(
+            aluno=OuterRef('pk'), aula__status__in=STATUS_AULA_CONCLUIDA
+        ).order_by()
+        presentes = concluidas.filter(status='presente')
+        Aluno.objects.filter(pk__in=aluno_ids).update(
+            total_realizadas=_contagem(presentes, 'aluno'),
+            total_ausencias=_contagem(concluidas.filter(status='ausente'), 'aluno'),
+            ultima_aula_em=Subquery(
+                presentes.values('aluno').annotate(ultima=Max('aula__data_hora')).values('ultima')[:1]
+            ),
+        )
 
 
 class PresencaProfessor(models.Model):
@@ -124,35 +236,143 @@ class RelatorioAula(models.Model):
         return f"Relatório da aula de {self.aula.data_hora.strftime('%d/%m/%Y')}"
 
 
-class ItemRudimento(models.Model):
+# Tamanho de `Exercicio.nome_canonico`.
+TAMANHO_NOME_CANONICO = 255
+
+
+def canonicalizar_exercicio(texto):
+    """
+    Forma canônica do nome de um exercício: sem acentos, em minúsculas e com
+    espaços simples, para que "Paradiddle " e "paradíddle" sejam o mesmo.
+    A normalização pode aumentar o texto ("ß" vira "ss"), então o resultado
+    é cortado no tamanho do campo.
+    """
+    decomposto = unicodedata.normalize('NFKD', texto or '')
+    sem_acentos = ''.join(c for c in decomposto if not unicodedata.combining(c))
+    return ' '.join(sem_acentos.casefold().split())[:TAMANHO_NOME_CANONICO].rstrip()
+
+
+class ExercicioManager(models.Manager):
+    def para_descricoes(self, descricoes):
+        """
+        Retorna {nome canônico: exercício} para as descrições informadas,
+        criando no catálogo as que ainda não existem.
+        """
+        nomes = {}
+        for descricao in descricoes:
+            canonico = canonicalizar_exercicio(descricao)
+            if canonico:
+                nomes.setdefault(canonico, ' '.join(descricao.split()))
+        if not nomes:
+            return {}
+
+        exercicios = {e.nome_canonico: e for e in self.filter(nome_canonico__in=nomes)}
+        faltando = [canonico for canonico in nomes if canonico not in exercicios]
+        if faltando:
+            self.bulk_create(
+                [self.model(nome=nomes[canonico], nome_canonico=canonico) for canonico in faltando],
+                ignore_conflicts=True
+            )
+            exercicios.update((e.nome_canonico, e) for e in self.filter(nome_canonico__in=faltando))
+        return exercicios
+
+
+class Exercicio(models.Model):
+    """
+    Catálogo de exercícios referenciado pelos itens dos relatórios. Cada
+    exercício é identificado pelo nome canônico da descrição; `nome` guarda
+    a primeira grafia registrada.
+    """
+    nome = models.CharField(max_length=255)
+    nome_canonico = models.CharField(max_length=TAMANHO_NOME_CANONICO, unique=True)
+
+    objects = ExercicioManager()
+
+    def __str__(self):
+        return self.nome
+
+
+def preparar_itens(itens):
+    """
+    Preenche os campos derivados de itens de relatório: `bpm_valor`, a
+    versão numérica do `bpm`, e `exercicio`, a entrada do catálogo para a
+    `descricao`. Os exercícios de todos os itens são resolvidos juntos.
+    """
+    itens = list(itens)
+    exercicios = Exercicio.objects.para_descricoes(item.descricao for item in itens)
+    for item in itens:
+        item.bpm_valor = normalizar_bpm(item.bpm)
+        item.exercicio = exercicios.get(canonicalizar_exercicio(item.descricao))
+
+
+class ItemRelatorioMixin:
+    """
+    Mantém os campos derivados dos itens de relatório ao salvar. Gravações
+    em lote (`bulk_create` e `bulk_update`) não passam pelo `save()` e
+    devem chamar `preparar_itens()` antes.
+    """
+    campos_derivados = {'bpm': 'bpm_valor', 'descricao': 'exercicio'}
+
+    def save(self, *args, **kwargs):
+        preparar_itens([self])
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {
+                *update_fields,
+                *(derivado for campo, derivado in self.campos_derivados.items() if campo in update_fields)
+            }
+        super().save(*args, **kwargs)
+
+
+def indice_bpm(nome):
+    """Índice parcial dos itens com andamento, por relatório."""
+    return models.Index(fields=['relatorio', 'bpm_valor'], condition=models.Q(bpm_valor__isnull=False), name=nome)
+
+
+class ItemRudimento(ItemRelatorioMixin, models.Model):
     relatorio = models.ForeignKey(RelatorioAula, related_name='itens_rudimentos', on_delete=models.CASCADE)
     descricao = models.CharField(max_length=255, verbose_name="Exercício")
+    exercicio = models.ForeignKey(Exercicio, on_delete=models.PROTECT, null=True, blank=True, editable=False, related_name='+')
     bpm = models.CharField(max_length=50, blank=True, null=True, verbose_name="BPM")
+    bpm_valor = models.PositiveSmallIntegerField(null=True, blank=True, editable=False, verbose_name="BPM (numérico)")
     duracao_min = models.IntegerField(verbose_name="Duração (min)", null=True, blank=True)
     observacoes = models.TextField(verbose_name="Observações", blank=True, null=True)
 
+    class Meta:
+        indexes = [indice_bpm('scheduling_rudimento_bpm_idx')]
+
     def __str__(self):
         return f"Rudimento: {self.descricao}"
 
 
-class ItemRitmo(models.Model):
+class ItemRitmo(ItemRelatorioMixin, models.Model):
     relatorio = models.ForeignKey(RelatorioAula, related_name='itens_ritmo', on_delete=models.CASCADE)
     descricao = models.CharField(max_length=255, verbose_name="Exercício")
+    exercicio = models.ForeignKey(Exercicio, on_delete=models.PROTECT, null=True, blank=True, editable=False, related_name='+')
     livro_metodo = models.CharField(max_length=200, blank=True, null=True, verbose_name="Livro/Método")
     bpm = models.CharField(max_length=50, blank=True, null=True, verbose_name="Clique/BPM")
+    bpm_valor = models.PositiveSmallIntegerField(null=True, blank=True, editable=False, verbose_name="BPM (numérico)")
     duracao_min = models.IntegerField(verbose_name="Duração (min)", null=True, blank=True)
     observacoes = models.TextField(verbose_name="Observações", blank=True, null=True)
 
+    class Meta:
+        indexes = [indice_bpm('scheduling_ritmo_bpm_idx')]
+
     def __str__(self):
         return f"Ritmo: {self.descricao}"
 
 
-class ItemVirada(models.Model):
+class ItemVirada(ItemRelatorioMixin, models.Model):
     relatorio = models.ForeignKey(RelatorioAula, related_name='itens_viradas', on_delete=models.CASCADE)
     descricao = models.CharField(max_length=255, verbose_name="Exercício")
+    exercicio = models.ForeignKey(Exercicio, on_delete=models.PROTECT, null=True, blank=True, editable=False, related_name='+')
     bpm = models.CharField(max_length=50, blank=True, null=True, verbose_name="Clique/BPM")
+    bpm_valor = models.PositiveSmallIntegerField(null=True, blank=True, editable=False, verbose_name="BPM (numérico)")
     duracao_min = models.IntegerField(verbose_name="Duração (min)", null=True, blank=True)
     observacoes = models.TextField(verbose_name="Observações", blank=True, null=True)
 
+    class Meta:
+        indexes = [indice_bpm('scheduling_virada_bpm_idx')]
+
     def __str__(self):
         return f"Virada: {self.descricao}"
@@ -0,0 +1,32 @@
+"""
+Dados de referência (modalidades e professores) mantidos em memória.
+
+Mudam poucas vezes por ano, mas são lidos em quase toda requisição: nas
+listagens e na validação dos ids enviados ao criar ou editar aulas. Cada
+leitura confere apenas as versões das tabelas no cache compartilhado (ver
+`cache.em_memoria`); os sinais de `signals.py` incrementam essas versões.
+Como a cópia de um processo pode estar atrasada, a validação de ids confere
+no banco os que não encontrar aqui (ver `serializers.py`).
+"""
+from users.models import CustomUser
+from .cache import em_memoria
+from .models import Modalidade
+
+
+def modalidades_por_id():
+    """{id: Modalidade} de todas as modalidades, em ordem de nome."""
+    return em_memoria(
+        'referencia:modalidades', ['scheduling.modalidade'],
+        lambda: {modalidade.pk: modalidade for modalidade in Modalidade.objects.order_by('nome')}
+    )
+
+
+def professores_por_id():
+    """{id: CustomUser} dos professores e administradores, em ordem de username."""
+    return em_memoria(
+        'referencia:professores', ['users.customuser'],
+        lambda: {
+            professor.pk: professor
+            for professor in CustomUser.objects.filter(tipo__in=['admin', 'professor']).order_by('username')
+        }
+    )
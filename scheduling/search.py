@@ -0,0 +1,169 @@
+"""
+Busca textual sobre alunos e relatórios de aula usando um índice FTS5 do SQLite.
+
+O índice (`scheduling_busca`) tem um documento por aluno (nome e email) e um
+por relatório (campos de texto e a descrição de todos os itens). O `rowid`
+de cada documento codifica o tipo e o id do objeto, então atualizar ou
+remover documentos é uma operação por chave primária, sem varrer o índice.
+Os sinais de `signals.py` mantêm o índice sincronizado.
+"""
+import re
+import threading
+from contextlib import contextmanager
+
+from django.db import connection
+
+TABELA_BUSCA = 'scheduling_busca'
+
+# O rowid de cada documento é `id * FATOR_TIPO + código do tipo`.
+FATOR_TIPO = 10
+TIPOS = {'aluno': 0, 'relatorio': 1}
+TIPOS_POR_CODIGO = {codigo: tipo for tipo, codigo in TIPOS.items()}
+
+SQL_DOCUMENTOS = {
+    'aluno': f"""
+        SELECT a.id * {FATOR_TIPO} + {TIPOS['aluno']}, a.nome_completo, COALESCE(a.email, '')
+        FROM scheduling_aluno a
+        WHERE a.id IN ({{ids}})
+    """,
+    'relatorio': f"""
+        SELECT r.id * {FATOR_TIPO} + {TIPOS['relatorio']}, '',
+            COALESCE(r.conteudo_teorico, '') || ' ' || COALESCE(r.observacoes_teoria, '') || ' ' ||
+            COALESCE(r.repertorio_musicas, '') || ' ' || COALESCE(r.observacoes_repertorio, '') || ' ' ||
+            COALESCE(r.observacoes_gerais, '') || ' ' ||
+            COALESCE((SELECT group_concat(i.descricao, ' ') FROM scheduling_itemrudimento i WHERE i.relatorio_id = r.id), '') || ' ' ||
+            COALESCE((SELECT group_concat(i.descricao, ' ') FROM scheduling_itemritmo i WHERE i.relatorio_id = r.id), '') || ' ' ||
+            COALESCE((SELECT group_concat(i.descricao, ' ') FROM scheduling_itemvirada i WHERE i.relatorio_id = r.id), '')
+        FROM scheduling_relatorioaula r
+        WHERE r.id IN ({{ids}})
+    """,
+}
+
+# Indexação adiada: dentro de `adiar_indexacao()` os ids são acumulados aqui,
+# separadamente por thread.
+_estado = threading.local()
+
+
+def _pendentes():
+    return getattr(_estado, 'pendentes', None)
+
+
+def disponivel():
+    """O índice só existe no SQLite, que é o banco do projeto."""
+    return connection.vendor == 'sqlite'
+
+
+def indexar(tipo, ids):
+    """
+    Recalcula os documentos de `tipo` para os `ids` informados. Objetos que
+    não existem mais são apenas removidos do índice.
+    """
+    ids = [int(pk) for pk in set(ids)]
+    if not ids or not disponivel():
+        return
+    if _pendentes() is not None:
+        _pendentes().setdefault(tipo, set()).update(ids)
+        return
+
+    rowids = [pk * FATOR_TIPO + TIPOS[tipo] for pk in ids]
+    marcadores = ', '.join(['%s'] * len(ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABELA_BUSCA} WHERE rowid IN ({marcadores})", rowids)
+        cursor.execute(
+            f"INSERT INTO {TABELA_BUSCA} (rowid, titulo, conteudo) "
+            + SQL_DOCUMENTOS[tipo].format(ids=marcadores),
+            ids,
+        )
+
+
+def reindexar_tudo():
+    """Reconstrói o índice inteiro a partir das tabelas."""
+    if not disponivel():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABELA_BUSCA}")
+        for tipo, tabela in (('aluno', 'scheduling_aluno'), ('relatorio', 'scheduling_relatorioaula')):
+            sql = SQL_DOCUMENTOS[tipo].format(ids=f'SELECT id FROM {tabela}')
+            cursor.execute(f"INSERT INTO {TABELA_BUSCA} (rowid, titulo, conteudo) " + sql)
+
+
+@contextmanager
+def adiar_indexacao():
+    """
+    Acumula as reindexações pedidas dentro do bloco e as executa uma única
+    vez ao final, útil para gravações em lote que disparam muitos sinais.
+    """
+    if _pendentes() is not None:
+        yield
+        return
+
+    _estado.pendentes = {}
+    try:
+        yield
+        pendentes = _estado.pendentes
+    finally:
+        _estado.pendentes = None
+    for tipo, ids in pendentes.items():
+        indexar(tipo, ids)
+
+
+def montar_consulta(texto):
+    """
+    Converte o texto digitado em uma consulta FTS5 segura: cada palavra vira
+    um termo entre aspas com busca por prefixo, e todas precisam aparecer.
+    """
+    termos = re.findall(r'\w+', texto or '')
+    return ' '.join(f'"{termo}"*' for termo in termos)
+
+
+class ResultadosBusca:
+    """
+    Resultados de uma busca, ordenados por relevância (bm25, com peso maior
+    para o título). Implementa `count()` e fatiamento para ser paginado pelo
+    `Paginator` do Django sem carregar todos os resultados.
+    """
+
+    def __init__(self, texto, tipo=None):
+        self.consulta = montar_consulta(texto)
+        self.filtro_tipo = ''
+        self.parametros = [self.consulta]
+        if tipo is not None:
+            self.filtro_tipo = f'AND rowid %% {FATOR_TIPO} = %s'
+            self.parametros.append(TIPOS[tipo])
+
+    def count(self):
+        if not self.consulta:
+            return 0
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT COUNT(*) FROM {TABELA_BUSCA} WHERE {TABELA_BUSCA} MATCH %s {self.filtro_tipo}",
+                self.parametros,
+            )
+            return cursor.fetchone()[0]
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, fatia):
+        if not isinstance(fatia, slice) or not self.consulta:
+            return []
+        inicio = fatia.start or 0
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                SELECT rowid, snippet({TABELA_BUSCA}, -1, '[', ']', '…', 12)
+                FROM {TABELA_BUSCA}
+                WHERE {TABELA_BUSCA} MATCH %s {self.filtro_tipo}
+                ORDER BY bm25({TABELA_BUSCA}, 10.0, 1.0)
+                LIMIT %s OFFSET %s
+                """,
+                [*self.parametros, fatia.stop - inicio, inicio],
+            )
+            return [
+                {
+                    'tipo': TIPOS_POR_CODIGO[rowid % FATOR_TIPO],
+                    'id': rowid // FATOR_TIPO,
+                    'trecho': trecho,
+                }
+                for rowid, trecho in cursor.fetchall()
+            ]
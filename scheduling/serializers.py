@@ -1,5 +1,4 @@
 from rest_framework import serializers
-from drf_writable_nested.serializers import WritableNestedModelSerializer
 from .models import (
     Modalidade,
     Aluno,
@@ -10,9 +9,14 @@ from .models import (
     ItemRudimento,
     ItemRitmo,
     ItemVirada,
+    preparar_itens,
 )
 from users.models import CustomUser
-from django.db.models import Count, Q, Subquery, OuterRef
+from .referencia import modalidades_por_id, professores_por_id
+from .search import adiar_indexacao, indexar as indexar_busca
+from django.db import transaction
+from django.db.models import Count, Q
+from django.db.models.manager import BaseManager
 from django.db.models.functions import TruncMonth
 from django.utils import timezone
 
@@ -26,7 +30,10 @@ class ModalidadeSerializer(serializers.ModelSerializer):
 class AlunoSerializer(serializers.ModelSerializer):
     class Meta:
         model = Aluno
-        fields = ['id', 'nome_completo', 'telefone', 'email', 'data_criacao']
+        fields = [
+            'id', 'nome_completo', 'telefone', 'email', 'data_criacao',
+            'total_realizadas', 'total_ausencias', 'ultima_aula_em'
+        ]
 
 
 class ProfessorSimpleSerializer(serializers.ModelSerializer):
@@ -35,26 +42,87 @@ class ProfessorSimpleSerializer(serializers.ModelSerializer):
         fields = ['id', 'username', 'first_name', 'last_name']
 
 
+class ReferenciaPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    `PrimaryKeyRelatedField` que resolve o id pelos dados de referência em
+    memória (`referencia`, ver `referencia.py`) em vez de consultar o banco.
+    Ids ausentes da memória são conferidos na `queryset`, pois a cópia deste
+    processo pode ainda não ter visto um objeto criado por outro.
+    """
+
+    def __init__(self, referencia, **kwargs):
+        self.referencia = referencia
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            pk = int(data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        objeto = self.referencia().get(pk)
+        if objeto is None:
+            objeto = self.get_queryset().filter(pk=pk).first()
+        if objeto is None:
+            self.fail('does_not_exist', pk_value=data)
+        return objeto
+
+
+class PrimaryKeyListField(serializers.ListField):
+    """
+    Lista de ids de uma relação ManyToMany validada com uma única query
+    `IN`, reportando todos os ids inexistentes de uma vez. Retorna os ids
+    (e não instâncias), que o `set()` da relação grava em lote. Com
+    `referencia`, os ids são conferidos nos dados em memória e só os que
+    faltarem lá vão ao banco.
+    """
+    child = serializers.IntegerField()
+    default_error_messages = {
+        'does_not_exist': 'Os seguintes ids não existem: {ids}.',
+    }
+
+    def __init__(self, queryset, referencia=None, **kwargs):
+        self.queryset = queryset
+        self.referencia = referencia
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        ids = list(dict.fromkeys(super().to_internal_value(data)))
+        faltando = ids
+        if self.referencia is not None:
+            em_memoria = self.referencia()
+            faltando = [pk for pk in ids if pk not in em_memoria]
+        if faltando:
+            existentes = set(self.queryset.filter(pk__in=faltando).values_list('pk', flat=True))
+            faltando = [pk for pk in faltando if pk not in existentes]
+        if faltando:
+            self.fail('does_not_exist', ids=', '.join(map(str, faltando)))
+        return ids
+
+
 class AulaSerializer(serializers.ModelSerializer):
     modalidade = ModalidadeSerializer(read_only=True)
     alunos = AlunoSerializer(many=True, read_only=True)
     professores = ProfessorSimpleSerializer(many=True, read_only=True)
-    modalidade_id = serializers.PrimaryKeyRelatedField(
+    modalidade_id = ReferenciaPrimaryKeyRelatedField(
+        referencia=modalidades_por_id,
         queryset=Modalidade.objects.all(), source='modalidade', write_only=True
     )
-    aluno_ids = serializers.PrimaryKeyRelatedField(
-        queryset=Aluno.objects.all(), source='alunos', many=True, write_only=True
+    aluno_ids = PrimaryKeyListField(
+        queryset=Aluno.objects.all(), source='alunos', write_only=True
     )
-    professor_ids = serializers.PrimaryKeyRelatedField(
+    professor_ids = PrimaryKeyListField(
         queryset=CustomUser.objects.filter(tipo__in=["admin", "professor"]),
-        source='professores', many=True, write_only=True
+        referencia=professores_por_id,
+        source='professores', write_only=True
     )
 
     class Meta:
         model = Aula
         fields = [
-            'id', 'data_hora', 'status', 'modalidade', 'alunos', 'professores',
-            'modalidade_id', 'aluno_ids', 'professor_ids'
+            'id', 'data_hora', 'status', 'num_alunos', 'num_presentes',
+            'modalidade', 'alunos', 'professores', 'modalidade_id', 'aluno_ids', 'professor_ids'
         ]
 
 
@@ -68,29 +136,48 @@ class PresencaProfessorSerializer(serializers.Serializer):
     status = serializers.ChoiceField(choices=PresencaProfessor.STATUS_CHOICES)
 
 
-class ItemRudimentoSerializer(serializers.ModelSerializer):
+class ItemRelatorioSerializer(serializers.ModelSerializer):
+    """
+    Base dos itens de relatório. O `id` é aceito na escrita para identificar
+    os itens já existentes que devem ser mantidos (ver `RelatorioAulaSerializer`).
+    """
+    id = serializers.IntegerField(required=False)
+
+
+class ItemRudimentoSerializer(ItemRelatorioSerializer):
     class Meta:
         model = ItemRudimento
         fields = ['id', 'descricao', 'bpm', 'duracao_min', 'observacoes']
 
 
-class ItemRitmoSerializer(serializers.ModelSerializer):
+class ItemRitmoSerializer(ItemRelatorioSerializer):
     class Meta:
         model = ItemRitmo
         fields = ['id', 'descricao', 'livro_metodo', 'bpm', 'duracao_min', 'observacoes']
 
 
-class ItemViradaSerializer(serializers.ModelSerializer):
+class ItemViradaSerializer(ItemRelatorioSerializer):
     class Meta:
         model = ItemVirada
         fields = ['id', 'descricao', 'bpm', 'duracao_min', 'observacoes']
 
 
-class RelatorioAulaSerializer(WritableNestedModelSerializer):
+class RelatorioAulaSerializer(serializers.ModelSerializer):
+    """
+    Serializer do relatório de aula com os exercícios aninhados.
+
+    Os itens de cada tipo são gravados em lote: a lista enviada é comparada
+    com os itens existentes (pelo `id` de cada item) e a diferença é aplicada
+    com `bulk_create`, `bulk_update` e um único `DELETE ... IN`, tudo em uma
+    transação. Tipos de item ausentes do payload não são alterados. O índice
+    de busca do relatório é atualizado uma única vez, ao final.
+    """
     itens_rudimentos = ItemRudimentoSerializer(many=True, required=False)
     itens_ritmo = ItemRitmoSerializer(many=True, required=False)
     itens_viradas = ItemViradaSerializer(many=True, required=False)
 
+    campos_itens = ('itens_rudimentos', 'itens_ritmo', 'itens_viradas')
+
     class Meta:
         model = RelatorioAula
         fields = [
@@ -100,6 +187,137 @@ class RelatorioAulaSerializer(WritableNestedModelSerializer):
         ]
         read_only_fields = ['professor_que_validou']
 
+    def validate(self, attrs):
+        """
+        Confere que os `id`s enviados em cada lista de itens pertencem a este
+        relatório (um relatório novo ainda não tem itens) e guarda os itens
+        existentes para a gravação.
+        """
+        attrs = super().validate(attrs)
+        self.itens_existentes = {}
+        for nome in self.campos_itens:
+            if nome not in attrs:
+                continue
+            model = self.fields[nome].child.Meta.model
+            existentes = {} if self.instance is None else {
+                item.pk: item for item in model.objects.filter(relatorio=self.instance)
+            }
+            desconhecidos = [
+                dados['id'] for dados in attrs[nome] if dados.get('id') is not None and dados['id'] not in existentes
+            ]
+            if desconhecidos:
+                raise serializers.ValidationError({nome: [
+                    f'Os itens {", ".join(map(str, desconhecidos))} não pertencem a este relatório.'
+                ]})
+            self.itens_existentes[nome] = existentes
+        return attrs
+
+    def create(self, validated_data):
+        itens = self._extrair_itens(validated_data)
+        with transaction.atomic(), adiar_indexacao():
+            relatorio = super().create(validated_data)
+            self._salvar_itens(relatorio, itens)
+        return relatorio
+
+    def update(self, instance, validated_data):
+        itens = self._extrair_itens(validated_data)
+        with transaction.atomic(), adiar_indexacao():
+            relatorio = super().update(instance, validated_data)
+            self._salvar_itens(relatorio, itens)
+        return relatorio
+
+    def _extrair_itens(self, validated_data):
+        return {nome: validated_data.pop(nome) for nome in self.campos_itens if nome in validated_data}
+
+    def _salvar_itens(self, relatorio, itens):
+        for nome, dados in itens.items():
+            model = self.fields[nome].child.Meta.model
+            existentes = self.itens_existentes.get(nome, {})
+
+            novos, alterados, campos_alterados = [], [], set()
+            enviados = set()
+            for dados_item in dados:
+                dados_item = dict(dados_item)
+                pk = dados_item.pop('id', None)
+                if pk is None:
+                    novos.append(model(relatorio=relatorio, **dados_item))
+                    continue
+                enviados.add(pk)
+                item = existentes[pk]
+                for campo, valor in dados_item.items():
+                    setattr(item, campo, valor)
+                campos_alterados.update(dados_item)
+                alterados.append(item)
+
+            preparar_itens(novos + alterados)
+            campos_alterados.update(
+                derivado for campo, derivado in model.campos_derivados.items() if campo in campos_alterados
+            )
+
+            removidos = set(existentes) - enviados
+            if removidos:
+                model.objects.filter(relatorio=relatorio, pk__in=removidos).delete()
+            if alterados and campos_alterados:
+                model.objects.bulk_update(alterados, sorted(campos_alterados))
+            if novos:
+                model.objects.bulk_create(novos)
+
+        # bulk_create e bulk_update não disparam sinais.
+        indexar_busca('relatorio', [relatorio.pk])
+
+
+class RelatorioAulaResumoSerializer(serializers.ModelSerializer):
+    """
+    Versão resumida do relatório para listagens (`?summary=1`): no lugar dos
+    textos e itens aninhados, traz as contagens de itens e a duração total,
+    anotadas na queryset pela view.
+    """
+    total_rudimentos = serializers.IntegerField(read_only=True)
+    total_ritmos = serializers.IntegerField(read_only=True)
+    total_viradas = serializers.IntegerField(read_only=True)
+    duracao_total_min = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = RelatorioAula
+        fields = [
+            'id', 'aula', 'professor_que_validou', 'data_atualizacao',
+            'total_rudimentos', 'total_ritmos', 'total_viradas', 'duracao_total_min'
+        ]
+
+
+def calcular_kpis_alunos(alunos):
+    """
+    Monta os KPIs de aulas de vários alunos. Presenças e ausências vêm dos
+    contadores de cada aluno (`models.atualizar_contadores`); os totais sem
+    contador saem de uma única query agregada sobre as matrículas.
+    Retorna {aluno_id: kpis}.
+    """
+    linhas = PresencaAluno.objects.filter(aluno__in=alunos).values('aluno_id').annotate(
+        total_aulas=Count('id'),
+        total_canceladas=Count('id', filter=Q(aula__status="Cancelada")),
+        total_agendadas=Count('id', filter=Q(aula__status="Agendada")),
+    ).order_by()
+    por_aluno = {linha.pop('aluno_id'): linha for linha in linhas}
+
+    vazio = dict.fromkeys(['total_aulas', 'total_canceladas', 'total_agendadas'], 0)
+    return {
+        aluno.pk: {
+            'total_realizadas': aluno.total_realizadas,
+            'total_ausencias': aluno.total_ausencias,
+            **por_aluno.get(aluno.pk, vazio),
+        }
+        for aluno in alunos
+    }
+
+
+class AlunoDetailListSerializer(serializers.ListSerializer):
+    """Calcula os KPIs de todos os alunos da lista de uma só vez."""
+
+    def to_representation(self, data):
+        alunos = list(data.all() if isinstance(data, BaseManager) else data)
+        self.child.kpis_por_aluno = calcular_kpis_alunos(alunos)
+        return super().to_representation(alunos)
+
 
 class AlunoDetailSerializer(serializers.ModelSerializer):
     """
@@ -113,46 +331,28 @@ class AlunoDetailSerializer(serializers.ModelSerializer):
         model = Aluno
         fields = [
             'id', 'nome_completo', 'telefone', 'email', 'data_criacao',
-            'kpis', 'taxa_presenca'
+            'ultima_aula_em', 'kpis', 'taxa_presenca'
         ]
+        list_serializer_class = AlunoDetailListSerializer
 
-    def _get_aulas_com_presenca_base_query(self, aluno):
-        """Método auxiliar para não repetir a query base."""
-        presenca_status_subquery = PresencaAluno.objects.filter(
-            aula=OuterRef('pk'),
-            aluno=aluno
-        ).values('status')[:1]
-
-        return Aula.objects.filter(alunos=aluno).annotate(
-            status_presenca_aluno=Subquery(presenca_status_subquery)
-        )
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.kpis_por_aluno = {}
 
     def get_kpis(self, aluno):
         """Calcula os KPIs de aulas para o aluno."""
-        aulas_com_presenca = self._get_aulas_com_presenca_base_query(aluno)
-
-        total_realizadas = aulas_com_presenca.filter(status__in=['Realizada', 'Aluno Ausente'], status_presenca_aluno='presente').count()
-        total_ausencias = aulas_com_presenca.filter(status__in=['Realizada', 'Aluno Ausente'], status_presenca_aluno='ausente').count()
-        total_canceladas = aulas_com_presenca.filter(status="Cancelada").count()
-        total_agendadas = aulas_com_presenca.filter(status="Agendada").count()
-
-        return {
-            'total_aulas': aulas_com_presenca.count(),
-            'total_realizadas': total_realizadas,
-            'total_ausencias': total_ausencias,
-            'total_canceladas': total_canceladas,
-            'total_agendadas': total_agendadas,
-        }
+        if aluno.pk not in self.kpis_por_aluno:
+            self.kpis_por_aluno.update(calcular_kpis_alunos([aluno]))
+        return self.kpis_por_aluno[aluno.pk]
 
     def get_taxa_presenca(self, aluno):
-        """Calcula a taxa de presença do aluno."""
-        kpis = self.get_kpis(aluno)
-        aulas_contabilizadas = kpis['total_realizadas'] + kpis['total_ausencias']
+        """Calcula a taxa de presença do aluno a partir dos contadores."""
+        aulas_contabilizadas = aluno.total_realizadas + aluno.total_ausencias
 
         if aulas_contabilizadas == 0:
             return 0.0
 
-        taxa = (kpis['total_realizadas'] / aulas_contabilizadas) * 100
+        taxa = (aluno.total_realizadas / aulas_contabilizadas) * 100
         return round(taxa, 2)
 
 
@@ -0,0 +1,212 @@
+"""
+Sinais que mantêm atualizados os contadores de versão de `cache.py`, o
+índice de busca textual de `search.py` e os contadores de matrículas e
+presenças de aulas e alunos (`models.atualizar_contadores`).
+
+Além da versão da tabela inteira, as aulas têm versões por mês da
+`data_hora` (`cache.tabela_do_mes`), incrementadas quando muda uma aula,
+seus participantes ou seu relatório. Dados calculados sobre um período,
+como o dashboard, dependem só dos meses que cobrem.
+"""
+import threading
+
+from django.db import transaction
+from django.db.models import QuerySet
+from django.utils import timezone
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from users.models import CustomUser
+from . import search
+from .cache import QUALQUER_MES, incrementar_versao, tabela_do_mes
+from .models import (
+    Aluno, Aula, ItemRitmo, ItemRudimento, ItemVirada, Modalidade, PresencaAluno, RelatorioAula,
+    atualizar_contadores,
+)
+
+MODELOS_VERSIONADOS = (Modalidade, Aluno, Aula, CustomUser)
+
+
+def invalidar(tabela):
+    """
+    Incrementa a versão de `tabela` agora e de novo após o commit, para que
+    uma leitura feita durante a transação não fique em cache como atual.
+    """
+    incrementar_versao(tabela)
+    transaction.on_commit(lambda: incrementar_versao(tabela))
+
+
+def em_cascata(sender, origin=None, **kwargs):
+    """
+    Diz se o post_delete de `sender` vem da exclusão em cascata de outro
+    modelo: `origin` é a instância ou a queryset em que `delete()` foi
+    chamado. Nesses casos o recálculo fica para o post_delete da origem.
+    """
+    if origin is None:
+        return False
+    modelo = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return modelo is not sender
+
+
+def invalidar_tabela_do_modelo(sender, **kwargs):
+    invalidar(sender._meta.label_lower)
+
+
+# Conectados por modelo: um receptor sem `sender` em post_delete impediria
+# o DELETE direto (fast delete) em todas as outras tabelas.
+for modelo in MODELOS_VERSIONADOS:
+    post_save.connect(invalidar_tabela_do_modelo, sender=modelo)
+    post_delete.connect(invalidar_tabela_do_modelo, sender=modelo)
+
+
+def invalidar_meses_das_aulas(datas_hora):
+    """Invalida as versões mensais das aulas com as datas informadas."""
+    campo = Aula._meta.get_field('data_hora')
+    tabela = Aula._meta.label_lower
+    meses = {
+        tabela_do_mes(tabela, timezone.localtime(campo.to_python(data_hora)))
+        for data_hora in datas_hora if data_hora is not None
+    }
+    for versao in sorted(meses) + [f'{tabela}@{QUALQUER_MES}']:
+        invalidar(versao)
+
+
+# Conectado antes de `invalidar_meses_da_aula`, que atualiza a data de origem.
+@receiver(post_save, sender=Aula)
+def atualizar_contadores_dos_alunos(sender, instance, created, **kwargs):
+    # O status e a data da aula entram nos totais dos alunos matriculados.
+    originais = (getattr(instance, '_status_original', None), getattr(instance, '_data_hora_original', None))
+    instance._status_original = instance.status
+    if created or originais == (instance.status, instance.data_hora):
+        return
+    atualizar_contadores(aluno_ids=PresencaAluno.objects.filter(aula=instance).values('aluno_id'))
+    invalidar(Aluno._meta.label_lower)
+
+
+@receiver(post_save, sender=Aula)
+@receiver(post_delete, sender=Aula)
+def invalidar_meses_da_aula(sender, instance, **kwargs):
+    invalidar_meses_das_aulas([instance.data_hora, getattr(instance, '_data_hora_original', None)])
+    # A data gravada passa a ser a de origem de uma próxima remarcação.
+    instance._data_hora_original = instance.data_hora
+
+
+@receiver(m2m_changed, sender=Aula.alunos.through)
+@receiver(m2m_changed, sender=Aula.professores.through)
+def invalidar_participantes_da_aula(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidar(Aula._meta.label_lower)
+
+    # No lado reverso (aluno.aulas, professor.aulas) as aulas vêm em pk_set,
+    # exceto no clear, em que são lidas antes de serem removidas.
+    if not reverse and action in ('post_add', 'post_remove', 'post_clear'):
+        invalidar_meses_das_aulas([instance.data_hora])
+    elif reverse and action in ('post_add', 'post_remove'):
+        invalidar_meses_das_aulas(Aula.objects.filter(pk__in=pk_set).values_list('data_hora', flat=True))
+    elif reverse and action == 'pre_clear':
+        invalidar_meses_das_aulas(instance.aulas.values_list('data_hora', flat=True))
+
+
+# (aula_id, aluno_id) das matrículas apagadas em cascata com uma aula ou um
+# aluno, por thread, junto com a `origin` da exclusão que as apagou. Cada
+# exclusão nova recomeça a coleta no pre_delete: ids de uma exclusão que
+# falhou ou foi desfeita no meio não passam para a seguinte.
+_cascata = threading.local()
+
+
+@receiver(pre_delete, sender=Aula)
+@receiver(pre_delete, sender=Aluno)
+def iniciar_coleta_da_exclusao(sender, instance, origin=None, **kwargs):
+    if getattr(_cascata, 'origem', None) is not origin:
+        _cascata.origem = origin
+        _cascata.matriculas = set()
+
+
+@receiver(post_save, sender=PresencaAluno)
+@receiver(post_delete, sender=PresencaAluno)
+def invalidar_matricula(sender, instance, **kwargs):
+    # Matrículas gravadas direto em PresencaAluno (admin, marcação de
+    # presença) não passam pelo m2m_changed de Aula.alunos.
+    if em_cascata(sender, **kwargs):
+        if kwargs['origin'] is getattr(_cascata, 'origem', None):
+            _cascata.matriculas.add((instance.aula_id, instance.aluno_id))
+            return
+    atualizar_contadores_das_matriculas([instance.aula_id], [instance.aluno_id])
+
+
+@receiver(post_delete, sender=Aula)
+@receiver(post_delete, sender=Aluno)
+def atualizar_contadores_da_exclusao(sender, instance, origin=None, **kwargs):
+    # Os post_delete das matrículas vêm antes, então no da primeira aula
+    # (ou aluno) excluída já estão todas reunidas: um recálculo só, e só do
+    # lado que continua existindo.
+    if origin is None or getattr(_cascata, 'origem', None) is not origin:
+        return
+    excluidas = _cascata.matriculas
+    _cascata.origem = _cascata.matriculas = None
+    if not excluidas:
+        return
+    aula_ids = None if sender is Aula else {aula_id for aula_id, _ in excluidas}
+    aluno_ids = None if sender is Aluno else {aluno_id for _, aluno_id in excluidas}
+    atualizar_contadores_das_matriculas(aula_ids, aluno_ids)
+
+
+def atualizar_contadores_das_matriculas(aula_ids, aluno_ids):
+    """Recalcula os contadores e invalida as tabelas de aulas e alunos."""
+    atualizar_contadores(aula_ids, aluno_ids)
+    invalidar(Aula._meta.label_lower)
+    invalidar(Aluno._meta.label_lower)
+
+
+@receiver(m2m_changed, sender=Aula.alunos.through)
+def atualizar_contadores_da_matricula(sender, instance, action, reverse, pk_set, **kwargs):
+    # No clear os ids do outro lado só podem ser lidos antes da remoção.
+    if action == 'pre_clear':
+        instance._ids_matriculas = list(
+            instance.aulas.values_list('pk', flat=True) if reverse else instance.alunos.values_list('pk', flat=True)
+        )
+        return
+    if action == 'post_clear':
+        pk_set = instance.__dict__.pop('_ids_matriculas', [])
+    elif action not in ('post_add', 'post_remove'):
+        return
+
+    if reverse:
+        atualizar_contadores_das_matriculas(pk_set, [instance.pk])
+    else:
+        atualizar_contadores_das_matriculas([instance.pk], pk_set)
+
+
+@receiver(post_save, sender=RelatorioAula)
+@receiver(post_delete, sender=RelatorioAula)
+def invalidar_mes_do_relatorio(sender, instance, **kwargs):
+    if RelatorioAula.aula.is_cached(instance):
+        datas_hora = [instance.aula.data_hora]
+    else:
+        datas_hora = Aula.objects.filter(pk=instance.aula_id).values_list('data_hora', flat=True)
+    invalidar_meses_das_aulas(datas_hora)
+
+
+@receiver(post_save, sender=Aluno)
+@receiver(post_delete, sender=Aluno)
+def indexar_aluno(sender, instance, **kwargs):
+    search.indexar('aluno', [instance.pk])
+
+
+@receiver(post_save, sender=RelatorioAula)
+@receiver(post_delete, sender=RelatorioAula)
+def indexar_relatorio(sender, instance, **kwargs):
+    search.indexar('relatorio', [instance.pk])
+
+
+@receiver(post_save, sender=ItemRudimento)
+@receiver(post_save, sender=ItemRitmo)
+@receiver(post_save, sender=ItemVirada)
+@receiver(post_delete, sender=ItemRudimento)
+@receiver(post_delete, sender=ItemRitmo)
+@receiver(post_delete, sender=ItemVirada)
+def indexar_relatorio_do_item(sender, instance, **kwargs):
+    # Itens apagados junto com o relatório não o reindexam um a um: ele sai
+    # do índice no post_delete do próprio relatório, que vem depois.
+    if not em_cascata(sender, **kwargs):
+        search.indexar('relatorio', [instance.relatorio_id])
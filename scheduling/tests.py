@@ -1,11 +1,40 @@
 import json
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest.mock import patch
+
 import pytest
-from rest_framework import status
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.paginator import EmptyPage
+from django.db import connection, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models.signals import post_delete
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from openpyxl import Workbook
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+
+from config.renderers import ORJSONRenderer
+from users.fast_serializers import UserValuesSerializer
 from users.models import CustomUser
-from .models import Aluno, Aula, Modalidade, PresencaAluno, PresencaProfessor, RelatorioAula, ItemRudimento
-from unittest.mock import patch
+from users.serializers import UserSerializer
+from .admin import PaginadorContagemEstimada
+from .cache import TIMEOUT_MEMORIA, tabela_do_mes, versao
+from .checks import cache_compartilhado
+from .fast_serializers import AlunoValuesSerializer, AulaValuesSerializer
+from .models import (
+    TAMANHO_NOME_CANONICO, Aluno, Aula, ItemRitmo, ItemRudimento, Modalidade, PresencaAluno, PresencaProfessor,
+    RelatorioAula, canonicalizar_exercicio, normalizar_bpm,
+)
+from .referencia import modalidades_por_id
+from .serializers import AlunoSerializer, AulaSerializer, calcular_kpis_alunos
 
 @pytest.mark.django_db
 def test_create_modalidade(client):
@@ -135,11 +164,11 @@ def test_aluno_detail_endpoint_returns_kpis(client):
     aluno = Aluno.objects.create(nome_completo="Aluno KPI")
     modalidade = Modalidade.objects.create(nome="Aula KPI")
     aula1 = Aula.objects.create(modalidade=modalidade, data_hora="2025-01-01T10:00:00Z", status="Realizada")
-    aula1.alunos.set([aluno]); PresencaAluno.objects.create(aula=aula1, aluno=aluno, status='presente')
+    aula1.alunos.set([aluno], through_defaults={'status': 'presente'})
     aula2 = Aula.objects.create(modalidade=modalidade, data_hora="2025-01-02T10:00:00Z", status="Realizada")
-    aula2.alunos.set([aluno]); PresencaAluno.objects.create(aula=aula2, aluno=aluno, status='presente')
+    aula2.alunos.set([aluno], through_defaults={'status': 'presente'})
     aula3 = Aula.objects.create(modalidade=modalidade, data_hora="2025-01-03T10:00:00Z", status="Aluno Ausente")
-    aula3.alunos.set([aluno]); PresencaAluno.objects.create(aula=aula3, aluno=aluno, status='ausente')
+    aula3.alunos.set([aluno], through_defaults={'status': 'ausente'})
     aula4 = Aula.objects.create(modalidade=modalidade, data_hora="2025-01-04T10:00:00Z", status="Cancelada")
     aula4.alunos.set([aluno])
     aula5 = Aula.objects.create(modalidade=modalidade, data_hora="2025-01-05T10:00:00Z", status="Agendada")
@@ -214,6 +243,25 @@ def test_aulas_para_substituir_endpoint(client):
     assert response.data['results'][0]['professores'][0]['username'] == 'prof2'
 
 
+@pytest.mark.django_db
+def test_aulas_para_substituir_sparse_fieldset(client):
+    prof1 = CustomUser.objects.create_user(username='prof1', password='password123', tipo='professor')
+    prof2 = CustomUser.objects.create_user(username='prof2', password='password123', tipo='professor')
+    token = client.post(reverse('users:token_obtain_pair'), {'username': 'prof1', 'password': 'password123'}).data['access']
+    modalidade = Modalidade.objects.create(nome="Substituição")
+    aula = Aula.objects.create(modalidade=modalidade, data_hora=timezone.now() + timedelta(days=1), status="Agendada")
+    aula.professores.set([prof2])
+    url = reverse('scheduling:aulas-substituicao')
+
+    response = client.get(f"{url}?fields=id,data_hora", HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert response.status_code == status.HTTP_200_OK
+    assert set(response.data['results'][0]) == {'id', 'data_hora'}
+
+    response = client.get(f"{url}?fields=id&expand=professores", HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert set(response.data['results'][0]) == {'id', 'professores'}
+    assert response.data['results'][0]['professores'][0]['username'] == 'prof2'
+
+
 @pytest.mark.django_db
 # O @patch intercepta a chamada à API do Gemini e a substitui por um objeto simulado
 @patch('reporting.services.genai.GenerativeModel')
@@ -235,8 +283,7 @@ def test_gerar_relatorio_ia_endpoint(mock_generative_model, client):
     aluno = Aluno.objects.create(nome_completo="Aluno IA")
     modalidade = Modalidade.objects.create(nome="Aula IA")
     aula = Aula.objects.create(modalidade=modalidade, data_hora=timezone.now(), status="Realizada")
-    aula.alunos.set([aluno])
-    PresencaAluno.objects.create(aula=aula, aluno=aluno, status='presente')
+    aula.alunos.set([aluno], through_defaults={'status': 'presente'})
     RelatorioAula.objects.create(aula=aula, conteudo_teorico="Teste")
 
     # 2. ACT
@@ -249,3 +296,994 @@ def test_gerar_relatorio_ia_endpoint(mock_generative_model, client):
     mock_model_instance.generate_content.assert_called_once()
     # Verifica se a resposta contém o HTML convertido do nosso texto simulado
     assert "<strong>Relatório Simulado</strong>" in response.data['report_html']
+
+
+@pytest.mark.django_db
+def test_orjson_renderer_matches_default_json_renderer():
+    """
+    Garante que o ORJSONRenderer gera exatamente os mesmos bytes que o
+    JSONRenderer do DRF, inclusive para datas, Decimals e strings preguiçosas.
+    """
+    modalidade = Modalidade.objects.create(nome="Renderização")
+    aluno = Aluno.objects.create(nome_completo="Aluno Çedilha \u2028")
+    aula = Aula.objects.create(modalidade=modalidade, data_hora="2025-08-10T15:00:00.123456Z")
+    aula.alunos.set([aluno])
+
+    payload = {
+        'aulas': AulaSerializer(Aula.objects.all(), many=True).data,
+        'agora': timezone.now(),
+        'valor': Decimal('10.50'),
+        'rotulo': gettext_lazy("Aulas"),
+        1: 'chave numérica',
+    }
+
+    assert ORJSONRenderer().render(payload) == JSONRenderer().render(payload)
+    assert ORJSONRenderer().render(payload, 'application/json; indent=4') == \
+        JSONRenderer().render(payload, 'application/json; indent=4')
+
+
+@pytest.mark.django_db
+def test_fast_serializers_match_reference_serializers():
+    """
+    Garante que os serializers rápidos das listagens geram exatamente o mesmo
+    JSON que os serializers de referência.
+    """
+    prof1 = CustomUser.objects.create_user(username='prof1', tipo='professor', first_name='Ana')
+    prof2 = CustomUser.objects.create_user(username='prof2', tipo='professor')
+    aluno1 = Aluno.objects.create(nome_completo="Aluno Um", email="um@example.com")
+    aluno2 = Aluno.objects.create(nome_completo="Aluno Dois", telefone="1199999")
+    modalidade = Modalidade.objects.create(nome="Paridade")
+    aula1 = Aula.objects.create(modalidade=modalidade, data_hora="2025-08-10T15:00:00.500Z")
+    aula1.alunos.set([aluno2, aluno1]); aula1.professores.set([prof2, prof1])
+    Aula.objects.create(modalidade=modalidade, data_hora="2025-08-11T15:00:00Z", status="Cancelada")
+
+    def render(data):
+        return JSONRenderer().render(data)
+
+    aulas = Aula.objects.order_by('-data_hora')
+    assert render(AulaValuesSerializer().serializar(AulaValuesSerializer().preparar(aulas))) == \
+        render(AulaSerializer(aulas, many=True).data)
+
+    alunos = Aluno.objects.order_by('nome_completo')
+    assert render(AlunoValuesSerializer().serializar(AlunoValuesSerializer().preparar(alunos))) == \
+        render(AlunoSerializer(alunos, many=True).data)
+
+    professores = CustomUser.objects.order_by('username')
+    assert render(UserValuesSerializer().serializar(UserValuesSerializer().preparar(professores))) == \
+        render(UserSerializer(professores, many=True).data)
+
+
+@pytest.mark.django_db
+def test_aula_list_runs_constant_number_of_queries(client, django_assert_max_num_queries):
+    user = CustomUser.objects.create_user(username='testuser', password='password123')
+    token_url = reverse('users:token_obtain_pair')
+    token = client.post(token_url, {'username': 'testuser', 'password': 'password123'}).data['access']
+    modalidade = Modalidade.objects.create(nome="Muitas Aulas")
+    alunos = [Aluno.objects.create(nome_completo=f"Aluno {i}") for i in range(5)]
+    for i in range(10):
+        aula = Aula.objects.create(modalidade=modalidade, data_hora=f"2025-08-{i + 1:02d}T10:00:00Z")
+        aula.alunos.set(alunos[:i % 5 + 1]); aula.professores.set([user])
+
+    with django_assert_max_num_queries(8):
+        response = client.get(reverse('scheduling:aula-list'), HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert response.status_code == status.HTTP_200_OK
+    assert len(response.data['results']) == 10
+
+
+@pytest.mark.django_db
+def test_aula_list_sparse_fieldsets_prune_fields_and_queries(client, django_assert_max_num_queries):
+    """
+    Garante que `?fields=` remove campos da resposta e as queries das
+    relações não pedidas, e que `?expand=` escolhe as relações aninhadas.
+    """
+    user = CustomUser.objects.create_user(username='testuser', password='password123')
+    token_url = reverse('users:token_obtain_pair')
+    token = client.post(token_url, {'username': 'testuser', 'password': 'password123'}).data['access']
+    modalidade = Modalidade.objects.create(nome="Mobile")
+    aluno = Aluno.objects.create(nome_completo="Aluno Mobile")
+    aula = Aula.objects.create(modalidade=modalidade, data_hora="2025-08-10T15:00:00Z")
+    aula.alunos.set([aluno]); aula.professores.set([user])
+    url = reverse('scheduling:aula-list')
+
+    # autenticação + count + página
+    with django_assert_max_num_queries(3):
+        response = client.get(f"{url}?fields=id,data_hora,status", HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert response.status_code == status.HTTP_200_OK
+    assert list(response.data['results'][0]) == ['id', 'data_hora', 'status']
+
+    response = client.get(f"{url}?fields=id&expand=alunos", HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert list(response.data['results'][0]) == ['id', 'alunos']
+    assert response.data['results'][0]['alunos'][0]['nome_completo'] == "Aluno Mobile"
+
+    response = client.get(f"{url}?expand=modalidade", HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert list(response.data['results'][0]) == ['id', 'data_hora', 'status', 'num_alunos', 'num_presentes', 'modalidade']
+
+    detail_url = reverse('scheduling:aula-detail', kwargs={'pk': aula.pk})
+    response = client.get(f"{detail_url}?fields=id,professores", HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert list(response.data) == ['id', 'professores']
+    assert response.data['professores'][0]['username'] == 'testuser'
+
+    detail_url = reverse('scheduling:aluno-detail', kwargs={'pk': aluno.pk})
+    response = client.get(f"{detail_url}?fields=id,nome_completo", HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert list(response.data) == ['id', 'nome_completo']
+
+
+@pytest.mark.django_db
+def test_aluno_batch_fetch_by_ids(client, django_assert_max_num_queries):
+    """
+    Garante que `?ids=` retorna os alunos pedidos com KPIs, na ordem pedida,
+    com um número constante de queries e respeitando o limite de ids.
+    """
+    user = CustomUser.objects.create_user(username='testuser', password='password123')
+    token_url = reverse('users:token_obtain_pair')
+    token = client.post(token_url, {'username': 'testuser', 'password': 'password123'}).data['access']
+    modalidade = Modalidade.objects.create(nome="Lote")
+    alunos = [Aluno.objects.create(nome_completo=f"Aluno {i}") for i in range(5)]
+    for i, aluno in enumerate(alunos):
+        aula = Aula.objects.create(modalidade=modalidade, data_hora="2025-01-01T10:00:00Z", status="Realizada")
+        aula.alunos.set([aluno], through_defaults={'status': 'presente' if i % 2 else 'ausente'})
+
+    url = reverse('scheduling:aluno-list')
+    ids = [alunos[3].id, alunos[0].id, alunos[4].id, 999999]
+    # autenticação + alunos + KPIs agregados
+    with django_assert_max_num_queries(3):
+        response = client.get(f"{url}?ids={','.join(map(str, ids))}", HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert response.status_code == status.HTTP_200_OK
+    assert [item['id'] for item in response.data] == ids[:3]
+    assert response.data[0]['kpis']['total_realizadas'] == 1
+    assert response.data[1]['kpis']['total_ausencias'] == 1
+    assert response.data[1]['taxa_presenca'] == 0.0
+
+    response = client.get(f"{url}?ids={','.join(map(str, range(1, 102)))}", HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    response = client.get(f"{url}?ids=1,abc", HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+def test_bootstrap_endpoint_returns_reference_data_and_week(client, django_assert_max_num_queries):
+    """
+    Garante que o bootstrap traz os dados de referência e as aulas da semana
+    do usuário, que a segunda chamada vem do cache e que alterações nas
+    tabelas invalidam o cache.
+    """
+    prof = CustomUser.objects.create_user(username='prof1', password='password123', tipo='professor')
+    outro = CustomUser.objects.create_user(username='prof2', password='password123', tipo='professor')
+    token_url = reverse('users:token_obtain_pair')
+    token = client.post(token_url, {'username': 'prof1', 'password': 'password123'}).data['access']
+    modalidade = Modalidade.objects.create(nome="Bootstrap")
+    aluno = Aluno.objects.create(nome_completo="Aluno Bootstrap")
+    aula = Aula.objects.create(modalidade=modalidade, data_hora=timezone.now())
+    aula.alunos.set([aluno]); aula.professores.set([prof])
+    Aula.objects.create(modalidade=modalidade, data_hora=timezone.now()).professores.set([outro])
+
+    url = reverse('scheduling:bootstrap')
+    response = client.get(url, HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert response.status_code == status.HTTP_200_OK
+    assert [m['nome'] for m in response.data['modalidades']] == ["Bootstrap"]
+    assert [p['username'] for p in response.data['professores']] == ['prof1', 'prof2']
+    assert [a['id'] for a in response.data['aulas_da_semana']] == [aula.id]
+    assert response.data['aulas_da_semana'][0]['aluno_ids'] == [aluno.id]
+
+    # Só a autenticação vai ao banco quando tudo está em cache.
+    with django_assert_max_num_queries(1):
+        client.get(url, HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    Aluno.objects.create(nome_completo="Aluno Novo")
+    aula.alunos.clear()
+    response = client.get(url, HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert len(response.data['alunos']) == 2
+    assert response.data['aulas_da_semana'][0]['aluno_ids'] == []
+
+
+@pytest.mark.django_db
+def test_aula_write_validates_ids_in_bulk(client, django_assert_max_num_queries):
+    """
+    Garante que aluno_ids/professor_ids são validados com uma query por
+    relação, que todos os ids inválidos são reportados e que a gravação
+    custa o mesmo número de queries para 2 ou 40 alunos.
+    """
+    prof = CustomUser.objects.create_user(username='prof1', password='password123', tipo='professor')
+    token_url = reverse('users:token_obtain_pair')
+    token = client.post(token_url, {'username': 'prof1', 'password': 'password123'}).data['access']
+    modalidade = Modalidade.objects.create(nome="Atividade Complementar")
+    alunos = [Aluno.objects.create(nome_completo=f"Aluno {i:02d}") for i in range(40)]
+    url = reverse('scheduling:aula-list')
+
+    def criar(aluno_ids):
+        data = {
+            "data_hora": "2025-08-10T15:00:00Z", "modalidade_id": modalidade.id,
+            "aluno_ids": aluno_ids, "professor_ids": [prof.id],
+        }
+        return client.post(url, json.dumps(data), content_type='application/json',
+                           HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    with django_assert_max_num_queries(20) as poucos:
+        assert criar([a.id for a in alunos[:2]]).status_code == status.HTTP_201_CREATED
+    with django_assert_max_num_queries(len(poucos.captured_queries)):
+        response = criar([a.id for a in alunos])
+    assert response.status_code == status.HTTP_201_CREATED
+    assert len(response.data['alunos']) == 40
+
+    response = criar([alunos[0].id, 999998, 999999])
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert '999998, 999999' in str(response.data['aluno_ids'])
+
+    aula = Aula.objects.get(pk=Aula.objects.order_by('-id').values_list('id', flat=True)[0])
+    detail_url = reverse('scheduling:aula-detail', kwargs={'pk': aula.pk})
+    response = client.patch(detail_url, json.dumps({"aluno_ids": [alunos[0].id, alunos[1].id]}),
+                            content_type='application/json', HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert response.status_code == status.HTTP_200_OK
+    assert sorted(aula.alunos.values_list('id', flat=True)) == [alunos[0].id, alunos[1].id]
+
+
+@pytest.mark.django_db
+def test_update_relatorio_diffs_nested_items_in_bulk(client, django_assert_max_num_queries):
+    """
+    Garante que a atualização do relatório atualiza, cria e remove itens
+    comparando com os existentes, com custo independente do número de itens.
+    """
+    professor = CustomUser.objects.create_user(username='prof_relatorio', password='password123', tipo='professor')
+    token_url = reverse('users:token_obtain_pair')
+    token = client.post(token_url, {'username': 'prof_relatorio', 'password': 'password123'}).data['access']
+    modalidade = Modalidade.objects.create(nome="Aula com Relatório")
+    aula = Aula.objects.create(modalidade=modalidade, data_hora="2025-08-20T10:00:00Z")
+    relatorio = RelatorioAula.objects.create(aula=aula, professor_que_validou=professor)
+    mantido = ItemRudimento.objects.create(relatorio=relatorio, descricao="Toque Simples", bpm="100")
+    removido = ItemRudimento.objects.create(relatorio=relatorio, descricao="Toque Duplo")
+
+    outra_aula = Aula.objects.create(modalidade=modalidade, data_hora="2025-08-21T10:00:00Z")
+    alheio = ItemRudimento.objects.create(
+        relatorio=RelatorioAula.objects.create(aula=outra_aula), descricao="De outro relatório"
+    )
+
+    url = reverse('scheduling:relatorio-detail', kwargs={'pk': relatorio.pk})
+    payload = {
+        "aula": aula.pk,
+        "itens_rudimentos": [{"id": mantido.id, "descricao": "Toque Simples", "bpm": "120"}]
+        + [{"descricao": f"Paradiddle {i}", "bpm": "90"} for i in range(50)],
+    }
+    # Inclui as duas queries que reindexam o relatório na busca textual e as
+    # três que resolvem (e criam) os exercícios no catálogo.
+    with django_assert_max_num_queries(20):
+        response = client.put(url, json.dumps(payload), content_type='application/json',
+                              HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert response.status_code == status.HTTP_200_OK
+    assert relatorio.itens_rudimentos.count() == 51
+    assert not ItemRudimento.objects.filter(pk=removido.pk).exists()
+    mantido.refresh_from_db()
+    assert mantido.bpm == "120"
+
+    payload["itens_rudimentos"] = [{"id": alheio.id, "descricao": "Sequestro"}]
+    response = client.put(url, json.dumps(payload), content_type='application/json',
+                          HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert 'itens_rudimentos' in response.data
+    alheio.refresh_from_db()
+    assert alheio.descricao == "De outro relatório"
+    assert relatorio.itens_rudimentos.count() == 51
+
+    payload["itens_rudimentos"] = [{"id": "abc", "descricao": "Id inválido"}]
+    response = client.put(url, json.dumps(payload), content_type='application/json',
+                          HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert response.data['itens_rudimentos'][0]['id']
+
+
+@pytest.mark.django_db
+def test_relatorio_list_filters_prefetch_and_summary(client, django_assert_max_num_queries):
+    """
+    Garante que a listagem de relatórios usa um número constante de queries,
+    aceita filtros por aluno/professor/data e oferece o modo resumido.
+    """
+    prof = CustomUser.objects.create_user(username='prof1', password='password123', tipo='professor')
+    token_url = reverse('users:token_obtain_pair')
+    token = client.post(token_url, {'username': 'prof1', 'password': 'password123'}).data['access']
+    modalidade = Modalidade.objects.create(nome="Relatórios")
+    aluno = Aluno.objects.create(nome_completo="Aluno Relatório")
+    for dia in range(1, 6):
+        aula = Aula.objects.create(modalidade=modalidade, data_hora=f"2025-03-{dia:02d}T10:00:00Z", status="Realizada")
+        if dia <= 2:
+            aula.alunos.set([aluno])
+        relatorio = RelatorioAula.objects.create(aula=aula, professor_que_validou=prof if dia == 5 else None)
+        for i in range(dia):
+            ItemRudimento.objects.create(relatorio=relatorio, descricao=f"Rudimento {i}", duracao_min=10)
+        ItemRitmo.objects.create(relatorio=relatorio, descricao="Groove", duracao_min=5)
+
+    url = reverse('scheduling:relatorio-list')
+    # autenticação + count + página + 3 prefetches
+    with django_assert_max_num_queries(6):
+        response = client.get(url, HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert response.data['count'] == 5
+
+    response = client.get(f"{url}?aluno={aluno.id}", HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert response.data['count'] == 2
+    response = client.get(f"{url}?professor={prof.id}", HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert response.data['count'] == 1
+    response = client.get(f"{url}?data_inicial=2025-03-02&data_final=2025-03-03", HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert response.data['count'] == 2
+
+    with django_assert_max_num_queries(3):
+        response = client.get(f"{url}?summary=1", HTTP_AUTHORIZATION=f'Bearer {token}')
+    primeiro = response.data['results'][0]
+    assert 'itens_rudimentos' not in primeiro
+    assert primeiro['total_rudimentos'] == 5
+    assert primeiro['total_ritmos'] == 1
+    assert primeiro['total_viradas'] == 0
+    assert primeiro['duracao_total_min'] == 55
+
+
+@pytest.mark.django_db
+def test_busca_textual_em_alunos_e_relatorios(client):
+    """
+    Garante que a busca encontra alunos e relatórios (inclusive pelos itens),
+    acompanha alterações e remoções e respeita o filtro por tipo.
+    """
+    user = CustomUser.objects.create_user(username='prof1', password='password123', tipo='professor')
+    token_url = reverse('users:token_obtain_pair')
+    token = client.post(token_url, {'username': 'prof1', 'password': 'password123'}).data['access']
+    modalidade = Modalidade.objects.create(nome="Bateria")
+    aluno = Aluno.objects.create(nome_completo="João Paradiddle Souza")
+    aula = Aula.objects.create(modalidade=modalidade, data_hora="2025-03-01T10:00:00Z", status="Realizada")
+    relatorio = RelatorioAula.objects.create(aula=aula, conteudo_teorico="Leitura de semínimas")
+    item = ItemRudimento.objects.create(relatorio=relatorio, descricao="Paradiddle duplo", bpm="80")
+    Aluno.objects.create(nome_completo="Outro Aluno")
+
+    url = reverse('scheduling:busca')
+    response = client.get(f"{url}?q=paradid", HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data['count'] == 2
+    # O título tem peso maior, então o aluno vem primeiro.
+    assert [(r['tipo'], r['id']) for r in response.data['results']] == [('aluno', aluno.id), ('relatorio', relatorio.id)]
+    assert response.data['results'][0]['titulo'] == "João Paradiddle Souza"
+    assert response.data['results'][1]['aula_id'] == aula.id
+    assert '[Paradiddle]' in response.data['results'][1]['trecho']
+
+    # Acentos são ignorados e o filtro por tipo é respeitado.
+    response = client.get(f"{url}?q=seminimas&tipo=relatorio", HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert [r['id'] for r in response.data['results']] == [relatorio.id]
+    response = client.get(f"{url}?q=seminimas&tipo=aluno", HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert response.data['count'] == 0
+
+    item.delete()
+    aluno.nome_completo = "João Souza"
+    aluno.save()
+    response = client.get(f"{url}?q=paradiddle", HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert response.data['count'] == 0
+
+    response = client.get(url, HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    response = client.get(f"{url}?q=x&tipo=aula", HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+def test_excluir_aula_reindexa_relatorio_uma_vez():
+    modalidade = Modalidade.objects.create(nome="Bateria")
+    aula = Aula.objects.create(modalidade=modalidade, data_hora="2025-03-01T10:00:00Z", status="Realizada")
+    relatorio = RelatorioAula.objects.create(aula=aula, conteudo_teorico="Leitura")
+    ItemRudimento.objects.bulk_create(
+        ItemRudimento(relatorio=relatorio, descricao=f"Rudimento {i}", bpm="80") for i in range(50)
+    )
+
+    with CaptureQueriesContext(connection) as queries:
+        aula.delete()
+    busca = [q['sql'] for q in queries.captured_queries if 'scheduling_busca' in q['sql']]
+    assert len(busca) <= 2
+    assert not RelatorioAula.objects.exists()
+
+    # Fora de uma exclusão, apagar um item continua reindexando o relatório.
+    aula = Aula.objects.create(modalidade=modalidade, data_hora="2025-03-01T10:00:00Z", status="Realizada")
+    relatorio = RelatorioAula.objects.create(aula=aula, conteudo_teorico="Leitura")
+    item = ItemRudimento.objects.create(relatorio=relatorio, descricao="Paradiddle", bpm="80")
+    with CaptureQueriesContext(connection) as queries:
+        item.delete()
+    assert any('scheduling_busca' in q['sql'] for q in queries.captured_queries)
+
+
+def test_canonicalizar_exercicio_respeita_tamanho_do_campo():
+    assert canonicalizar_exercicio("  Paradíddle  Duplo ") == "paradiddle duplo"
+    # casefold() pode aumentar o texto: "ß" vira "ss".
+    assert len(canonicalizar_exercicio("ß" * 255)) == TAMANHO_NOME_CANONICO
+
+
+def test_normalizar_bpm():
+    assert normalizar_bpm("80") == 80
+    assert normalizar_bpm("80 bpm") == 80
+    assert normalizar_bpm("80-100") == 100
+    assert normalizar_bpm("2x 90") == 90
+    assert normalizar_bpm("livre") is None
+    assert normalizar_bpm(None) is None
+
+
+@pytest.mark.django_db
+def test_aluno_progressao_bpm(client, django_assert_max_num_queries):
+    """
+    Garante que o BPM numérico é mantido ao salvar e que a progressão do
+    aluno é agrupada por exercício e dia em uma única query.
+    """
+    user = CustomUser.objects.create_user(username='prof1', password='password123', tipo='professor')
+    token_url = reverse('users:token_obtain_pair')
+    token = client.post(token_url, {'username': 'prof1', 'password': 'password123'}).data['access']
+    modalidade = Modalidade.objects.create(nome="Bateria")
+    aluno = Aluno.objects.create(nome_completo="Aluno BPM")
+    for dia, bpm in ((1, "60-80"), (8, "90"), (15, "sem clique")):
+        aula = Aula.objects.create(modalidade=modalidade, data_hora=f"2025-03-{dia:02d}T10:00:00Z", status="Realizada")
+        aula.alunos.set([aluno])
+        relatorio = RelatorioAula.objects.create(aula=aula)
+        ItemRudimento.objects.create(relatorio=relatorio, descricao="Toque Simples", bpm=bpm)
+        ItemRudimento.objects.create(relatorio=relatorio, descricao="Toque Simples", bpm="70")
+    ItemRitmo.objects.create(relatorio=relatorio, descricao="Baião", bpm="100")
+
+    url = reverse('scheduling:aluno-progressao-bpm', kwargs={'pk': aluno.pk})
+    # autenticação + aluno + séries
+    with django_assert_max_num_queries(3):
+        response = client.get(url, HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data == [
+        {'tipo': 'ritmo', 'exercicio': 'Baião', 'pontos': [{'data': timezone.datetime(2025, 3, 15).date(), 'bpm': 100}]},
+        {'tipo': 'rudimento', 'exercicio': 'Toque Simples', 'pontos': [
+            {'data': timezone.datetime(2025, 3, 1).date(), 'bpm': 80},
+            {'data': timezone.datetime(2025, 3, 8).date(), 'bpm': 90},
+            {'data': timezone.datetime(2025, 3, 15).date(), 'bpm': 70},
+        ]},
+    ]
+
+    # O comando de backfill corrige valores gravados sem passar pelo save().
+    ItemRudimento.objects.update(bpm_valor=None)
+    call_command('normalizar_bpm', stdout=StringIO())
+    bpms = ItemRudimento.objects.order_by('pk').values_list('bpm_valor', flat=True)
+    assert list(bpms) == [80, 70, 90, 70, None, 70]
+
+
+@pytest.mark.django_db
+def test_dados_de_referencia_em_memoria(client, django_assert_num_queries):
+    """
+    Garante que modalidades e professores são servidos da memória enquanto
+    as tabelas não mudam, inclusive na validação dos ids ao criar aulas.
+    """
+    prof = CustomUser.objects.create_user(username='prof1', password='password123', tipo='professor')
+    token_url = reverse('users:token_obtain_pair')
+    token = client.post(token_url, {'username': 'prof1', 'password': 'password123'}).data['access']
+    modalidade = Modalidade.objects.create(nome="Bateria")
+
+    url = reverse('scheduling:modalidade-list')
+    client.get(url, HTTP_AUTHORIZATION=f'Bearer {token}')
+    client.get(reverse('users:professor-list'), HTTP_AUTHORIZATION=f'Bearer {token}')
+    # Só a autenticação vai ao banco.
+    with django_assert_num_queries(1):
+        response = client.get(url, HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert [m['nome'] for m in response.data['results']] == ["Bateria"]
+    with django_assert_num_queries(1):
+        response = client.get(reverse('users:professor-list'), HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert [p['username'] for p in response.data['results']] == ["prof1"]
+
+    # A alteração incrementa a versão e a próxima leitura já vê o novo nome.
+    modalidade.nome = "Bateria Avançada"
+    modalidade.save()
+    response = client.get(url, HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert [m['nome'] for m in response.data['results']] == ["Bateria Avançada"]
+
+    payload = {"modalidade_id": modalidade.id, "professor_ids": [prof.id], "aluno_ids": [],
+               "data_hora": "2025-05-01T10:00:00Z"}
+    response = client.post(reverse('scheduling:aula-list'), json.dumps(payload), content_type='application/json',
+                           HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert response.status_code == status.HTTP_201_CREATED
+    assert response.data['modalidade']['nome'] == "Bateria Avançada"
+
+    payload.update(modalidade_id=modalidade.id + 100, professor_ids=[prof.id + 100])
+    response = client.post(reverse('scheduling:aula-list'), json.dumps(payload), content_type='application/json',
+                           HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert set(response.data) == {'modalidade_id', 'professor_ids'}
+
+
+@pytest.mark.django_db
+def test_dados_de_referencia_desatualizados_em_outro_processo(client):
+    """
+    Simula um processo cuja cópia em memória não viu modalidades e
+    professores criados por outro (sem incremento de versão): os ids são
+    aceitos mesmo assim e a cópia expira depois de `TIMEOUT_MEMORIA`.
+    """
+    prof = CustomUser.objects.create_user(username='prof1', password='password123', tipo='professor')
+    token = client.post(reverse('users:token_obtain_pair'), {'username': 'prof1', 'password': 'password123'}).data['access']
+    Modalidade.objects.create(nome="Bateria")
+    assert len(modalidades_por_id()) == 1
+
+    # bulk_create não dispara sinais, como uma gravação feita em outro processo.
+    [nova] = Modalidade.objects.bulk_create([Modalidade(nome="Percussão")])
+    [outro_prof] = CustomUser.objects.bulk_create([CustomUser(username='prof2', tipo='professor')])
+    assert nova.pk not in modalidades_por_id()
+
+    payload = {"modalidade_id": nova.pk, "professor_ids": [prof.pk, outro_prof.pk], "aluno_ids": [],
+               "data_hora": "2025-05-01T10:00:00Z"}
+    response = client.post(reverse('scheduling:aula-list'), json.dumps(payload), content_type='application/json',
+                           HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert response.status_code == status.HTTP_201_CREATED
+    assert response.data['modalidade']['nome'] == "Percussão"
+
+    with patch('scheduling.cache.time.monotonic', return_value=time.monotonic() + TIMEOUT_MEMORIA + 1):
+        assert nova.pk in modalidades_por_id()
+
+
+def test_check_cache_compartilhado(settings):
+    settings.DEBUG = False
+    settings.CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+    assert [aviso.id for aviso in cache_compartilhado(None)] == ['scheduling.W001']
+    settings.DEBUG = True
+    assert cache_compartilhado(None) == []
+    settings.DEBUG = False
+    settings.CACHES = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache'}}
+    assert cache_compartilhado(None) == []
+
+
+@pytest.mark.django_db
+def test_cache_de_respostas_das_listagens_de_aulas(client, django_assert_num_queries):
+    """
+    Garante que a listagem de aulas é servida do cache para os mesmos
+    filtros (em qualquer ordem), invalidada por alterações nas aulas e nas
+    matrículas, e que acertos e falhas aparecem nas métricas.
+    """
+    CustomUser.objects.create_user(username='admin', password='password123', tipo='admin', is_staff=True)
+    token_url = reverse('users:token_obtain_pair')
+    token = client.post(token_url, {'username': 'admin', 'password': 'password123'}).data['access']
+    modalidade = Modalidade.objects.create(nome="Bateria")
+    aluno = Aluno.objects.create(nome_completo="Aluno Cache")
+    aula = Aula.objects.create(modalidade=modalidade, data_hora="2025-05-01T10:00:00Z", status="Agendada")
+    headers = {'HTTP_AUTHORIZATION': f'Bearer {token}'}
+
+    url = reverse('scheduling:aula-list')
+    response = client.get(f"{url}?status=Agendada&modalidade={modalidade.id}", **headers)
+    assert response['X-Cache'] == 'MISS'
+    # Mesmos filtros em outra ordem e com um parâmetro vazio: só a autenticação vai ao banco.
+    with django_assert_num_queries(1):
+        response = client.get(f"{url}?modalidade={modalidade.id}&status=Agendada&data_inicial=", **headers)
+    assert response['X-Cache'] == 'HIT'
+    assert response.data['count'] == 1
+
+    aula.alunos.add(aluno)
+    response = client.get(f"{url}?status=Agendada&modalidade={modalidade.id}", **headers)
+    assert response['X-Cache'] == 'MISS'
+    assert [a['nome_completo'] for a in response.data['results'][0]['alunos']] == ["Aluno Cache"]
+
+    aula.status = "Cancelada"
+    aula.save()
+    response = client.get(f"{url}?status=Agendada&modalidade={modalidade.id}", **headers)
+    assert response['X-Cache'] == 'MISS'
+    assert response.data['count'] == 0
+
+    response = client.get(reverse('scheduling:cache-metricas'), **headers)
+    assert response.data['resposta:AulaViewSet'] == {'hits': 1, 'misses': 3, 'taxa_acerto_percentual': 25.0}
+
+
+@pytest.mark.django_db
+def test_importacao_de_alunos_por_csv(client):
+    """
+    Garante que a importação valida todas as linhas, não grava nada em
+    dry-run e, na importação real, grava as válidas e relata as demais.
+    """
+    CustomUser.objects.create_user(username='admin', password='password123', tipo='admin', is_staff=True)
+    token = client.post(reverse('users:token_obtain_pair'), {'username': 'admin', 'password': 'password123'}).data['access']
+    Aluno.objects.create(nome_completo="Já Cadastrado", email="ja@escola.com")
+    conteudo = (
+        "Nome_Completo,Email,Telefone,Data_Criacao\n"
+        "Ana Souza,ana@escola.com,1199999,2025-02-01\n"
+        ",sem-nome@escola.com,,\n"
+        "Bruno,ja@escola.com,,\n"
+        "Carla,nao-e-email,,\n"
+        "Davi,,,01/03/2025\n"
+        "Eva,,,31/02/2025\n"
+    ).encode()
+
+    url = reverse('scheduling:importacao', kwargs={'tipo': 'alunos'})
+    response = client.post(
+        url, {'arquivo': SimpleUploadedFile('alunos.csv', conteudo), 'dry_run': 'true'},
+        HTTP_AUTHORIZATION=f'Bearer {token}'
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data['linhas_validas'] == 2
+    assert response.data['criados'] == 0
+    assert [erro['linha'] for erro in response.data['erros']] == [3, 4, 5, 7]
+    assert Aluno.objects.count() == 1
+
+    response = client.post(
+        url, {'arquivo': SimpleUploadedFile('alunos.csv', conteudo)}, HTTP_AUTHORIZATION=f'Bearer {token}'
+    )
+    assert response.data['criados'] == 2
+    davi = Aluno.objects.get(nome_completo="Davi")
+    assert str(davi.data_criacao) == '2025-03-01'
+    # bulk_create não dispara sinais: o índice de busca é atualizado pela importação.
+    busca = client.get(f"{reverse('scheduling:busca')}?q=souza", HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert busca.data['count'] == 1
+
+    response = client.post(
+        url, {'arquivo': SimpleUploadedFile('alunos.txt', conteudo)}, HTTP_AUTHORIZATION=f'Bearer {token}'
+    )
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    response = client.post(
+        url, {'arquivo': SimpleUploadedFile('alunos.xlsx', b'nao e um zip')}, HTTP_AUTHORIZATION=f'Bearer {token}'
+    )
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert response.data['criados'] == 0
+
+    # Um erro de leitura num lote posterior devolve o que já foi gravado.
+    linhas = "".join(f"Aluno {i},,,\n" for i in range(600))
+    conteudo = ("nome_completo,email,telefone,data_criacao\n" + linhas).encode() + b"Jos\xe9,,,\n"
+    response = client.post(
+        url, {'arquivo': SimpleUploadedFile('alunos.csv', conteudo)}, HTTP_AUTHORIZATION=f'Bearer {token}'
+    )
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert 'UTF-8' in response.data['error']
+    assert response.data['criados'] == 500
+
+
+@pytest.mark.django_db
+def test_importacao_de_aulas_por_xlsx(tmp_path, django_assert_max_num_queries):
+    """
+    Garante que as aulas são importadas com alunos e professores usando um
+    número fixo de queries por lote, qualquer que seja o número de linhas.
+    """
+    modalidade = Modalidade.objects.create(nome="Bateria")
+    prof = CustomUser.objects.create_user(username='prof1', password='password123', tipo='professor')
+    ana = Aluno.objects.create(nome_completo="Ana", email="ana@escola.com")
+    bruno = Aluno.objects.create(nome_completo="Bruno", email="bruno@escola.com")
+
+    workbook = Workbook()
+    planilha = workbook.active
+    planilha.append(['modalidade', 'data_hora', 'status', 'alunos', 'professores'])
+    for dia in range(1, 31):
+        planilha.append(['Bateria', datetime(2025, 4, dia, 10), None, 'ana@escola.com; bruno@escola.com', 'prof1'])
+    planilha.append(['Violão', '2025-04-02 10:00', None, '', ''])
+    planilha.append(['Bateria', '2025-04-02 10:00', 'Adiada', '', ''])
+    planilha.append(['Bateria', '02/04/2025 11:00', None, 'ninguem@escola.com', ''])
+    arquivo = tmp_path / 'aulas.xlsx'
+    workbook.save(arquivo)
+
+    saida, erros = StringIO(), StringIO()
+    # Dois lotes de 20 linhas: 3 consultas de validação, o savepoint, 3 inserts
+    # e 2 UPDATEs de contadores cada.
+    with django_assert_max_num_queries(20):
+        call_command('importar_planilha', 'aulas', str(arquivo), '--lote', '20', stdout=saida, stderr=erros)
+
+    assert '30 linhas válidas, 30 registros criados; 3 com erro.' in saida.getvalue()
+    assert 'Linha 32: Modalidade não encontrada: Violão.' in erros.getvalue()
+    assert Aula.objects.filter(modalidade=modalidade, status='Agendada').count() == 30
+    aula = Aula.objects.order_by('data_hora').first()
+    assert set(aula.alunos.all()) == {ana, bruno}
+    assert list(aula.professores.all()) == [prof]
+
+    corrompido = tmp_path / 'corrompido.xlsx'
+    corrompido.write_bytes(b'nao e um zip')
+    with pytest.raises(CommandError, match='planilha .xlsx válida'):
+        call_command('importar_planilha', 'aulas', str(corrompido), stdout=StringIO())
+
+
+@pytest.mark.django_db
+def test_encerrar_aulas_vencidas():
+    """
+    Garante que só as aulas agendadas que passaram da tolerância mudam de
+    status e que as versões de cache dos seus meses são invalidadas.
+    """
+    modalidade = Modalidade.objects.create(nome="Bateria")
+    agora = timezone.now()
+    vencidas = [
+        Aula.objects.create(modalidade=modalidade, data_hora=agora - timedelta(days=dias))
+        for dias in (3, 40, 70)
+    ]
+    recente = Aula.objects.create(modalidade=modalidade, data_hora=agora - timedelta(hours=2))
+    realizada = Aula.objects.create(modalidade=modalidade, data_hora=agora - timedelta(days=3), status="Realizada")
+    mes = tabela_do_mes('scheduling.aula', timezone.localtime(vencidas[1].data_hora))
+    versao_antes = versao(mes)
+
+    saida = StringIO()
+    call_command('encerrar_aulas_vencidas', '--dry-run', stdout=saida)
+    assert '3 aulas vencidas' in saida.getvalue()
+    assert Aula.objects.filter(status='Agendada').count() == 4
+
+    call_command('encerrar_aulas_vencidas', '--status', 'Aluno Ausente', '--lote', '2', stdout=StringIO())
+    assert set(Aula.objects.filter(status='Aluno Ausente')) == set(vencidas)
+    recente.refresh_from_db()
+    realizada.refresh_from_db()
+    assert (recente.status, realizada.status) == ('Agendada', 'Realizada')
+    assert versao(mes) != versao_antes
+
+    # Ids esparsos: os lotes só visitam aulas vencidas, não cada faixa de ids.
+    Aula.objects.create(modalidade=modalidade, data_hora=agora - timedelta(days=5))
+    Aula.objects.bulk_create(
+        Aula(modalidade=modalidade, data_hora=agora, status="Realizada") for _ in range(200)
+    )
+    Aula.objects.create(modalidade=modalidade, data_hora=agora - timedelta(days=5))
+    with CaptureQueriesContext(connection) as queries:
+        call_command('encerrar_aulas_vencidas', '--lote', '1', stdout=StringIO())
+    assert not Aula.objects.filter(status='Agendada', data_hora__lt=agora - timedelta(days=1)).exists()
+    assert len(queries) < 20
+
+
+@pytest.mark.django_db
+def test_matricula_e_presenca_na_mesma_linha(client):
+    """
+    Garante que matricular um aluno cria a linha de presença sem status,
+    que marcar a presença atualiza essa mesma linha e que um aluno fora da
+    aula rejeita o pedido inteiro, sem gravar nada.
+    """
+    professor = CustomUser.objects.create_user(username='prof', password='password123', tipo='professor')
+    token = client.post(reverse('users:token_obtain_pair'), {'username': 'prof', 'password': 'password123'}).data['access']
+    ana = Aluno.objects.create(nome_completo="Ana")
+    bruno = Aluno.objects.create(nome_completo="Bruno")
+    modalidade = Modalidade.objects.create(nome="Bateria")
+
+    response = client.post(
+        reverse('scheduling:aula-list'),
+        {'data_hora': '2025-08-11T10:00:00Z', 'modalidade_id': modalidade.id,
+         'aluno_ids': [ana.id], 'professor_ids': [professor.id]},
+        content_type='application/json', HTTP_AUTHORIZATION=f'Bearer {token}'
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+    aula = Aula.objects.get(pk=response.data['id'])
+    assert list(PresencaAluno.objects.values_list('aluno_id', 'status')) == [(ana.id, None)]
+
+    url = reverse('scheduling:aula-marcar-presenca-alunos', kwargs={'pk': aula.pk})
+    payload = [{"aluno_id": ana.id, "status": "presente"}, {"aluno_id": bruno.id, "status": "ausente"}]
+    response = client.post(url, json.dumps(payload), content_type='application/json', HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert PresencaAluno.objects.get(aluno=ana).status is None
+
+    response = client.post(url, json.dumps(payload[:1]), content_type='application/json', HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert response.status_code == status.HTTP_200_OK
+    assert list(PresencaAluno.objects.values_list('aluno_id', 'status')) == [(ana.id, 'presente')]
+
+    ana.refresh_from_db()
+    with CaptureQueriesContext(connection) as queries:
+        kpis = calcular_kpis_alunos([ana])
+    assert (kpis[ana.id]['total_aulas'], kpis[ana.id]['total_realizadas']) == (1, 1)
+    assert queries.captured_queries[0]['sql'].upper().count('SELECT') == 1
+
+
+@pytest.mark.django_db
+def test_contadores_de_matriculas_e_presencas(client):
+    """
+    Garante que os contadores acompanham matrícula, presença e status da
+    aula, que servem de filtro e ordenação e que o comando os recalcula.
+    """
+    professor = CustomUser.objects.create_user(username='prof', password='password123', tipo='professor')
+    token = client.post(reverse('users:token_obtain_pair'), {'username': 'prof', 'password': 'password123'}).data['access']
+    ana = Aluno.objects.create(nome_completo="Ana")
+    bruno = Aluno.objects.create(nome_completo="Bruno")
+    modalidade = Modalidade.objects.create(nome="Bateria")
+    aula = Aula.objects.create(modalidade=modalidade, data_hora="2025-03-10T10:00:00Z")
+    vazia = Aula.objects.create(modalidade=modalidade, data_hora="2025-03-11T10:00:00Z")
+
+    aula.alunos.set([ana, bruno])
+    aula.refresh_from_db()
+    assert (aula.num_alunos, aula.num_presentes) == (2, 0)
+
+    url = reverse('scheduling:aula-marcar-presenca-alunos', kwargs={'pk': aula.pk})
+    payload = [{"aluno_id": ana.id, "status": "presente"}, {"aluno_id": bruno.id, "status": "ausente"}]
+    client.post(url, json.dumps(payload), content_type='application/json', HTTP_AUTHORIZATION=f'Bearer {token}')
+    aula.refresh_from_db()
+    ana.refresh_from_db()
+    bruno.refresh_from_db()
+    assert (aula.num_alunos, aula.num_presentes) == (2, 1)
+    assert (ana.total_realizadas, ana.total_ausencias, ana.ultima_aula_em) == (1, 0, aula.data_hora)
+    assert (bruno.total_realizadas, bruno.total_ausencias, bruno.ultima_aula_em) == (0, 1, None)
+
+    response = client.get(
+        f"{reverse('scheduling:aula-list')}?min_alunos=1&ordering=-num_presentes",
+        HTTP_AUTHORIZATION=f'Bearer {token}'
+    )
+    assert [item['id'] for item in response.data['results']] == [aula.id]
+    response = client.get(
+        f"{reverse('scheduling:aluno-list')}?ordering=-total_realizadas", HTTP_AUTHORIZATION=f'Bearer {token}'
+    )
+    assert [item['nome_completo'] for item in response.data['results']] == ["Ana", "Bruno"]
+    response = client.get(
+        f"{reverse('scheduling:aluno-list')}?inativos_desde=2025-03-01", HTTP_AUTHORIZATION=f'Bearer {token}'
+    )
+    assert [item['nome_completo'] for item in response.data['results']] == ["Bruno"]
+
+    # Presenças, ausências e taxa do detalhe são leituras dos contadores.
+    Aluno.objects.filter(pk=ana.pk).update(total_realizadas=1, total_ausencias=3)
+    response = client.get(reverse('scheduling:aluno-detail', kwargs={'pk': ana.pk}), HTTP_AUTHORIZATION=f'Bearer {token}')
+    kpis = response.data['kpis']
+    assert (kpis['total_realizadas'], kpis['total_ausencias'], response.data['taxa_presenca']) == (1, 3, 25.0)
+    call_command('recalcular_contadores', stdout=StringIO())
+
+    # Cancelar a aula tira as presenças dos totais dos alunos.
+    aula.status = 'Cancelada'
+    aula.save()
+    ana.refresh_from_db()
+    assert ana.total_realizadas == 0
+
+    aula.alunos.remove(bruno)
+    Aula.objects.filter(pk=vazia.pk).update(num_alunos=5)
+    Aluno.objects.filter(pk=ana.pk).update(total_realizadas=7)
+    call_command('recalcular_contadores', '--lote', '1', stdout=StringIO())
+    aula.refresh_from_db()
+    vazia.refresh_from_db()
+    ana.refresh_from_db()
+    assert (aula.num_alunos, vazia.num_alunos, ana.total_realizadas) == (1, 0, 0)
+
+
+@pytest.mark.django_db
+def test_excluir_aula_ou_aluno_recalcula_contadores_uma_vez():
+    modalidade = Modalidade.objects.create(nome="Bateria")
+    alunos = [Aluno.objects.create(nome_completo=f"Aluno {i}") for i in range(20)]
+    aulas = [
+        Aula.objects.create(modalidade=modalidade, data_hora=f"2025-03-{dia:02d}T10:00:00Z", status="Realizada")
+        for dia in (10, 11)
+    ]
+    for aula in aulas:
+        aula.alunos.set(alunos, through_defaults={'status': 'presente'})
+
+    with CaptureQueriesContext(connection) as queries:
+        aulas[0].delete()
+    updates = [q['sql'] for q in queries.captured_queries if q['sql'].startswith('UPDATE')]
+    assert [sql.split()[1] for sql in updates] == ['"scheduling_aluno"']
+    assert set(Aluno.objects.values_list('total_realizadas', flat=True)) == {1}
+
+    with CaptureQueriesContext(connection) as queries:
+        Aluno.objects.filter(pk__in=[aluno.pk for aluno in alunos[:5]]).delete()
+    updates = [q['sql'] for q in queries.captured_queries if q['sql'].startswith('UPDATE')]
+    assert [sql.split()[1] for sql in updates] == ['"scheduling_aula"']
+    aulas[1].refresh_from_db()
+    assert (aulas[1].num_alunos, aulas[1].num_presentes) == (15, 15)
+
+
+@pytest.mark.django_db
+def test_exclusao_desfeita_nao_vaza_matriculas_para_a_seguinte():
+    modalidade = Modalidade.objects.create(nome="Bateria")
+    ana, bruno = Aluno.objects.create(nome_completo="Ana"), Aluno.objects.create(nome_completo="Bruno")
+    aula_ana, aula_bruno = (
+        Aula.objects.create(modalidade=modalidade, data_hora=f"2025-03-{dia:02d}T10:00:00Z") for dia in (10, 11)
+    )
+    aula_ana.alunos.add(ana)
+    aula_bruno.alunos.add(bruno)
+
+    def falhar(**kwargs):
+        raise RuntimeError
+    post_delete.connect(falhar, sender=PresencaAluno)
+    try:
+        with pytest.raises(RuntimeError), transaction.atomic():
+            aula_ana.delete()
+    finally:
+        post_delete.disconnect(falhar, sender=PresencaAluno)
+
+    with patch('scheduling.signals.atualizar_contadores_das_matriculas') as atualizar:
+        bruno.delete()
+    atualizar.assert_called_once_with({aula_bruno.pk}, None)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_migracao_das_matriculas_descarta_presencas_orfas():
+    anterior, atual = [('scheduling', '0005_exercicio')], [('scheduling', '0006_presenca_aluno_matricula')]
+    executor = MigrationExecutor(connection)
+    executor.migrate(anterior)
+    apps = executor.loader.project_state(anterior).apps
+    Aluno, Aula = apps.get_model('scheduling', 'Aluno'), apps.get_model('scheduling', 'Aula')
+    ana, bruno, caio = (Aluno.objects.create(nome_completo=nome) for nome in ("Ana", "Bruno", "Caio"))
+    modalidade = apps.get_model('scheduling', 'Modalidade').objects.create(nome="Bateria")
+    aula = Aula.objects.create(modalidade=modalidade, data_hora="2025-03-10T10:00:00Z", status="Realizada")
+    aula.alunos.set([ana, bruno])
+    presencas = apps.get_model('scheduling', 'PresencaAluno').objects
+    presencas.create(aula=aula, aluno=ana, status='presente')
+    # Caio saiu da aula depois da chamada.
+    presencas.create(aula=aula, aluno=caio, status='ausente')
+
+    executor = MigrationExecutor(connection)
+    executor.migrate(atual)
+    apps = executor.loader.project_state(atual).apps
+    linhas = apps.get_model('scheduling', 'PresencaAluno').objects.values_list('aluno__nome_completo', 'status')
+    assert sorted(linhas) == [("Ana", 'presente'), ("Bruno", None)]
+
+    # Na volta, a matrícula sem presença continua em aula_alunos.
+    executor = MigrationExecutor(connection)
+    executor.migrate(anterior)
+    apps = executor.loader.project_state(anterior).apps
+    aula = apps.get_model('scheduling', 'Aula').objects.get()
+    assert sorted(aula.alunos.values_list('nome_completo', flat=True)) == ["Ana", "Bruno"]
+    linhas = apps.get_model('scheduling', 'PresencaAluno').objects.values_list('aluno__nome_completo', 'status')
+    assert list(linhas) == [("Ana", 'presente')]
+
+    executor = MigrationExecutor(connection)
+    executor.loader.build_graph()
+    executor.migrate(executor.loader.graph.leaf_nodes())
+
+
+@pytest.mark.django_db(transaction=True)
+def test_migracao_dos_contadores_preenche_linhas_existentes():
+    executor = MigrationExecutor(connection)
+    anterior, atual = [('scheduling', '0006_presenca_aluno_matricula')], [('scheduling', '0007_contadores')]
+    executor.migrate(anterior)
+    apps = executor.loader.project_state(anterior).apps
+    aluno = apps.get_model('scheduling', 'Aluno').objects.create(nome_completo="Ana")
+    modalidade = apps.get_model('scheduling', 'Modalidade').objects.create(nome="Bateria")
+    aula = apps.get_model('scheduling', 'Aula').objects.create(
+        modalidade=modalidade, data_hora="2025-03-10T10:00:00Z", status="Realizada"
+    )
+    apps.get_model('scheduling', 'PresencaAluno').objects.create(aula=aula, aluno=aluno, status='presente')
+
+    executor = MigrationExecutor(connection)
+    executor.migrate(atual)
+    apps = executor.loader.project_state(atual).apps
+    aula = apps.get_model('scheduling', 'Aula').objects.get()
+    aluno = apps.get_model('scheduling', 'Aluno').objects.get()
+    assert (aula.num_alunos, aula.num_presentes) == (1, 1)
+    assert (aluno.total_realizadas, aluno.total_ausencias, aluno.ultima_aula_em) == (1, 0, aula.data_hora)
+
+    executor = MigrationExecutor(connection)
+    executor.loader.build_graph()
+    executor.migrate(executor.loader.graph.leaf_nodes())
+
+
+def _criar_aulas_para_admin(quantidade, modalidade, professor):
+    for i in range(quantidade):
+        aula = Aula.objects.create(modalidade=modalidade, data_hora=f"2025-05-{i + 1:02d}T10:00:00Z", status="Realizada")
+        alunos = [Aluno.objects.create(nome_completo=f"Aluno {aula.pk}-{j}") for j in range(2)]
+        aula.alunos.set(alunos, through_defaults={'status': 'presente'})
+        aula.professores.set([professor])
+        PresencaProfessor.objects.create(aula=aula, professor=professor, status='presente')
+        RelatorioAula.objects.create(aula=aula, professor_que_validou=professor)
+
+
+@pytest.mark.django_db
+def test_admin_changelists_com_queries_constantes(admin_client):
+    """
+    Garante que as listagens do admin de aulas, presenças e relatórios
+    fazem o mesmo número de queries com poucas ou muitas linhas na página.
+    """
+    modalidade = Modalidade.objects.create(nome="Bateria")
+    professor = CustomUser.objects.create_user(username='prof', password='password123', tipo='professor')
+    urls = [
+        reverse(f'admin:scheduling_{modelo}_changelist')
+        for modelo in ('aula', 'presencaaluno', 'presencaprofessor', 'relatorioaula')
+    ]
+
+    def contar_queries():
+        contagens = []
+        for url in urls:
+            with CaptureQueriesContext(connection) as queries:
+                response = admin_client.get(url)
+            assert response.status_code == 200
+            contagens.append(len(queries))
+        return contagens
+
+    _criar_aulas_para_admin(2, modalidade, professor)
+    poucas = contar_queries()
+    _criar_aulas_para_admin(8, modalidade, professor)
+    assert contar_queries() == poucas
+
+    response = admin_client.get(f"{urls[0]}?professores__id__exact={professor.pk}")
+    assert response.context['cl'].result_count == 10
+    assert "Aluno" in response.content.decode()
+
+
+@pytest.mark.django_db
+def test_admin_contagem_estimada(monkeypatch):
+    """
+    Garante que, sem filtros e acima do limite, a paginação do admin usa a
+    estatística do banco e que listagens filtradas usam a contagem exata.
+    """
+    modalidade = Modalidade.objects.create(nome="Bateria")
+    for dia in range(1, 4):
+        Aula.objects.create(modalidade=modalidade, data_hora=f"2025-05-{dia:02d}T10:00:00Z")
+    with connection.cursor() as cursor:
+        cursor.execute("ANALYZE scheduling_aula")
+    Aula.objects.filter(data_hora__day=3).delete()
+
+    monkeypatch.setattr(PaginadorContagemEstimada, 'limite_estimativa', 1)
+    # A estatística ainda é a de antes da exclusão: a contagem é estimada.
+    assert PaginadorContagemEstimada(Aula.objects.order_by('pk'), 100).count == 3
+    assert PaginadorContagemEstimada(Aula.objects.filter(status='Agendada').order_by('pk'), 100).count == 2
+
+    monkeypatch.setattr(PaginadorContagemEstimada, 'limite_estimativa', 10000)
+    assert PaginadorContagemEstimada(Aula.objects.order_by('pk'), 100).count == 2
+
+    # Uma página vazia por causa da estimativa refaz a conta exata.
+    monkeypatch.setattr(PaginadorContagemEstimada, 'limite_estimativa', 1)
+    paginador = PaginadorContagemEstimada(Aula.objects.order_by('pk'), 1)
+    assert paginador.num_pages == 3
+    with pytest.raises(EmptyPage):
+        paginador.page(3)
+    assert (paginador.count, paginador.num_pages) == (2, 2)
+    assert len(paginador.page(2)) == 1
@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import AulasParaSubstituirAPIView, ModalidadeViewSet, AlunoViewSet, AulaViewSet, RelatorioAulaViewSet
+from .views import AulasParaSubstituirAPIView, BootstrapAPIView, BuscaAPIView, ImportacaoAPIView, MetricasCacheAPIView, ModalidadeViewSet, AlunoViewSet, AulaViewSet, RelatorioAulaViewSet
 
 app_name = "scheduling"
 
@@ -11,6 +11,10 @@ router.register(r'aulas', AulaViewSet, basename='aula')
 router.register(r'relatorios', RelatorioAulaViewSet, basename='relatorio')
 
 urlpatterns = [
+    path("bootstrap/", BootstrapAPIView.as_view(), name="bootstrap"),
+    path("busca/", BuscaAPIView.as_view(), name="busca"),
+    path("importacao/<str:tipo>/", ImportacaoAPIView.as_view(), name="importacao"),
+    path("cache/metricas/", MetricasCacheAPIView.as_view(), name="cache-metricas"),
     path("aulas/substituicao/", AulasParaSubstituirAPIView.as_view(), name="aulas-substituicao"),
     path('', include(router.urls)),
 ]
@@ -1,19 +1,40 @@
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import CharField, Count, IntegerField, Max, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate
 from django.utils import timezone
 from rest_framework import generics, viewsets, permissions, status
 from rest_framework.decorators import action
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
-from .filters import AulaFilter
-from .models import Modalidade, Aluno, Aula, PresencaAluno, PresencaProfessor, RelatorioAula
-from .serializers import ModalidadeSerializer, AlunoSerializer, AlunoDetailSerializer, AulaSerializer, PresencaAlunoSerializer, PresencaProfessorSerializer, RelatorioAulaSerializer, ModalidadeDetailSerializer
+from rest_framework.views import APIView
+from users.models import CustomUser
+from .cache import metricas, obter_ou_calcular
+from .fast_serializers import (
+    FastListMixin, AlunoValuesSerializer, AulaValuesSerializer, ModalidadeValuesSerializer,
+    ProfessorSimpleValuesSerializer, agrupar_ids_m2m,
+)
+from .filters import AlunoFilter, AulaFilter, RelatorioAulaFilter
+from .importacao import IMPORTACOES, ler_planilha
+from .mixins import BatchRetrieveMixin, RespostaEmCacheMixin, SparseFieldsetMixin
+from .search import TIPOS, ResultadosBusca
+from .signals import atualizar_contadores_das_matriculas
+from .models import Modalidade, Aluno, Aula, PresencaProfessor, RelatorioAula, ItemRudimento, ItemRitmo, ItemVirada
+from .serializers import ModalidadeSerializer, AlunoSerializer, AlunoDetailSerializer, AulaSerializer, PresencaAlunoSerializer, PresencaProfessorSerializer, RelatorioAulaSerializer, RelatorioAulaResumoSerializer, ModalidadeDetailSerializer
 from reporting.services import gerar_relatorio_ia_para_aluno
 
 
-class ModalidadeViewSet(viewsets.ModelViewSet):
+class ModalidadeViewSet(SparseFieldsetMixin, FastListMixin, viewsets.ModelViewSet):
     """
     Endpoint da API que permite que modalidades sejam visualizadas ou editadas.
+    A listagem é servida da memória enquanto a tabela não muda.
     """
     queryset = Modalidade.objects.all().order_by('nome')
     permission_classes = [permissions.IsAuthenticated]
+    fast_serializer_class = ModalidadeValuesSerializer
+    tabelas_em_memoria = ['scheduling.modalidade']
+    expandable_fields = {'kpis': (), 'monthly_activity_chart': ()}
 
     def get_serializer_class(self):
         if self.action == 'retrieve':
@@ -21,19 +42,32 @@ class ModalidadeViewSet(viewsets.ModelViewSet):
         return ModalidadeSerializer
 
 
-class AlunoViewSet(viewsets.ModelViewSet):
+class AlunoViewSet(SparseFieldsetMixin, BatchRetrieveMixin, FastListMixin, viewsets.ModelViewSet):
     """
     Endpoint da API que permite que alunos sejam visualizados ou editados.
-    Usa um serializer diferente para a visualização de detalhes.
+    Usa um serializer diferente para a visualização de detalhes e para a
+    busca em lote (`?ids=1,2,3`).
     """
     queryset = Aluno.objects.all().order_by('nome_completo')
     permission_classes = [permissions.IsAuthenticated]
+    fast_serializer_class = AlunoValuesSerializer
+    filterset_class = AlunoFilter
+    expandable_fields = {'kpis': (), 'taxa_presenca': ()}
 
     def get_serializer_class(self):
-        if self.action == 'retrieve':
+        if self.action == 'retrieve' or self.is_batch_request:
             return AlunoDetailSerializer
         return AlunoSerializer
 
+    @action(detail=True, methods=['get'], url_path='progressao-bpm')
+    def progressao_bpm(self, request, pk=None):
+        """
+        Retorna a evolução do andamento (BPM) do aluno em cada exercício:
+        para cada dia de aula, o maior BPM registrado no exercício.
+        """
+        aluno = self.get_object()
+        return Response(progressao_bpm(aluno.pk))
+
     @action(detail=True, methods=['post'], url_path='gerar-relatorio-ia')
     def gerar_relatorio_ia(self, request, pk=None):
         """
@@ -56,13 +90,26 @@ class AlunoViewSet(viewsets.ModelViewSet):
             )
 
 
-class AulaViewSet(viewsets.ModelViewSet):
+# Tabelas presentes nas representações de aula (com modalidade, alunos e professores).
+TABELAS_AULAS = ['scheduling.aula', 'scheduling.aluno', 'scheduling.modalidade', 'users.customuser']
+
+
+class AulaViewSet(SparseFieldsetMixin, RespostaEmCacheMixin, BatchRetrieveMixin, FastListMixin, viewsets.ModelViewSet):
     """
     Endpoint da API para visualizar e agendar aulas.
+    A listagem não depende do usuário, então a resposta em cache é
+    compartilhada entre todos para os mesmos filtros.
     """
     queryset = Aula.objects.all().order_by('-data_hora')
     serializer_class = AulaSerializer
+    fast_serializer_class = AulaValuesSerializer
     permission_classes = [permissions.IsAuthenticated]
+    tabelas_cache_resposta = TABELAS_AULAS
+    expandable_fields = {
+        'modalidade': ('modalidade',),
+        'alunos': ('alunos',),
+        'professores': ('professores',),
+    }
 
     filterset_class = AulaFilter
 
@@ -78,27 +125,32 @@ class AulaViewSet(viewsets.ModelViewSet):
         if not serializer.is_valid():
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-        for item in serializer.validated_data:
-            aluno_id = item['aluno_id']
-            status_presenca = item['status']
-
-            if not aula.alunos.filter(id=aluno_id).exists():
+        # A presença fica na própria matrícula: uma query confere todos os
+        # alunos e um UPDATE por status grava as presenças.
+        status_por_aluno = {item['aluno_id']: item['status'] for item in serializer.validated_data}
+        matriculados = set(
+            aula.presencas_alunos.filter(aluno_id__in=status_por_aluno).values_list('aluno_id', flat=True)
+        )
+        for aluno_id in status_por_aluno:
+            if aluno_id not in matriculados:
                 return Response(
                     {'error': f'O aluno com ID {aluno_id} não está nesta aula.'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
-            PresencaAluno.objects.update_or_create(
-                aula=aula,
-                aluno_id=aluno_id,
-                defaults={'status': status_presenca}
-            )
-
-        if not PresencaAluno.objects.filter(aula=aula, status='presente').exists():
-            aula.status = 'Aluno Ausente'
-        else:
-            aula.status = 'Realizada'
-        aula.save()
+        with transaction.atomic():
+            for status_presenca in set(status_por_aluno.values()):
+                aula.presencas_alunos.filter(
+                    aluno_id__in=[pk for pk, valor in status_por_aluno.items() if valor == status_presenca]
+                ).update(status=status_presenca)
+            # update() não dispara sinais.
+            atualizar_contadores_das_matriculas([aula.pk], list(status_por_aluno))
+
+            if not aula.presencas_alunos.filter(status='presente').exists():
+                aula.status = 'Aluno Ausente'
+            else:
+                aula.status = 'Realizada'
+            aula.save()
 
         return Response({'status': 'presença atualizada com sucesso'}, status=status.HTTP_200_OK)
 
@@ -137,13 +189,83 @@ class AulaViewSet(viewsets.ModelViewSet):
         return Response({'status': 'presença de professores atualizada com sucesso'}, status=status.HTTP_200_OK)
 
 
-class RelatorioAulaViewSet(viewsets.ModelViewSet):
+def progressao_bpm(aluno_id):
+    """
+    Monta as séries de BPM por exercício de um aluno com uma única query:
+    os três tipos de item são agrupados por exercício e dia da aula e unidos
+    com UNION ALL. Usa apenas itens com `bpm_valor` preenchido.
+    """
+    tipos = (('rudimento', ItemRudimento), ('ritmo', ItemRitmo), ('virada', ItemVirada))
+    consultas = [
+        model.objects.filter(
+            relatorio__aula__alunos=aluno_id, bpm_valor__isnull=False
+        ).annotate(
+            tipo=Value(tipo, output_field=CharField()),
+            data=TruncDate('relatorio__aula__data_hora'),
+        ).values('tipo', 'descricao', 'data').annotate(bpm=Max('bpm_valor')).order_by()
+        for tipo, model in tipos
+    ]
+    linhas = consultas[0].union(*consultas[1:], all=True).order_by('tipo', 'descricao', 'data')
+
+    series = {}
+    for linha in linhas:
+        serie = series.setdefault((linha['tipo'], linha['descricao']), {
+            'tipo': linha['tipo'], 'exercicio': linha['descricao'], 'pontos': []
+        })
+        serie['pontos'].append({'data': linha['data'], 'bpm': linha['bpm']})
+    return list(series.values())
+
+
+def agregado_itens(model, expressao):
+    """Subquery que agrega `expressao` sobre os itens de cada relatório."""
+    return Coalesce(
+        Subquery(
+            model.objects.filter(relatorio=OuterRef('pk')).order_by()
+            .values('relatorio').annotate(valor=expressao).values('valor'),
+            output_field=IntegerField(),
+        ),
+        0,
+    )
+
+
+class RelatorioAulaViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
     """
     Endpoint da API para criar e visualizar relatórios de aulas.
+    Com `?summary=1`, a listagem traz apenas contagens e duração total dos
+    itens, calculadas no banco, em vez dos textos e itens aninhados.
     """
-    queryset = RelatorioAula.objects.all()
+    queryset = RelatorioAula.objects.all().order_by('-aula__data_hora')
     serializer_class = RelatorioAulaSerializer
     permission_classes = [permissions.IsAuthenticated]
+    filterset_class = RelatorioAulaFilter
+    expandable_fields = {
+        'itens_rudimentos': ('itens_rudimentos',),
+        'itens_ritmo': ('itens_ritmo',),
+        'itens_viradas': ('itens_viradas',),
+    }
+
+    @property
+    def is_summary_request(self):
+        return self.action == 'list' and self.request.query_params.get('summary') in ('1', 'true')
+
+    def get_serializer_class(self):
+        if self.is_summary_request:
+            return RelatorioAulaResumoSerializer
+        return RelatorioAulaSerializer
+
+    def get_queryset(self):
+        if not self.is_summary_request:
+            return super().get_queryset()
+
+        duracoes = [agregado_itens(model, Sum('duracao_min')) for model in (ItemRudimento, ItemRitmo, ItemVirada)]
+        return self.queryset.only(
+            'id', 'aula_id', 'professor_que_validou_id', 'data_atualizacao'
+        ).annotate(
+            total_rudimentos=agregado_itens(ItemRudimento, Count('id')),
+            total_ritmos=agregado_itens(ItemRitmo, Count('id')),
+            total_viradas=agregado_itens(ItemVirada, Count('id')),
+            duracao_total_min=duracoes[0] + duracoes[1] + duracoes[2],
+        )
 
     def perform_create(self, serializer):
         """
@@ -152,13 +274,23 @@ class RelatorioAulaViewSet(viewsets.ModelViewSet):
         serializer.save(professor_que_validou=self.request.user)
 
 
-class AulasParaSubstituirAPIView(generics.ListAPIView):
+class AulasParaSubstituirAPIView(SparseFieldsetMixin, RespostaEmCacheMixin, FastListMixin, generics.ListAPIView):
     """
     Endpoint que lista aulas futuras disponíveis para substituição.
     Filtra aulas agendadas que não pertencem ao usuário logado.
+    Aceita `?fields=` e `?expand=` como a listagem de aulas.
     """
+    queryset = Aula.objects.all()
     serializer_class = AulaSerializer
+    fast_serializer_class = AulaValuesSerializer
     permission_classes = [permissions.IsAuthenticated]
+    tabelas_cache_resposta = TABELAS_AULAS
+    cache_por_usuario = True
+    expandable_fields = {
+        'modalidade': ('modalidade',),
+        'alunos': ('alunos',),
+        'professores': ('professores',),
+    }
     filterset_class = AulaFilter
 
     def get_queryset(self):
@@ -168,7 +300,7 @@ class AulasParaSubstituirAPIView(generics.ListAPIView):
         user = self.request.user
         now = timezone.now()
 
-        queryset = Aula.objects.filter(
+        queryset = super().get_queryset().filter(
             data_hora__gte=now,
             status='Agendada'
         ).exclude(
@@ -176,3 +308,172 @@ class AulasParaSubstituirAPIView(generics.ListAPIView):
         ).distinct().order_by('data_hora')
 
         return queryset
+
+
+class BootstrapAPIView(APIView):
+    """
+    Endpoint que entrega, em uma única requisição, os dados de referência
+    usados pelo app (modalidades, professores e alunos) e as aulas da semana
+    atual do usuário logado.
+
+    As aulas trazem apenas os ids de modalidade, alunos e professores, que
+    são resolvidos pelos dados de referência do próprio payload. Ambas as
+    partes vêm de um cache versionado, invalidado quando as tabelas mudam.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    tabelas_referencia = ['scheduling.modalidade', 'users.customuser', 'scheduling.aluno']
+    tabelas_aulas = ['scheduling.aula']
+
+    def get(self, request, *args, **kwargs):
+        hoje = timezone.localdate()
+        inicio_semana = hoje - timedelta(days=hoje.weekday())
+        fim_semana = inicio_semana + timedelta(days=6)
+
+        referencia = obter_ou_calcular('bootstrap:referencia', self.tabelas_referencia, self.dados_referencia)
+        aulas = obter_ou_calcular(
+            'bootstrap:aulas', self.tabelas_aulas,
+            lambda: self.aulas_da_semana(request.user, inicio_semana, fim_semana),
+            request.user.pk, inicio_semana,
+        )
+
+        return Response({
+            **referencia,
+            'semana': {'inicio': inicio_semana, 'fim': fim_semana},
+            'aulas_da_semana': aulas,
+        })
+
+    def dados_referencia(self):
+        modalidades = ModalidadeValuesSerializer()
+        professores = ProfessorSimpleValuesSerializer()
+        alunos = AlunoValuesSerializer()
+        return {
+            'modalidades': modalidades.serializar(
+                modalidades.preparar(Modalidade.objects.order_by('nome'))
+            ),
+            'professores': professores.serializar(professores.preparar(
+                CustomUser.objects.filter(tipo__in=['professor', 'admin']).order_by('username')
+            )),
+            'alunos': alunos.serializar(alunos.preparar(Aluno.objects.order_by('nome_completo'))),
+        }
+
+    def aulas_da_semana(self, user, inicio_semana, fim_semana):
+        aulas = AulaValuesSerializer(nomes=['id', 'data_hora', 'status'])
+        linhas = list(aulas.preparar(
+            Aula.objects.filter(
+                professores=user,
+                data_hora__date__gte=inicio_semana,
+                data_hora__date__lte=fim_semana,
+            ).order_by('data_hora')
+        ))
+        aula_ids = [linha['id'] for linha in linhas]
+        alunos_por_aula = agrupar_ids_m2m(Aula.alunos, aula_ids)
+        professores_por_aula = agrupar_ids_m2m(Aula.professores, aula_ids)
+
+        return [
+            {
+                **aulas.serializar_linha(linha),
+                'modalidade_id': linha['modalidade_id'],
+                'aluno_ids': alunos_por_aula[linha['id']],
+                'professor_ids': professores_por_aula[linha['id']],
+            }
+            for linha in linhas
+        ]
+
+
+class BuscaAPIView(APIView):
+    """
+    Endpoint de busca textual sobre alunos (nome e email) e relatórios de
+    aula (campos de texto e descrição dos itens).
+
+    `?q=paradiddle` é obrigatório; `?tipo=aluno` ou `?tipo=relatorio`
+    restringe o tipo de resultado. Os resultados vêm ordenados por
+    relevância e paginados, cada um com um trecho destacando os termos.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = PageNumberPagination
+
+    def get(self, request, *args, **kwargs):
+        texto = request.query_params.get('q', '').strip()
+        tipo = request.query_params.get('tipo') or None
+        if not texto:
+            return Response({'error': 'O parâmetro q é obrigatório.'}, status=status.HTTP_400_BAD_REQUEST)
+        if tipo is not None and tipo not in TIPOS:
+            return Response(
+                {'error': f"O parâmetro tipo deve ser um de: {', '.join(TIPOS)}."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        paginator = self.pagination_class()
+        resultados = paginator.paginate_queryset(ResultadosBusca(texto, tipo), request, view=self)
+        return paginator.get_paginated_response(self.com_titulos(resultados))
+
+    def com_titulos(self, resultados):
+        """Completa os resultados da página com uma query por tipo."""
+        ids = {tipo: [r['id'] for r in resultados if r['tipo'] == tipo] for tipo in TIPOS}
+        alunos = dict(Aluno.objects.filter(pk__in=ids['aluno']).values_list('id', 'nome_completo'))
+        relatorios = {
+            relatorio.pk: relatorio
+            for relatorio in RelatorioAula.objects.filter(pk__in=ids['relatorio']).select_related('aula')
+        }
+
+        for resultado in resultados:
+            if resultado['tipo'] == 'aluno':
+                resultado['titulo'] = alunos.get(resultado['id'])
+            else:
+                relatorio = relatorios.get(resultado['id'])
+                resultado['titulo'] = str(relatorio) if relatorio else None
+                resultado['aula_id'] = relatorio.aula_id if relatorio else None
+        return resultados
+
+
+class ImportacaoAPIView(APIView):
+    """
+    Endpoint de importação em lote de alunos ou aulas a partir de uma
+    planilha CSV ou XLSX enviada no campo `arquivo` (ver `importacao.py`
+    para as colunas aceitas).
+
+    Com `dry_run=true` a planilha é apenas validada. As linhas válidas são
+    importadas mesmo quando outras falham; o resumo traz o número de linhas
+    válidas, de registros criados e os erros de cada linha rejeitada.
+    Se o arquivo não puder ser lido até o fim, a resposta é 400 com o erro
+    e o resumo dos lotes gravados antes dele.
+    """
+    permission_classes = [permissions.IsAdminUser]
+    parser_classes = [MultiPartParser]
+
+    def post(self, request, tipo, *args, **kwargs):
+        if tipo not in IMPORTACOES:
+            return Response(
+                {'error': f"Tipo de importação inválido. Use um de: {', '.join(IMPORTACOES)}."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        arquivo = request.FILES.get('arquivo')
+        if arquivo is None:
+            return Response({'error': 'Envie a planilha no campo arquivo.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        importacao = IMPORTACOES[tipo](dry_run=request.data.get('dry_run') in ('1', 'true'))
+        try:
+            resumo = importacao.executar(ler_planilha(arquivo, arquivo.name))
+        except ValueError as exc:
+            return Response({'error': str(exc), **importacao.resumo()}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(resumo)
+
+
+class MetricasCacheAPIView(APIView):
+    """
+    Endpoint com os acertos e falhas dos caches de resposta das listagens.
+    """
+    permission_classes = [permissions.IsAdminUser]
+    views_com_cache = [AulaViewSet, AulasParaSubstituirAPIView]
+
+    def get(self, request, *args, **kwargs):
+        resultado = {}
+        for view in self.views_com_cache:
+            contagens = metricas(view.nome_cache_resposta())
+            total = contagens['hit'] + contagens['miss']
+            resultado[view.nome_cache_resposta()] = {
+                'hits': contagens['hit'],
+                'misses': contagens['miss'],
+                'taxa_acerto_percentual': round(contagens['hit'] / total * 100, 2) if total else 0.0,
+            }
+        return Response(resultado)
@@ -0,0 +1,7 @@
+from scheduling.fast_serializers import ValuesSerializer
+from .serializers import UserSerializer
+
+
+class UserValuesSerializer(ValuesSerializer):
+    """Equivalente somente leitura do `UserSerializer` para listagens."""
+    serializer_class = UserSerializer
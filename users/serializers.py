@@ -1,7 +1,14 @@
+from collections import defaultdict
+from datetime import timedelta
+
 from rest_framework import serializers
-from django.db.models import Count, Q
+from django.db.models import Count, DateField, Exists, F, OuterRef, Q
+from django.db.models.functions import TruncMonth
+from django.db.models.manager import BaseManager
+from django.utils.dateparse import parse_date
 from .models import CustomUser
-from scheduling.models import Aula, PresencaProfessor
+from scheduling.filters import inicio_do_dia
+from scheduling.models import Aula, PresencaProfessor, RelatorioAula
 from django.contrib.auth.password_validation import validate_password
 from django.core.validators import RegexValidator
 
@@ -63,6 +70,91 @@ class UserSerializer(serializers.ModelSerializer):
         fields = ('id', 'username', 'email', 'first_name', 'last_name', 'tipo', 'profile_picture_url')
 
 
+def calcular_kpis_professores(professor_ids, data_inicial=None, data_final=None, por_mes=False):
+    """
+    Calcula os KPIs de performance de vários professores de uma só vez.
+
+    Usa três queries agrupadas por professor (aulas atribuídas, relatórios
+    validados e presenças em atividades complementares), independentemente
+    do número de professores. O período vira um intervalo sobre `data_hora`,
+    que usa o índice da coluna. Retorna {professor_id: kpis} ou, com
+    `por_mes`, {(professor_id, primeiro dia do mês da aula): kpis} apenas
+    para os meses com alguma aula.
+    """
+    periodo = Q()
+    if data_inicial:
+        periodo &= Q(aula__data_hora__gte=inicio_do_dia(data_inicial))
+    if data_final:
+        periodo &= Q(aula__data_hora__lt=inicio_do_dia(data_final + timedelta(days=1)))
+    mes = {'mes': TruncMonth('aula__data_hora', output_field=DateField())} if por_mes else {}
+    atividade_complementar = Q(aula__modalidade__nome__icontains="atividade complementar")
+    atribuicoes = Aula.professores.through.objects
+
+    def atribuido(campo_professor):
+        return Exists(atribuicoes.filter(aula_id=OuterRef('aula_id'), customuser_id=OuterRef(campo_professor)))
+
+    validou_outro = Q(aula__relatorio__professor_que_validou__isnull=True) | ~Q(
+        aula__relatorio__professor_que_validou=F('customuser_id')
+    )
+    consultas = (
+        ('customuser_id', atribuicoes.filter(periodo, customuser_id__in=professor_ids).values(
+            'customuser_id', **mes
+        ).annotate(
+            total_agendadas=Count('id', filter=Q(aula__status='Agendada')),
+            total_canceladas=Count('id', filter=Q(aula__status='Cancelada')),
+            total_substituicoes_sofridas=Count('id', filter=Q(aula__status='Realizada') & validou_outro),
+        )),
+        # Aulas normais contam pelo relatório validado pelo professor.
+        ('professor_que_validou_id', RelatorioAula.objects.filter(
+            periodo, professor_que_validou_id__in=professor_ids
+        ).values('professor_que_validou_id', **mes).annotate(
+            total_realizadas=Count(
+                'id', filter=Q(aula__status__in=['Realizada', 'Aluno Ausente']) & ~atividade_complementar
+            ),
+            total_substituicoes_feitas=Count(
+                'id', filter=Q(aula__status='Realizada') & ~atribuido('professor_que_validou_id')
+            ),
+        )),
+        # Atividades complementares contam pela presença registrada.
+        ('professor_id', PresencaProfessor.objects.filter(
+            periodo, atividade_complementar, professor_id__in=professor_ids,
+            status='presente', aula__status='Realizada',
+        ).filter(
+            atribuido('professor_id') | Q(aula__relatorio__professor_que_validou=F('professor_id'))
+        ).values('professor_id', **mes).annotate(total_realizadas=Count('id'))),
+    )
+
+    def vazio():
+        return {
+            'total_realizadas': 0,
+            'total_agendadas': 0,
+            'total_canceladas': 0,
+            'total_substituicoes_feitas': 0,
+            'total_substituicoes_sofridas': 0,
+        }
+
+    kpis = defaultdict(vazio) if por_mes else {professor_id: vazio() for professor_id in professor_ids}
+    for campo_professor, linhas in consultas:
+        for linha in linhas.order_by():
+            professor_id = linha.pop(campo_professor)
+            chave = (professor_id, linha.pop('mes')) if por_mes else professor_id
+            for nome, total in linha.items():
+                kpis[chave][nome] += total
+    if por_mes:
+        # Um mês só entra na folha se tiver alguma aula contabilizada.
+        kpis = {chave: valores for chave, valores in kpis.items() if any(valores.values())}
+    return dict(kpis)
+
+
+class ProfessorDetailListSerializer(serializers.ListSerializer):
+    """Calcula os KPIs de todos os professores da lista de uma só vez."""
+
+    def to_representation(self, data):
+        professores = list(data.all() if isinstance(data, BaseManager) else data)
+        self.child.kpis_por_professor = self.child.calcular_kpis([p.pk for p in professores])
+        return super().to_representation(professores)
+
+
 class ProfessorDetailSerializer(serializers.ModelSerializer):
     """
     Serializer detalhado para um único professor, calculando seus KPIs de performance.
@@ -75,52 +167,33 @@ class ProfessorDetailSerializer(serializers.ModelSerializer):
             'id', 'username', 'email', 'first_name', 'last_name', 'tipo',
             'profile_picture_url', 'kpis'
         ]
+        list_serializer_class = ProfessorDetailListSerializer
 
-    def get_kpis(self, professor):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.kpis_por_professor = {}
+
+    def calcular_kpis(self, professor_ids):
         """
-        Calcula os KPIs de performance baseados nas aulas do professor.
+        Calcula os KPIs dos professores informados.
         Lê os filtros de data a partir dos parâmetros da URL.
         """
         request = self.context.get('request')
-        data_inicial_str = request.query_params.get('data_inicial')
-        data_final_str = request.query_params.get('data_final')
-
-        aulas_relacionadas = Aula.objects.filter(
-            Q(professores=professor) | Q(relatorio__professor_que_validou=professor)
-        ).distinct()
-
-        # Aplica filtros de data, se existirem
-        if data_inicial_str:
-            aulas_relacionadas = aulas_relacionadas.filter(data_hora__date__gte=data_inicial_str)
-        if data_final_str:
-            aulas_relacionadas = aulas_relacionadas.filter(data_hora__date__lte=data_final_str)
-
-        # Contagem de aulas normais que ele validou
-        realizadas_normal = aulas_relacionadas.filter(
-            status__in=['Realizada', 'Aluno Ausente'],
-            relatorio__professor_que_validou=professor
-        ).exclude(modalidade__nome__icontains="atividade complementar").count()
-
-        realizadas_ac = aulas_relacionadas.filter(
-            status='Realizada',
-            modalidade__nome__icontains="atividade complementar",
-            presencas_professores__professor=professor,
-            presencas_professores__status='presente'
-        ).count()
-        
-        # Lógica de substituição
-        total_substituicoes_feitas = aulas_relacionadas.filter(
-            status='Realizada', relatorio__professor_que_validou=professor
-        ).exclude(professores=professor).count()
-
-        total_substituicoes_sofridas = aulas_relacionadas.filter(
-            status='Realizada', professores=professor
-        ).exclude(relatorio__professor_que_validou=professor).count()
+        datas = {}
+        for nome in ('data_inicial', 'data_final'):
+            valor = request.query_params.get(nome)
+            try:
+                datas[nome] = parse_date(valor) if valor else None
+            except ValueError:
+                datas[nome] = None
+            if valor and datas[nome] is None:
+                raise serializers.ValidationError({nome: 'Use o formato AAAA-MM-DD.'})
+        return calcular_kpis_professores(professor_ids, **datas)
 
-        return {
-            'total_realizadas': realizadas_normal + realizadas_ac,
-            'total_agendadas': aulas_relacionadas.filter(status='Agendada', professores=professor).count(),
-            'total_canceladas': aulas_relacionadas.filter(status='Cancelada', professores=professor).count(),
-            'total_substituicoes_feitas': total_substituicoes_feitas,
-            'total_substituicoes_sofridas': total_substituicoes_sofridas,
-        }
\ No newline at end of file
+    def get_kpis(self, professor):
+        """
+        Retorna os KPIs de performance baseados nas aulas do professor.
+        """
+        if professor.pk not in self.kpis_por_professor:
+            self.kpis_por_professor.update(self.calcular_kpis([professor.pk]))
+        return self.kpis_por_professor[professor.pk]
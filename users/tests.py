@@ -1,8 +1,10 @@
 import pytest
 from rest_framework import status
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from .models import CustomUser
-from scheduling.models import Aula, Aluno, Modalidade, RelatorioAula
+from scheduling.models import Aula, Aluno, Modalidade, PresencaProfessor, RelatorioAula
 
 
 # O marcador @pytest.mark.django_db garante que o banco de dados
@@ -102,3 +104,68 @@ def test_professor_detail_endpoint_returns_kpis(client):
     assert kpis['total_agendadas'] == 1 # aula2
     assert kpis['total_substituicoes_feitas'] == 1 # aula4
     assert kpis['total_substituicoes_sofridas'] == 1 # aula3
+
+
+@pytest.mark.django_db
+def test_professor_batch_fetch_matches_detail_kpis(client, django_assert_max_num_queries):
+    """
+    Garante que a busca em lote (`?ids=`) calcula os mesmos KPIs do detalhe
+    com um número constante de queries.
+    """
+    admin_user = CustomUser.objects.create_user(username='admin', password='password123', tipo='admin')
+    prof1 = CustomUser.objects.create_user(username='prof1', password='password123', tipo='professor')
+    prof2 = CustomUser.objects.create_user(username='prof2', password='password123', tipo='professor')
+    token_url = reverse('users:token_obtain_pair')
+    token = client.post(token_url, {'username': 'admin', 'password': 'password123'}).data['access']
+
+    modalidade = Modalidade.objects.create(nome="Aula Normal")
+    modalidade_ac = Modalidade.objects.create(nome="Atividade Complementar")
+    aula1 = Aula.objects.create(modalidade=modalidade, data_hora="2025-01-01T10:00:00Z", status="Realizada")
+    aula1.professores.set([prof1])
+    RelatorioAula.objects.create(aula=aula1, professor_que_validou=prof2)
+    aula2 = Aula.objects.create(modalidade=modalidade, data_hora="2025-01-02T10:00:00Z", status="Cancelada")
+    aula2.professores.set([prof1, prof2])
+    aula3 = Aula.objects.create(modalidade=modalidade_ac, data_hora="2025-01-03T10:00:00Z", status="Realizada")
+    aula3.professores.set([prof1, prof2])
+    PresencaProfessor.objects.create(aula=aula3, professor=prof1, status='presente')
+    PresencaProfessor.objects.create(aula=aula3, professor=prof2, status='ausente')
+
+    detalhes = {}
+    for prof in (prof1, prof2):
+        url = reverse('users:professor-detail', kwargs={'pk': prof.pk})
+        detalhes[prof.pk] = client.get(url, HTTP_AUTHORIZATION=f'Bearer {token}').data['kpis']
+
+    url = reverse('users:professor-list')
+    # autenticação + professores + 3 queries de KPIs
+    with django_assert_max_num_queries(5):
+        response = client.get(f"{url}?ids={prof1.pk},{prof2.pk}", HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert response.status_code == status.HTTP_200_OK
+    assert {item['id']: item['kpis'] for item in response.data} == detalhes
+    assert detalhes[prof1.pk]['total_realizadas'] == 1
+    assert detalhes[prof1.pk]['total_substituicoes_sofridas'] == 2
+    assert detalhes[prof2.pk]['total_substituicoes_feitas'] == 1
+
+
+@pytest.mark.django_db
+def test_kpis_de_professores_por_periodo_usam_intervalo_de_data_hora(client):
+    """
+    Garante que o filtro de período dos KPIs compara `data_hora` com um
+    intervalo (sem converter cada linha em data) e agrega no banco.
+    """
+    CustomUser.objects.create_user(username='admin', password='password123', tipo='admin')
+    prof = CustomUser.objects.create_user(username='prof1', password='password123', tipo='professor')
+    token = client.post(reverse('users:token_obtain_pair'), {'username': 'admin', 'password': 'password123'}).data['access']
+    modalidade = Modalidade.objects.create(nome="Aula Normal")
+    for dia in (1, 15, 31):
+        aula = Aula.objects.create(modalidade=modalidade, data_hora=f"2025-01-{dia:02d}T10:00:00Z", status="Agendada")
+        aula.professores.set([prof])
+
+    url = reverse('users:professor-detail', kwargs={'pk': prof.pk})
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get(f"{url}?data_inicial=2025-01-15&data_final=2025-01-31",
+                              HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert response.data['kpis']['total_agendadas'] == 2
+    assert not any('cast_date' in q['sql'] for q in queries.captured_queries)
+
+    response = client.get(f"{url}?data_inicial=2025-02-30", HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
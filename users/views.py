@@ -1,5 +1,8 @@
 from rest_framework import generics, permissions, status, viewsets
 from rest_framework.response import Response
+from scheduling.fast_serializers import FastListMixin
+from scheduling.mixins import BatchRetrieveMixin, SparseFieldsetMixin
+from .fast_serializers import UserValuesSerializer
 from .models import CustomUser
 from .serializers import UserRegistrationSerializer, UserSerializer, ProfessorDetailSerializer
 
@@ -25,20 +28,24 @@ class UserRegistrationView(generics.CreateAPIView):
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class ProfessorViewSet(viewsets.ReadOnlyModelViewSet):
+class ProfessorViewSet(SparseFieldsetMixin, BatchRetrieveMixin, FastListMixin, viewsets.ReadOnlyModelViewSet):
     """
     Endpoint de API que permite que professores sejam listados e visualizados.
     'ReadOnly' significa que não permite criação ou edição por aqui.
+    A listagem é servida da memória enquanto a tabela de usuários não muda.
     """
     # O queryset base são todos os usuários que são professores ou admins
     queryset = CustomUser.objects.filter(tipo__in=['professor', 'admin']).order_by('username')
     permission_classes = [permissions.IsAuthenticated]
+    fast_serializer_class = UserValuesSerializer
+    tabelas_em_memoria = ['users.customuser']
+    expandable_fields = {'kpis': ()}
 
     def get_serializer_class(self):
         """
-        Usa o serializer de detalhe na ação 'retrieve' (ver um professor)
-        e o serializer simples na ação 'list' (listar todos os professores).
+        Usa o serializer de detalhe na ação 'retrieve' (ver um professor) e na
+        busca em lote (`?ids=1,2,3`), e o serializer simples na ação 'list'.
         """
-        if self.action == 'retrieve':
+        if self.action == 'retrieve' or self.is_batch_request:
             return ProfessorDetailSerializer
         return UserSerializer